@@ -0,0 +1,319 @@
+"""
+Reprocess archived capture files without the GUI or the board.
+
+Every file goes through process_data_file -> time_lag_cross_correlation,
+spread over a process pool; the flowrates of all files are then computed in
+one vectorised physics call, and one CSV row is written per file in input
+order. A file that fails, even one that kills its worker process, gets a
+row with its error instead of stopping the run.
+
+Usage:
+    python batch.py "captures/*.txt" [more patterns] --pipe-inner 0.0254 --speed-sound-medium 1480
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from new_txt_read import process_data_file, calculate_average_time_of_flight
+from new_tof_and_cross_corr import time_lag_cross_correlation
+from physics import compute_flow, fahrenheit_to_celsius, speed_of_sound_water
+from echo_gate import EchoGate
+from results_store import ResultsStore
+from rolling_stats import FlowrateStatistics
+
+RESULT_FIELDS = ["file", "time_lag", "flowrate", "speed_sound", "temperature", "time_of_flight", "samples",
+                 "seconds", "error"]
+ROLLING_FIELDS = ["outlier", "ema", "window_mean", "window_std", "median", "mad"]
+
+
+def _empty_row(file_path, error=""):
+    row = dict.fromkeys(RESULT_FIELDS, "")
+    row["file"] = file_path
+    row["error"] = error
+    return row
+
+
+def _needs_time_of_flight(settings):
+    return settings["speed_sound_medium"] == 0 and not settings.get("speed_from_temperature")
+
+
+def process_file(file_path, settings):
+    """
+    One result row for one capture file, without the flowrate, which
+    add_flow_columns fills in for all rows at once. Never raises; errors end
+    up in the 'error' column.
+
+    Args:
+        file_path (str): Capture file in the nios2-terminal text format.
+        settings (dict): trigger_phrase, inv and the calculate_flowrate inputs
+            (pipe_dia_inner, pipe_dia_outer, speed_sound_pipe, speed_sound_medium),
+            plus speed_from_temperature to look the speed of sound up from the
+            capture's temperature instead and an optional EchoGate as gate.
+    """
+    row = _empty_row(file_path)
+    start = time.perf_counter()
+    try:
+        downstream_df, upstream_df, temperature, _ = process_data_file(
+            file_path, settings["trigger_phrase"], inv=settings["inv"], render=False,
+            gate=settings.get("gate")
+        )
+        time_lag, _ = time_lag_cross_correlation(upstream_df, downstream_df, render=False)
+        row["time_lag"] = time_lag
+        row["temperature"] = temperature
+        row["samples"] = len(upstream_df)
+        if _needs_time_of_flight(settings):
+            row["time_of_flight"] = calculate_average_time_of_flight(downstream_df, upstream_df)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = time.perf_counter() - start
+    return row
+
+
+def process_chunk(file_paths, settings):
+    """Rows for a list of files; one pool task per chunk keeps the dispatch overhead down."""
+    return [process_file(file_path, settings) for file_path in file_paths]
+
+
+def expand_patterns(patterns):
+    """Sorted, de-duplicated files matching any of the glob patterns."""
+    files = set()
+    for pattern in patterns:
+        files.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(files)
+
+
+def default_chunksize(file_count, workers):
+    """About four chunks per worker so the pool stays balanced, at most 32 files each."""
+    return max(1, min(32, file_count // (4 * workers)))
+
+
+def _run_pool(tasks, file_paths, settings, workers, finish):
+    """
+    Run tasks (lists of indices into file_paths) on a new pool with at most
+    workers of them in flight, calling finish(task, rows) as each one ends.
+
+    Returns:
+        tuple: (crashed, unstarted). If a worker died the pool is broken and
+        every task in flight fails with it: those are crashed, and the tasks
+        that had not been submitted yet are unstarted. Both are empty when
+        the pool did not break.
+    """
+    waiting = deque(tasks)
+    running = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while waiting or running:
+            while waiting and len(running) < workers:  # Nothing queued ahead, so a crash only takes these down
+                task = waiting.popleft()
+                running[executor.submit(process_chunk, [file_paths[i] for i in task], settings)] = task
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            crashed = []
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    finish(task, future.result())
+                except BrokenProcessPool:
+                    crashed.append(task)
+                except Exception as e:  # E.g. the settings could not be sent to the worker
+                    finish(task, [_empty_row(file_paths[i], f"Worker failed: {e}") for i in task])
+            if crashed:
+                return crashed + list(running.values()), list(waiting)
+    return [], []
+
+
+def run_batch(file_paths, settings, workers=None, chunksize=None, progress=None):
+    """
+    Process file_paths and return their rows in the same order.
+
+    A file that kills its worker process (e.g. a crash in native code) only
+    fails itself: the chunks that were in flight when the pool broke are
+    retried one file at a time on a single worker, and the chunks that had
+    not started go to a new pool.
+
+    Args:
+        file_paths (list): Capture files.
+        settings (dict): See process_file.
+        workers (int): Worker processes; None for one per CPU. With 1 the files
+            are processed in this process.
+        chunksize (int): Files per pool task; None picks default_chunksize.
+        progress: Called as progress(done, total) after each chunk.
+
+    Returns:
+        list: One dict per file with the RESULT_FIELDS keys.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = chunksize or default_chunksize(len(file_paths), workers)
+    tasks = [list(range(i, min(i + chunksize, len(file_paths)))) for i in range(0, len(file_paths), chunksize)]
+    rows = [None] * len(file_paths)
+    done = 0
+
+    def finish(task, task_rows):
+        nonlocal done
+        for i, row in zip(task, task_rows):
+            rows[i] = row
+        done += len(task)
+        if progress:
+            progress(done, len(file_paths))
+
+    if workers == 1:
+        for task in tasks:
+            finish(task, process_chunk([file_paths[i] for i in task], settings))
+    else:
+        while tasks:
+            crashed, tasks = _run_pool(tasks, file_paths, settings, workers, finish)
+            suspects = [[i] for task in crashed for i in task]
+            while suspects:  # One file at a time, so the pool only breaks on the file that crashes it
+                crashed, suspects = _run_pool(suspects, file_paths, settings, 1, finish)
+                for task in crashed:
+                    finish(task, [_empty_row(file_paths[task[0]], "Worker failed: the worker process died")])
+
+    add_flow_columns(rows, settings)
+    return rows
+
+
+def _column(rows, field):
+    return np.array([np.nan if row[field] in ("", None) else row[field] for row in rows], dtype=np.float64)
+
+
+def add_flow_columns(rows, settings):
+    """
+    Fill in flowrate and speed_sound for every row that succeeded with one
+    vectorised compute_flow call instead of one calculate_flowrate per file.
+    With speed_from_temperature a row whose temperature is missing or outside
+    the speed of sound table gets an error instead.
+    """
+    rows = [row for row in rows if not row["error"]]
+    if not rows:
+        return
+    speed_sound_medium = settings["speed_sound_medium"]
+    if settings.get("speed_from_temperature"):
+        celsius = fahrenheit_to_celsius(_column(rows, "temperature"))
+        valid = (celsius >= 0) & (celsius <= 100)
+        for row in (row for row, ok in zip(rows, valid) if not ok):
+            row["error"] = f"ValueError: no speed of sound for temperature {row['temperature']}"
+        rows = [row for row, ok in zip(rows, valid) if ok]
+        speed_sound_medium = speed_of_sound_water(celsius[valid])
+    flowrates, speed_sounds = compute_flow(
+        _column(rows, "time_lag"), settings["pipe_dia_inner"], _column(rows, "time_of_flight"),
+        settings["pipe_dia_outer"], settings["speed_sound_pipe"], speed_sound_medium
+    )
+    for row, flowrate, speed_sound in zip(rows, flowrates.tolist(), speed_sounds.tolist()):
+        row["flowrate"] = flowrate
+        row["speed_sound"] = speed_sound
+
+
+def add_rolling_statistics(rows, stats=None):
+    """
+    Fill in the ROLLING_FIELDS of each row in order: whether the flowrate was
+    rejected as an outlier and the moving averages after it. One O(1) update
+    per file, in the same way the GUI tracks a live run.
+
+    Args:
+        rows (list): Rows from run_batch, in measurement order.
+        stats (FlowrateStatistics): Statistics to continue; a new one if None.
+
+    Returns:
+        FlowrateStatistics: The statistics after the last row.
+    """
+    stats = stats or FlowrateStatistics()
+    for row in rows:
+        if row["error"]:
+            row.update(dict.fromkeys(ROLLING_FIELDS, ""))
+            continue
+        row["outlier"] = int(not stats.add(row["flowrate"]))
+        snapshot = stats.snapshot()
+        for field in ROLLING_FIELDS[1:]:
+            row[field] = snapshot[field]
+    return stats
+
+
+def write_results(rows, output):
+    """Write rows as CSV to output, a path or '-' for stdout."""
+    f = sys.stdout if output == "-" else open(output, 'w', newline='')
+    try:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS + ROLLING_FIELDS, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def store_results(rows, directory):
+    """Append the rows that succeeded to the ResultsStore in directory, stamped with the time of this run."""
+    store = ResultsStore(directory)
+    try:
+        for row in rows:
+            if not row["error"]:
+                store.append(row["flowrate"], row["time_lag"], row["temperature"], row["speed_sound"], row["file"])
+    finally:
+        store.close()
+
+
+def progress_printer():
+    """A progress callback for run_batch that keeps one status line on stderr."""
+    start = time.perf_counter()
+
+    def report(done, total):
+        rate = done / max(time.perf_counter() - start, 1e-9)
+        end = "\n" if done == total else ""
+        print(f"\r{done}/{total} files ({rate:.1f} files/s)", end=end, file=sys.stderr, flush=True)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("patterns", nargs="+", help="capture files or glob patterns (** is recursive)")
+    parser.add_argument("-o", "--output", default="results.csv", help="CSV file to write, or - for stdout")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--store", default=None, help="also append the results to this ResultsStore directory")
+    parser.add_argument("--chunksize", type=int, default=None, help="files per pool task")
+    parser.add_argument("--trigger-phrase", default="== IT'S ALIVE ==")
+    parser.add_argument("--inv", type=int, default=0, help="swap upstream and downstream")
+    parser.add_argument("--pipe-inner", type=float, required=True, help="pipe inner diameter (m)")
+    parser.add_argument("--pipe-outer", type=float, default=0, help="pipe outer diameter (m)")
+    parser.add_argument("--speed-sound-pipe", type=float, default=0, help="speed of sound in the pipe (m/s)")
+    parser.add_argument("--speed-sound-medium", type=float, default=0,
+                        help="speed of sound in the medium (m/s); 0 estimates it from the time of flight")
+    parser.add_argument("--speed-from-temperature", action="store_true",
+                        help="look the speed of sound in water up from each capture's temperature")
+    parser.add_argument("--gate", action="store_true", help="crop every capture to its echo before filtering")
+    parser.add_argument("--gate-pad", type=int, default=512, help="samples kept either side of the echo")
+    args = parser.parse_args()
+
+    file_paths = expand_patterns(args.patterns)
+    if not file_paths:
+        parser.error("no capture files match")
+    settings = {
+        "trigger_phrase": args.trigger_phrase,
+        "inv": args.inv,
+        "pipe_dia_inner": args.pipe_inner,
+        "pipe_dia_outer": args.pipe_outer,
+        "speed_sound_pipe": args.speed_sound_pipe,
+        "speed_sound_medium": args.speed_sound_medium,
+        "speed_from_temperature": args.speed_from_temperature,
+        "gate": EchoGate(pad=args.gate_pad) if args.gate else None,
+    }
+
+    rows = run_batch(file_paths, settings, args.workers, args.chunksize, progress_printer())
+    stats = add_rolling_statistics(rows)
+    write_results(rows, args.output)
+    if args.store:
+        store_results(rows, args.store)
+    failed = sum(1 for row in rows if row["error"])
+    print(f"{len(rows) - failed} processed, {failed} failed -> {args.output}", file=sys.stderr)
+    summary = stats.snapshot()
+    print(f"mean flowrate {summary['mean']:.4f} ± {summary['std']:.4f}, median {summary['median']:.4f}, "
+          f"{summary['outliers']} outliers", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
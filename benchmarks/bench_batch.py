@@ -0,0 +1,76 @@
+"""
+Scaling of the batch reprocessing CLI with the number of worker processes
+(1, 2, 4 and one per CPU) over copies of a two-channel capture, and a batch
+in which one file kills its worker process and only that file fails.
+
+Usage:
+    python benchmarks/bench_batch.py [files] [chunksize]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from batch import run_batch  # noqa: E402
+from capture_fixtures import example_two_channel, synthetic_capture, TRIGGER_PHRASE  # noqa: E402
+
+SETTINGS = {
+    "trigger_phrase": TRIGGER_PHRASE,
+    "inv": 0,
+    "pipe_dia_inner": 0.0254,
+    "pipe_dia_outer": 0.0334,
+    "speed_sound_pipe": 2300.0,
+    "speed_sound_medium": 1480.0,
+}
+
+
+class CrashingGate:
+    """A gate that exits the worker process on captures with crash_samples samples, like a native crash."""
+
+    def __init__(self, crash_samples):
+        self.crash_samples = crash_samples
+
+    def crop(self, upstream, downstream):
+        if len(upstream) == self.crash_samples:
+            os._exit(1)
+        return upstream, downstream
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    chunksize = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = example_two_channel(directory=directory)
+        file_paths = []
+        for i in range(file_count):
+            file_path = os.path.join(directory, f"capture_{i:05d}.txt")
+            shutil.copyfile(source, file_path)
+            file_paths.append(file_path)
+
+        cpus = os.cpu_count() or 1
+        print(f"{file_count} files, {cpus} CPUs")
+        baseline = None
+        for workers in sorted({1, 2, 4, cpus}):
+            start = time.perf_counter()
+            rows = run_batch(file_paths, SETTINGS, workers, chunksize)
+            elapsed = time.perf_counter() - start
+            assert not any(row["error"] for row in rows)
+            baseline = baseline or elapsed
+            print(f"{workers:3d} workers: {file_count / elapsed:7.1f} files/s  speedup {baseline / elapsed:4.2f}x")
+
+        # A 4096-sample capture in the middle of the batch takes its worker down
+        crash_file = synthetic_capture(4096, directory=directory)
+        mixed = file_paths[:8] + [crash_file] + file_paths[8:16]
+        start = time.perf_counter()
+        rows = run_batch(mixed, dict(SETTINGS, gate=CrashingGate(4096 - 25)), max(2, min(4, cpus)), 2)
+        failed = [row["file"] for row in rows if row["error"]]
+        print(f"crashing worker: {len(failed)} of {len(rows)} files failed in {time.perf_counter() - start:.2f} s")
+        assert failed == [crash_file] and [row["file"] for row in rows] == mixed
+        assert "worker process died" in rows[8]["error"], rows[8]["error"]
+
+
+if __name__ == "__main__":
+    main()
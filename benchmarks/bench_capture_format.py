@@ -0,0 +1,88 @@
+"""
+Text captures versus the binary .cap format: file size, load time, the
+filtered waveforms of process_data_file, and a round trip through the
+converter that must reproduce the parsed arrays and the waveforms exactly.
+A .cap file is analysed straight from its memory map, so the raw voltages
+of its waveforms stay int16 views onto the file.
+
+Usage:
+    python benchmarks/bench_capture_format.py [capture_file] [repeats]
+"""
+import mmap
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import parse_capture_file, process_data_file  # noqa: E402
+from capture_format import BinaryCapture, convert_text_capture, load_capture_binary  # noqa: E402
+from capture_fixtures import EXAMPLE_FILE, TRIGGER_PHRASE, example_two_channel  # noqa: E402
+
+
+def best_time(func, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def memory_mapped(array):
+    """True if array is a view onto a memory-mapped file."""
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def check_round_trip(text_path, binary_path):
+    convert_text_capture(text_path, binary_path, TRIGGER_PHRASE)
+    expected = parse_capture_file(text_path, TRIGGER_PHRASE)
+    loaded = load_capture_binary(binary_path)
+    for a, b in zip(expected[:2], loaded[:2]):
+        assert a.shape == b.shape and np.array_equal(a, b)
+    assert expected[2] == loaded[2]
+
+    text_result = process_data_file(text_path, TRIGGER_PHRASE, render=False)
+    binary_result = process_data_file(binary_path, TRIGGER_PHRASE, render=False)
+    for a, b in zip(text_result[:2], binary_result[:2]):
+        assert np.array_equal(a.voltage, b.voltage) and np.array_equal(a.time, b.time)
+        assert np.allclose(a.filtered, b.filtered, rtol=0, atol=1e-9)
+        assert b.voltage.dtype == np.int16 and (len(b) == 0 or memory_mapped(b.voltage))
+    assert text_result[2] == binary_result[2]
+
+
+def main():
+    text_path = sys.argv[1] if len(sys.argv) > 1 else example_two_channel()
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as directory:
+        check_round_trip(EXAMPLE_FILE, os.path.join(directory, "example.cap"))
+        binary_path = os.path.join(directory, "capture.cap")
+        check_round_trip(text_path, binary_path)
+        print("round trip: OK")
+
+        text_size = os.path.getsize(text_path)
+        binary_size = os.path.getsize(binary_path)
+        print(f"text:   {text_size:9d} bytes")
+        print(f"binary: {binary_size:9d} bytes ({text_size / binary_size:.1f}x smaller)")
+
+        parse = best_time(lambda: parse_capture_file(text_path, TRIGGER_PHRASE), repeats)
+        load = best_time(lambda: load_capture_binary(binary_path), repeats)
+        mapped = best_time(lambda: BinaryCapture(binary_path).upstream.sum(), repeats)
+        process_text = best_time(lambda: process_data_file(text_path, TRIGGER_PHRASE, render=False), repeats)
+        process_binary = best_time(lambda: process_data_file(binary_path, TRIGGER_PHRASE, render=False), repeats)
+        print(f"parse text:        {parse * 1e3:8.2f} ms")
+        print(f"load binary frame: {load * 1e3:8.2f} ms ({parse / load:.0f}x)")
+        print(f"memmap + sum:      {mapped * 1e3:8.2f} ms")
+        print(f"process text:      {process_text * 1e3:8.2f} ms")
+        print(f"process binary:    {process_binary * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
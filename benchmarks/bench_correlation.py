@@ -0,0 +1,69 @@
+"""
+Sweep the cross-correlation backends over signal lengths from 1k to 1M samples.
+
+The direct O(N^2) method is only timed up to --direct-limit samples; above
+that the FFT result is checked against the windowed search instead.
+
+Usage:
+    python benchmarks/bench_correlation.py [--max-lag 50] [--direct-limit 65536]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_tof_and_cross_corr import correlation_peak  # noqa: E402
+
+SIZES = [1024, 4096, 16384, 65536, 262144, 1048576]
+TRUE_LAG = 11  # samples, about 2.2e-7 s at 50 MHz
+
+
+def synthetic_pair(n, lag, rng):
+    """Two noisy copies of a windowed tone burst, the second delayed by lag samples."""
+    t = np.arange(n)
+    centre = n // 3
+    burst = np.exp(-((t - centre) / 40.0) ** 2) * np.sin(2 * np.pi * t / 25)
+    us = burst + 0.05 * rng.standard_normal(n)
+    ds = np.roll(burst, lag) + 0.05 * rng.standard_normal(n)
+    return us, ds
+
+
+def timed(func, repeats=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-correlation backend sweep")
+    parser.add_argument("--max-lag", type=int, default=50)
+    parser.add_argument("--direct-limit", type=int, default=65536)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>9} {'direct ms':>10} {'fft ms':>10} {'windowed ms':>12}  lag")
+    for n in SIZES:
+        us, ds = synthetic_pair(n, TRUE_LAG, rng)
+
+        fft_time, (fft_lag, _, _) = timed(lambda: correlation_peak(us, ds, "fft"))
+        win_time, (win_lag, _, _) = timed(lambda: correlation_peak(us, ds, "windowed", args.max_lag))
+        if n <= args.direct_limit:
+            direct_time, (direct_lag, _, _) = timed(lambda: correlation_peak(us, ds, "direct"), repeats=1)
+            assert direct_lag == fft_lag, (n, direct_lag, fft_lag)
+            direct_text = f"{direct_time * 1e3:10.2f}"
+        else:
+            direct_text = f"{'skipped':>10}"
+        assert win_lag == fft_lag, (n, win_lag, fft_lag)
+
+        print(f"{n:>9} {direct_text} {fft_time * 1e3:10.2f} {win_time * 1e3:12.2f}  {fft_lag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-shot DSP (filter, correlate, time of flight) on the full 16k-sample record
+versus the record cropped by EchoGate to the echo window, on a synthetic
+capture with a known lag. The filter and correlation kernels are also timed
+on their own, without the DataFrame handling around them. Also checks that example.txt, which has no distinct
+echo, falls back to the full record.
+
+Usage:
+    python benchmarks/bench_echo_gate.py [repeats]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import (parse_capture_file, process_capture_data, calculate_average_time_of_flight,  # noqa: E402
+                          filter_channels)
+from new_tof_and_cross_corr import cross_correlation_data, correlation_peak  # noqa: E402
+from echo_gate import EchoGate  # noqa: E402
+from capture_fixtures import echo_capture, EXAMPLE_FILE, TRIGGER_PHRASE  # noqa: E402
+
+LAG_SAMPLES = 11
+FS = 50e6
+
+
+def shot_dsp(frame, gate):
+    downstream, upstream, _, _ = process_capture_data(*frame, render=False, gate=gate)
+    time_lag, _, _ = cross_correlation_data(upstream, downstream)
+    return time_lag, calculate_average_time_of_flight(downstream, upstream), len(upstream)
+
+
+def kernels(upstream, downstream):
+    filtered = filter_channels([upstream, downstream], 1000000, FS)
+    return correlation_peak(filtered[0], filtered[1], "fft")
+
+
+def best_time(func, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    gate = EchoGate()
+    upstream, _, temperature = parse_capture_file(EXAMPLE_FILE, TRIGGER_PHRASE)
+    assert gate.window(upstream[25:, 1]) is None, "example.txt should fall back to the full record"
+
+    frame = parse_capture_file(echo_capture(LAG_SAMPLES), TRIGGER_PHRASE)
+    full_lag, full_tof, full_samples = shot_dsp(frame, None)
+    gated_lag, gated_tof, gated_samples = shot_dsp(frame, gate)
+    assert abs(full_lag - gated_lag) < 0.5 / FS, (full_lag, gated_lag)
+    assert abs(full_tof - gated_tof) < 2 / FS, (full_tof, gated_tof)
+
+    upstream, downstream = frame[0][25:, 1], frame[1][25:, 1]
+    start, stop = window = gate.window(upstream, downstream)
+    detect = best_time(lambda: gate.window(upstream, downstream), repeats)
+    full_kernels = best_time(lambda: kernels(upstream, downstream), repeats)
+    gated_kernels = best_time(lambda: kernels(upstream[start:stop], downstream[start:stop]), repeats)
+    full = best_time(lambda: shot_dsp(frame, None), repeats)
+    gated = best_time(lambda: shot_dsp(frame, gate), repeats)
+
+    print(f"echo window {window}: {gated_samples} of {full_samples} samples")
+    print(f"lag full {full_lag * 1e9:.1f} ns, gated {gated_lag * 1e9:.1f} ns "
+          f"(true {-LAG_SAMPLES / FS * 1e9:.1f} ns)")
+    print(f"echo detection:            {detect * 1e3:7.3f} ms")
+    print(f"filter + correlate, full:  {full_kernels * 1e3:7.3f} ms")
+    print(f"filter + correlate, gated: {gated_kernels * 1e3:7.3f} ms ({full_kernels / gated_kernels:.1f}x)")
+    print(f"whole shot, full:          {full * 1e3:7.3f} ms")
+    print(f"whole shot, gated:         {gated * 1e3:7.3f} ms ({full / gated:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+End-to-end throughput of the measurement pipeline against a simulated board,
+with no hardware: shots per second and per-stage latency when the frames come
+straight from a SimulatedDevice, and when they go the whole way through a
+NiosSession reading the simulator's terminal output from a pipe. The lag
+recovered from every shot is checked against the injected delay.
+
+Usage:
+    python benchmarks/bench_end_to_end.py [shots] [capture_time] [noise]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import calculate_flowrate  # noqa: E402
+from nios_terminal import NiosSession  # noqa: E402
+from pipeline import ShotPipeline  # noqa: E402
+from simulator import SimulatedDevice  # noqa: E402
+from echo_gate import EchoGate  # noqa: E402
+
+FS = 50e6
+DELAY = 11 / FS
+
+
+def flow(shot):
+    flowrate, shot.speed_sound = calculate_flowrate(shot.downstream, shot.upstream, shot.time_lag, 0.0254,
+                                                    speed_sound_medium=1480)
+    return flowrate
+
+
+def run(source, gate=None):
+    lags = []
+    pipeline = ShotPipeline(source, flow, lambda shot: lags.append(shot.time_lag), gate=gate)
+    start = time.perf_counter()
+    pipeline.start()
+    pipeline.wait()
+    return time.perf_counter() - start, lags, pipeline.summary()
+
+
+def report(title, elapsed, lags, summary):
+    assert all(abs(lag + DELAY) < 0.5 / FS for lag in lags), lags
+    print(f"{title}: {len(lags)} shots, {len(lags) / elapsed:6.2f} shots/s")
+    print(f"  {'stage':<10} {'mean ms':>8} {'max ms':>8} {'latency ms':>11} {'busy':>6}")
+    for name, stats in summary.items():
+        print(f"  {name:<10} {stats['mean_time'] * 1e3:8.2f} {stats['max_time'] * 1e3:8.2f} "
+              f"{stats['mean_latency'] * 1e3:11.2f} {stats['utilization']:6.0%}")
+
+
+def main():
+    shots = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    capture_time = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    noise = float(sys.argv[3]) if len(sys.argv) > 3 else 25.0
+
+    def device():
+        return SimulatedDevice(DELAY, noise, capture_time=capture_time, frames=shots)
+
+    # Generate the frames up front so the in-process runs only time the capture wait and the pipeline
+    frames = [device().frame_lines(i) for i in range(shots)]
+
+    def prepared():
+        remaining = iter(frames)
+
+        def source():
+            if capture_time:
+                time.sleep(capture_time)
+            return next(remaining, None)
+        return source
+
+    print(f"injected delay {DELAY * 1e9:.0f} ns, noise {noise} counts, {capture_time * 1e3:.0f} ms capture")
+    report("in-process", *run(prepared()))
+    report("in-process, echo gate", *run(prepared(), EchoGate()))
+
+    simulated = device()
+    with NiosSession("simulator", "simulated.elf", popen=simulated.popen, frame_timeout=30) as session:
+        remaining = [shots]
+
+        def source():
+            if remaining[0] == 0:
+                return None
+            remaining[0] -= 1
+            return session.read_raw_frame()
+
+        report("through NiosSession", *run(source, EchoGate()))
+
+
+if __name__ == "__main__":
+    main()
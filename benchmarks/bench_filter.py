@@ -0,0 +1,67 @@
+"""
+Compare the cached second-order-section filter bank with the original
+per-call butter + filtfilt design, for accuracy and speed.
+
+Usage:
+    python benchmarks/bench_filter.py [capture_file] [repeats]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.signal import butter, filtfilt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import parse_capture_file, filter_channels  # noqa: E402
+
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+CUTOFF = 1000000
+SAMPLING_RATE = 50e6
+
+
+def reference_filter(data, cutoff, fs, order=5):
+    """The filter exactly as process_data_file used to apply it."""
+    nyquist = 0.5 * fs
+    b, a = butter(order, cutoff / nyquist, btype='low', analog=False)
+    return filtfilt(b, a, data)
+
+
+def best_time(func, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    default_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example.txt")
+    file_path = sys.argv[1] if len(sys.argv) > 1 else default_file
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    upstream, downstream, _ = parse_capture_file(file_path, TRIGGER_PHRASE)
+    channels = [upstream[25:, 1], downstream[25:, 1]]
+    if len(channels[1]) == 0:
+        # example.txt only has the upstream channel; filter it twice
+        channels[1] = channels[0].copy()
+
+    # Regression: the SOS form must reproduce the old (b, a) output
+    expected = [reference_filter(channel, CUTOFF, SAMPLING_RATE) for channel in channels]
+    filtered = filter_channels(channels, CUTOFF, SAMPLING_RATE)
+    for want, got in zip(expected, filtered):
+        error = np.max(np.abs(want - got)) / np.max(np.abs(want))
+        assert error < 1e-8, f"relative error {error:.2e}"
+        print(f"max relative difference to filtfilt(b, a): {error:.2e}")
+
+    old_time = best_time(lambda: [reference_filter(c, CUTOFF, SAMPLING_RATE) for c in channels], repeats)
+    new_time = best_time(lambda: filter_channels(channels, CUTOFF, SAMPLING_RATE), repeats)
+    causal_time = best_time(lambda: filter_channels(channels, CUTOFF, SAMPLING_RATE, causal=True), repeats)
+    print(f"butter + filtfilt per channel: {old_time * 1e3:8.2f} ms")
+    print(f"cached sosfiltfilt, batched:   {new_time * 1e3:8.2f} ms")
+    print(f"cached sosfilt (causal):       {causal_time * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
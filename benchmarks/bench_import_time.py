@@ -0,0 +1,84 @@
+"""
+Cold-start cost of the entry points, from python -X importtime in a fresh
+interpreter, and which heavy dependencies each of them loads at import.
+
+The GUI and the batch workers must not import pandas, scipy, matplotlib, PIL
+or psutil at module load; those are imported on first use. new_main.py opens
+its window when imported, so its own top-level imports are measured instead.
+"DSP on first use" shows what the first filtered shot still pays for.
+
+test_hot_paths.py benchmarks the same entry points, so regressions show up
+in its saved baselines.
+
+Usage:
+    python benchmarks/bench_import_time.py [repeats] [top]
+"""
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY_MODULES = ("pandas", "scipy", "matplotlib", "PIL", "psutil")
+
+
+def entry_imports(file_path):
+    """The module-level import statements of a script, as one line of code."""
+    with open(file_path, 'r', encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "; ".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+# (name, statement, must stay free of HEAVY_MODULES)
+ENTRY_POINTS = [
+    ("new_main (GUI)", entry_imports(os.path.join(ROOT, "new_main.py")), True),
+    ("batch worker", "import batch", True),
+    ("devices", "import devices", True),
+    ("DSP kernels", "import new_txt_read, new_tof_and_cross_corr, physics, multishot", True),
+    ("DSP on first use", "import new_txt_read; new_txt_read.preload()", False),
+]
+
+
+def import_time(statement):
+    """
+    Run statement in a fresh interpreter with -X importtime.
+
+    Returns:
+        tuple: (seconds, modules) with the total import time and a list of
+        (module, depth, self_seconds, cumulative_seconds) in import order.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), depth, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return sum(module[2] for module in modules), modules
+
+
+def heavy_modules(modules):
+    """HEAVY_MODULES that were imported, as top-level package names."""
+    loaded = {name.split(".")[0] for name, _, _, _ in modules}
+    return sorted(loaded.intersection(HEAVY_MODULES))
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for name, statement, light in ENTRY_POINTS:
+        runs = [import_time(statement) for _ in range(repeats)]
+        seconds, modules = min(runs, key=lambda run: run[0])
+        heavy = heavy_modules(modules)
+        print(f"{name:<18} {seconds * 1e3:8.1f} ms, {len(modules)} modules, heavy: {', '.join(heavy) or 'none'}")
+        for module, _, _, cumulative in sorted((m for m in modules if m[1] == 0), key=lambda m: -m[3])[:top]:
+            print(f"    {module:<40} {cumulative * 1e3:8.1f} ms")
+        if light:
+            assert not heavy, f"{name} imports {', '.join(heavy)} at startup"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Per-frame cost of showing a shot in the GUI: rendering PNGs and decoding
+them into Tk images (the old path) versus updating the persistent
+live_plot panels in place. Needs a display for the Tk window.
+
+Usage:
+    python benchmarks/bench_live_plot.py [capture_file] [frames]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+import tkinter as tk
+
+import numpy as np
+from PIL import Image, ImageTk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import process_data_file, plot_waveforms  # noqa: E402
+from new_tof_and_cross_corr import cross_correlation_data, plot_cross_correlation, generate_flowrate_plot  # noqa: E402
+from live_plot import (WaveformPanel, CrossCorrelationPanel, FlowratePanel, prepare_waveforms,  # noqa: E402
+                       prepare_cross_correlation, prepare_flowrates)
+from results_store import ResultsStore  # noqa: E402
+from capture_fixtures import example_two_channel  # noqa: E402
+
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+
+
+def show_png(label, img_buffer):
+    img_tk = ImageTk.PhotoImage(Image.open(io.BytesIO(img_buffer.getvalue())))
+    label.config(image=img_tk)
+    label.image = img_tk
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else example_two_channel()
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    downstream, upstream, temperature, _ = process_data_file(file_path, TRIGGER_PHRASE, render=False)
+    time_lag, time_lags, cross_corr = cross_correlation_data(upstream, downstream)
+    rng = np.random.default_rng(0)
+    flowrates = list(rng.normal(1.0, 0.1, frames))
+
+    root = tk.Tk()
+    labels = [tk.Label(root) for _ in range(3)]
+    for label in labels:
+        label.pack()
+
+    png_times = []
+    for i in range(frames):
+        start = time.perf_counter()
+        show_png(labels[0], plot_waveforms(downstream, upstream))
+        show_png(labels[1], plot_cross_correlation(time_lags, cross_corr, time_lag))
+        show_png(labels[2], generate_flowrate_plot(flowrates[:i + 1]))
+        root.update()
+        png_times.append(time.perf_counter() - start)
+    for label in labels:
+        label.destroy()
+
+    panels = [WaveformPanel(root), CrossCorrelationPanel(root), FlowratePanel(root)]
+    for panel in panels:
+        panel.widget.pack()
+    root.update()
+
+    panel_times = []
+    prepare_times = []
+    store = ResultsStore(tempfile.mkdtemp())
+    for i in range(frames):
+        store.append(flowrates[i], time_lag, temperature)
+        start = time.perf_counter()
+        prepared = [
+            prepare_waveforms(downstream, upstream),
+            prepare_cross_correlation(time_lags, cross_corr, time_lag),
+            prepare_flowrates(store),
+        ]
+        prepare_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for panel, data in zip(panels, prepared):
+            panel.update(data)
+        root.update()
+        panel_times.append(time.perf_counter() - start)
+    root.destroy()
+
+    full_redraws = sum(panel.full_redraws for panel in panels)
+    print(f"PNG render + decode: {np.median(png_times) * 1e3:8.1f} ms per frame (median)")
+    print(f"Panel prepare:       {np.median(prepare_times) * 1e3:8.1f} ms per frame (plot worker)")
+    print(f"Panel update:        {np.median(panel_times) * 1e3:8.1f} ms per frame (Tk thread)")
+    print(f"Full redraws:        {full_redraws} of {3 * frames} panel updates")
+
+
+if __name__ == "__main__":
+    main()
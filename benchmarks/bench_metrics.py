@@ -0,0 +1,120 @@
+"""
+Cost of the metrics layer when disabled and enabled, accuracy of the
+histogram quantiles, and a stage breakdown (p50/p95/max) of simulated shots
+read through a NiosSession, exported as Prometheus text and JSON lines.
+
+Usage:
+    python benchmarks/bench_metrics.py [shots] [calls]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from metrics import Histogram, METRICS, timed, timer  # noqa: E402
+from nios_terminal import NiosSession  # noqa: E402
+from pipeline import ShotPipeline  # noqa: E402
+from simulator import SimulatedDevice  # noqa: E402
+from new_txt_read import calculate_flowrate  # noqa: E402
+
+
+def per_call(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def overhead(calls):
+    def plain():
+        pass
+
+    decorated = timed("bench")(plain)
+
+    def with_timer():
+        with timer("bench"):
+            pass
+
+    results = {}
+    for enabled in (False, True):
+        METRICS.enable(enabled)
+        results[enabled] = (per_call(decorated, calls), per_call(with_timer, calls))
+    METRICS.enable(False)
+    METRICS.reset()
+    return per_call(plain, calls), results
+
+
+def run_shots(shots):
+    device = SimulatedDevice(frames=shots)
+
+    def flow(shot):
+        flowrate, shot.speed_sound = calculate_flowrate(shot.downstream, shot.upstream, shot.time_lag, 0.0254,
+                                                        speed_sound_medium=1480)
+        return flowrate
+
+    with NiosSession("simulator", "simulated.elf", popen=device.popen, frame_timeout=30) as session:
+        remaining = [shots]
+
+        def source():
+            if remaining[0] == 0:
+                return None
+            remaining[0] -= 1
+            return session.read_raw_frame()
+
+        pipeline = ShotPipeline(source, flow, lambda shot: None)
+        pipeline.start()
+        pipeline.wait()
+
+
+def main():
+    shots = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+
+    plain, results = overhead(calls)
+    print(f"plain call:                  {plain * 1e9:7.0f} ns")
+    for enabled, (decorated, with_timer) in results.items():
+        state = "enabled " if enabled else "disabled"
+        print(f"{state}: decorator {decorated * 1e9:7.0f} ns, timer {with_timer * 1e9:7.0f} ns")
+
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(np.log(5e-3), 0.6, 100_000)
+    histogram = Histogram()
+    for value in samples:
+        histogram.observe(value)
+    for q in (0.5, 0.95):
+        error = histogram.quantile(q) / np.quantile(samples, q) - 1
+        assert abs(error) < 0.13, (q, error)  # Half a bucket is +/- 12%
+        print(f"p{q * 100:.0f} estimate error: {error:+.1%}")
+
+    METRICS.enable()
+    run_shots(shots)
+    METRICS.enable(False)
+    snapshot = METRICS.snapshot()
+    print()
+    print(f"{'stage':<10} {'count':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for stage, stats in snapshot.items():
+        print(f"{stage:<10} {stats['count']:5d} {stats['p50'] * 1e3:8.2f} {stats['p95'] * 1e3:8.2f} "
+              f"{stats['max'] * 1e3:8.2f}")
+    for stage in ("spawn", "download", "capture", "parse", "filter", "correlate", "flow"):
+        assert stage in snapshot, stage
+
+    with tempfile.TemporaryDirectory() as directory:
+        prom = os.path.join(directory, "stages.prom")
+        jsonl = os.path.join(directory, "stages.jsonl")
+        METRICS.export(prom)
+        METRICS.export(jsonl)
+        with open(prom) as f:
+            text = f.read()
+        assert f'flovis_stage_seconds_count{{stage="capture"}} {snapshot["capture"]["count"]}' in text
+        with open(jsonl) as f:
+            records = [json.loads(line) for line in f]
+        assert {record["stage"] for record in records} == set(snapshot)
+        print(f"\nexported {len(text.splitlines())} Prometheus lines and {len(records)} JSON lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+K noisy shots of the same capture: K separate process_capture_data +
+time_lag_cross_correlation calls versus one batched multishot_lag call, and
+the lag error of each way of combining the shots.
+
+Usage:
+    python benchmarks/bench_multishot.py [shots] [noise] [repeats]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import parse_capture_file, process_capture_data  # noqa: E402
+from new_tof_and_cross_corr import time_lag_cross_correlation  # noqa: E402
+from multishot import multishot_lag  # noqa: E402
+from capture_fixtures import example_two_channel, TRIGGER_PHRASE  # noqa: E402
+
+LAG_SAMPLES = 11
+FS = 50e6
+
+
+def noisy_frames(frame, shots, noise, rng):
+    """Copies of frame with independent Gaussian noise of noise * the signal's peak added to every channel."""
+    upstream, downstream, temperature = frame
+    scale = noise * np.abs(upstream[:, 1]).max()
+    frames = []
+    for _ in range(shots):
+        us, ds = upstream.copy(), downstream.copy()
+        us[:, 1] += np.round(rng.normal(0, scale, len(us)))
+        ds[:, 1] += np.round(rng.normal(0, scale, len(ds)))
+        frames.append((us, ds, temperature))
+    return frames
+
+
+def separate_lags(frames):
+    lags = []
+    for frame in frames:
+        downstream, upstream, _, _ = process_capture_data(*frame, render=False)
+        lags.append(time_lag_cross_correlation(upstream, downstream, render=False)[0])
+    return np.array(lags)
+
+
+def best_time(func, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    shots = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    noise = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    rng = np.random.default_rng(0)
+    frame = parse_capture_file(example_two_channel(LAG_SAMPLES), TRIGGER_PHRASE)
+    frames = noisy_frames(frame, shots, noise, rng)
+    truth = -LAG_SAMPLES / FS
+
+    lags = separate_lags(frames)
+    median = multishot_lag(frames, "median")
+    coherent = multishot_lag(frames, "coherent")
+    assert np.allclose(median.shot_lags, lags, rtol=0, atol=1e-12)
+
+    print(f"{shots} shots, noise {noise} of peak, true lag {truth * 1e9:.0f} ns")
+    print(f"single shot lag error (rms):   {np.sqrt(np.mean((lags - truth) ** 2)) * 1e9:7.2f} ns")
+    print(f"mean of separate lags error:   {abs(lags.mean() - truth) * 1e9:7.2f} ns")
+    print(f"median mode error:             {abs(median.time_lag - truth) * 1e9:7.2f} ns")
+    print(f"coherent mode error:           {abs(coherent.time_lag - truth) * 1e9:7.2f} ns")
+
+    separate = best_time(lambda: separate_lags(frames), repeats)
+    batched_median = best_time(lambda: multishot_lag(frames, "median"), repeats)
+    batched_coherent = best_time(lambda: multishot_lag(frames, "coherent"), repeats)
+    print(f"separate calls:  {separate * 1e3:8.1f} ms")
+    print(f"median mode:     {batched_median * 1e3:8.1f} ms ({separate / batched_median:.1f}x)")
+    print(f"coherent mode:   {batched_coherent * 1e3:8.1f} ms ({separate / batched_coherent:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark the capture parser against the line-by-line reference parser.
+
+Usage:
+    python benchmarks/bench_parser.py [capture_file] [repeats]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import parse_capture_file, _parse_capture_lines  # noqa: E402
+
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+
+
+def best_time(func, repeats):
+    """Return the best wall time of repeats calls to func."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    default_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example.txt")
+    file_path = sys.argv[1] if len(sys.argv) > 1 else default_file
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    def reference():
+        with open(file_path, 'r') as f:
+            return _parse_capture_lines(f.readlines(), TRIGGER_PHRASE)
+
+    def bulk():
+        return parse_capture_file(file_path, TRIGGER_PHRASE)
+
+    # Both parsers must agree before the timings mean anything
+    ref_us, ref_ds, ref_temp = reference()
+    us, ds, temp = bulk()
+    assert np.array_equal(ref_us, us) and np.array_equal(ref_ds, ds) and ref_temp == temp
+
+    ref_time = best_time(reference, repeats)
+    bulk_time = best_time(bulk, repeats)
+    print(f"file: {file_path} ({len(us)} us, {len(ds)} ds samples, temperature {temp})")
+    print(f"line-by-line: {ref_time * 1e3:8.2f} ms")
+    print(f"bulk:         {bulk_time * 1e3:8.2f} ms")
+    print(f"speedup:      {ref_time / bulk_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
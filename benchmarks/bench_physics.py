@@ -0,0 +1,67 @@
+"""
+Speed of sound and flow for an archive of shots: the old per-row path (a new
+cubic interp1d per temperature, then one flow_from_lag per row) against one
+vectorised physics.compute_flow call over all rows.
+
+Usage:
+    python benchmarks/bench_physics.py [rows]
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from physics import (compute_flow, speed_of_sound_fahrenheit,  # noqa: E402
+                     WATER_TEMPERATURES_C, WATER_SPEED_OF_SOUND)
+
+
+def per_row(lags, temperatures, pipe_dia_inner):
+    """The old path: the interpolant is rebuilt for every row."""
+    flows = []
+    for lag, fahrenheit, inner in zip(lags, temperatures, pipe_dia_inner):
+        interpolation_func = interp1d(WATER_TEMPERATURES_C, WATER_SPEED_OF_SOUND, kind='cubic')
+        speed_sound = interpolation_func((fahrenheit - 32) * 5 / 9)
+        dist = math.sqrt(2) * inner
+        flows.append(lag * (speed_sound ** 2) / (2 * dist))
+    return np.array(flows, dtype=np.float64)
+
+
+def vectorised(lags, temperatures, pipe_dia_inner, method):
+    speed_sound = speed_of_sound_fahrenheit(temperatures, method)
+    return compute_flow(lags, pipe_dia_inner, speed_sound_medium=speed_sound)[0]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    rng = np.random.default_rng(0)
+    lags = rng.normal(-2e-7, 2e-8, rows)
+    temperatures = rng.uniform(40, 200, rows)  # Fahrenheit, inside the 0-100 C table
+    pipe_dia_inner = rng.choice([0.0254, 0.0508, 0.1016], rows)  # Mixed pipes in one archive
+
+    start = time.perf_counter()
+    old = per_row(lags, temperatures, pipe_dia_inner)
+    old_time = time.perf_counter() - start
+
+    results = {}
+    for method in ("spline", "table"):
+        start = time.perf_counter()
+        results[method] = (vectorised(lags, temperatures, pipe_dia_inner, method), time.perf_counter() - start)
+
+    assert np.allclose(results["spline"][0], old, rtol=1e-12, atol=0)
+    table_error = np.max(np.abs(results["table"][0] / old - 1))
+    assert table_error < 1e-8
+
+    print(f"{rows} rows")
+    print(f"per row (old):      {old_time * 1e3:9.1f} ms")
+    for method, (_, elapsed) in results.items():
+        print(f"vectorised {method + ':':8}{elapsed * 1e3:9.2f} ms ({old_time / elapsed:.0f}x)")
+    print(f"table relative error: {table_error:.1e}")
+
+
+if __name__ == "__main__":
+    main()
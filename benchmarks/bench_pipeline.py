@@ -0,0 +1,70 @@
+"""
+Shots per second with every step run one after another versus the staged
+pipeline, using a replay source that pretends each capture takes
+capture_time seconds on the board.
+
+Usage:
+    python benchmarks/bench_pipeline.py [capture_file] [shots] [capture_time]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_tof_and_cross_corr import flow_from_lag  # noqa: E402
+from pipeline import ReplaySource, Shot, ShotPipeline  # noqa: E402
+from capture_fixtures import example_two_channel, TRIGGER_PHRASE  # noqa: E402
+
+
+def flow(shot):
+    return flow_from_lag(shot.time_lag, 0.05, 1480.0)
+
+
+def run_serial(file_path, shots, capture_time):
+    source = ReplaySource([file_path], capture_time, repeat=shots)
+    lags = []
+    pipeline = ShotPipeline(source, flow, lambda shot: lags.append(shot.time_lag), TRIGGER_PHRASE)
+    start = time.perf_counter()
+    index = 0
+    while True:
+        lines = source()
+        if lines is None:
+            break
+        shot = Shot(index, lines)
+        for _, func in pipeline.stages:
+            func(shot)
+        index += 1
+    return time.perf_counter() - start, lags
+
+
+def run_pipelined(file_path, shots, capture_time):
+    source = ReplaySource([file_path], capture_time, repeat=shots)
+    lags = []
+    pipeline = ShotPipeline(source, flow, lambda shot: lags.append(shot.time_lag), TRIGGER_PHRASE)
+    start = time.perf_counter()
+    pipeline.start()
+    pipeline.wait()
+    return time.perf_counter() - start, lags, pipeline.summary()
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] else example_two_channel()
+    shots = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    capture_time = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    serial_time, serial_lags = run_serial(file_path, shots, capture_time)
+    pipelined_time, pipelined_lags, summary = run_pipelined(file_path, shots, capture_time)
+    assert serial_lags == pipelined_lags
+
+    print(f"{shots} shots, {capture_time * 1e3:.0f} ms capture each")
+    print(f"serial:    {shots / serial_time:6.2f} shots/s")
+    print(f"pipelined: {shots / pipelined_time:6.2f} shots/s")
+    print()
+    print(f"{'stage':<10} {'mean ms':>8} {'max ms':>8} {'latency ms':>11} {'busy':>6}")
+    for name, stats in summary.items():
+        print(f"{name:<10} {stats['mean_time'] * 1e3:8.2f} {stats['max_time'] * 1e3:8.2f} "
+              f"{stats['mean_latency'] * 1e3:11.2f} {stats['utilization']:6.0%}")
+
+
+if __name__ == "__main__":
+    main()
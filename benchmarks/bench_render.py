@@ -0,0 +1,49 @@
+"""
+How much of a shot is spent drawing plots: the processing chain with
+render=True versus render=False.
+
+Usage:
+    python benchmarks/bench_render.py [capture_file] [repeats]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import process_data_file  # noqa: E402
+from new_tof_and_cross_corr import time_lag_cross_correlation, generate_flowrate_plot  # noqa: E402
+from capture_fixtures import example_two_channel  # noqa: E402
+
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+
+
+def shot(file_path, render):
+    downstream, upstream, temperature, img = process_data_file(file_path, TRIGGER_PHRASE, render=render)
+    time_lag, img_cc = time_lag_cross_correlation(upstream, downstream, render=render)
+    if render:
+        generate_flowrate_plot([time_lag] * 100)
+    return time_lag
+
+
+def best_time(func, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else example_two_channel()
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    assert shot(file_path, True) == shot(file_path, False)
+    with_plots = best_time(lambda: shot(file_path, True), repeats)
+    numbers_only = best_time(lambda: shot(file_path, False), repeats)
+    print(f"render=True:  {with_plots * 1e3:8.1f} ms per shot")
+    print(f"render=False: {numbers_only * 1e3:8.1f} ms per shot")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+ResultsStore at scale: append rate, reopening, a one-hour range query, a
+downsampled history and the per-frame cost of the live history that append
+keeps up to date, against recomputing the cumulative average over a Python
+list every frame (the old flowrate plot).
+
+Usage:
+    python benchmarks/bench_results_store.py [rows] [chunk_size]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from results_store import ResultsStore  # noqa: E402
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 65536
+
+    rng = np.random.default_rng(0)
+    flowrates = rng.normal(2.0, 0.2, rows)
+    timestamps = 1.7e9 + np.arange(rows) * 0.5  # One shot every half second
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultsStore(directory, chunk_size)
+        start = time.perf_counter()
+        for i in range(rows):
+            store.append(flowrates[i], -2e-7, 70.0, 1480.0, "readings.txt", timestamp=timestamps[i])
+        append_time = time.perf_counter() - start
+        assert np.isclose(store.stats.mean, flowrates.mean())
+        assert np.isclose(store.stats.variance, flowrates.var(ddof=1))
+        store.close()
+
+        start = time.perf_counter()
+        store = ResultsStore(directory, chunk_size)
+        open_time = time.perf_counter() - start
+        assert len(store) == rows and np.isclose(store.stats.mean, flowrates.mean())
+
+        middle = timestamps[rows // 2]
+        start = time.perf_counter()
+        hour = store.query(middle, middle + 3600, ["timestamp", "flowrate"])
+        query_time = time.perf_counter() - start
+        expected = (timestamps >= middle) & (timestamps <= middle + 3600)
+        assert np.array_equal(hour["flowrate"], flowrates[expected])
+
+        start = time.perf_counter()
+        history = store.downsample(bins=800)
+        downsample_time = time.perf_counter() - start
+        assert np.isclose(history["cumulative_mean"][-1], flowrates.mean())
+
+        # Live view: built once, then one append and one history() per frame
+        store.history(bins=800)
+        frames = 1000
+        extra = rng.normal(2.0, 0.2, frames)
+        start = time.perf_counter()
+        for i in range(frames):
+            store.append(extra[i], timestamp=timestamps[-1] + i + 1)
+            live = store.history(bins=800)
+        live_time = (time.perf_counter() - start) / frames
+        expected = store.downsample(bins=800)
+        assert all(np.allclose(live[key], expected[key]) for key in expected)
+        store.close()
+
+    history_list = list(flowrates)
+    start = time.perf_counter()
+    np.cumsum(history_list) / np.arange(1, rows + 1)
+    list_time = time.perf_counter() - start
+
+    print(f"{rows} rows, {chunk_size} rows per chunk")
+    print(f"append:             {append_time / rows * 1e6:8.2f} us per row")
+    print(f"reopen:             {open_time * 1e3:8.2f} ms")
+    print(f"one-hour query:     {query_time * 1e3:8.2f} ms ({len(hour['flowrate'])} rows)")
+    print(f"800-bin history:    {downsample_time * 1e3:8.2f} ms")
+    print(f"live frame:         {live_time * 1e3:8.2f} ms (append + 800-bin history)")
+    print(f"list cumsum (old):  {list_time * 1e3:8.2f} ms per frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Per-shot cost of keeping flowrate statistics over a long run: recomputing
+the cumulative average over the whole history every shot (the old
+generate_flowrate_plot) versus the O(1) updates in rolling_stats.
+
+Usage:
+    python benchmarks/bench_rolling_stats.py [shots]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rolling_stats import FlowrateStatistics  # noqa: E402
+
+
+def main():
+    shots = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = np.random.default_rng(0)
+    flowrates = list(rng.normal(2.0, 0.1, shots))
+
+    history = []
+    recompute = []
+    for value in flowrates:
+        history.append(value)
+        start = time.perf_counter()
+        average = np.cumsum(history) / np.arange(1, len(history) + 1)
+        recompute.append(time.perf_counter() - start)
+
+    stats = FlowrateStatistics(outlier_threshold=None)
+    incremental = []
+    for value in flowrates:
+        start = time.perf_counter()
+        stats.add(value)
+        stats.snapshot()
+        incremental.append(time.perf_counter() - start)
+    assert np.isclose(stats.cumulative.mean, average[-1])
+
+    for name, times in (("recompute", recompute), ("incremental", incremental)):
+        print(f"{name:<12} total {sum(times):8.3f} s   last 100 shots {np.mean(times[-100:]) * 1e6:8.1f} us/shot")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Acquisition scheduling against a simulated board: shots paced to a target
+rate through a NiosSession, an impossible target whose missed deadlines are
+counted without bursting, the adaptive frame timeout, and a stalled frame
+after which the session reconnects within its connect_timeout although the
+adaptive frame timeout is much shorter. Also how quickly read_capture_file
+sees a frame in a capture file end by DONE, by the writer exiting, or by the
+file no longer growing.
+
+Usage:
+    python benchmarks/bench_scheduler.py [shots] [capture_time]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from nios_terminal import NiosSession, read_capture_file  # noqa: E402
+from pipeline import ShotPipeline  # noqa: E402
+from scheduler import AcquisitionScheduler  # noqa: E402
+from simulator import SimulatedDevice  # noqa: E402
+from new_txt_read import parse_capture_text  # noqa: E402
+
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+
+
+def paced_run(shots, capture_time, target_rate):
+    device = SimulatedDevice(capture_time=capture_time, frames=shots + 1, samples=4096)
+    scheduler = AcquisitionScheduler(target_rate, min_timeout=0.5)
+    with NiosSession("simulator", "simulated.elf", popen=device.popen) as session:
+        session.read_raw_frame()  # Process start-up is not part of the schedule
+
+        def read():
+            return session.read_raw_frame() if session.frames <= shots else None
+
+        pipeline = ShotPipeline(scheduler.source(read, session), lambda shot: 0.0, lambda shot: None)
+        pipeline.start()
+        pipeline.wait()
+        timeout = session.frame_timeout
+    return scheduler, timeout
+
+
+def wrapped(command, before=0.0, after=0.0):
+    """command run by a Python process that sleeps before starting it and after it exits."""
+    script = ("import subprocess, sys, time; time.sleep(float(sys.argv[1])); "
+              "subprocess.run(sys.argv[3:]); time.sleep(float(sys.argv[2]))")
+    return [sys.executable, "-c", script, repr(before), repr(after), *command]
+
+
+def stalled_run(shots, capture_time, download_time):
+    """
+    A board that stops sending after shots frames without exiting, then takes
+    download_time to come back after the reconnect.
+
+    Returns:
+        tuple: (session, frames read, frame timeout before the stall)
+    """
+    device = SimulatedDevice(capture_time=capture_time, frames=shots, samples=4096)
+    scheduler = AcquisitionScheduler(min_timeout=0.5)
+
+    def popen(args, **kwargs):
+        if session.connects == 0:
+            return subprocess.Popen(wrapped(device.command(), after=60), **kwargs)  # Stalls after its frames
+        return subprocess.Popen(wrapped(device.command(), before=download_time), **kwargs)
+
+    session = NiosSession("simulator", "simulated.elf", popen=popen)
+    with session:
+        read = 0
+        for _ in range(shots):
+            read += scheduler.acquire(session.read_raw_frame, session) is not None
+        timeout = scheduler.frame_timeout()
+        read += scheduler.acquire(session.read_raw_frame, session) is not None  # Stalls, then reconnects
+    return session, read, timeout
+
+
+def file_capture(directory, capture_time, frames):
+    """Frames read from the capture file of a simulator process, with the reason and latency of each."""
+    path = os.path.join(directory, "readings.txt")
+    device = SimulatedDevice(capture_time=capture_time, frames=frames, samples=4096)
+    results = []
+    with open(path, 'w') as out:
+        start = time.perf_counter()
+        process = subprocess.Popen(device.command(), stdout=out)
+        offset = 0
+        for _ in range(frames):
+            lines, reason, offset = read_capture_file(path, TRIGGER_PHRASE, process, timeout=30, offset=offset)
+            results.append((lines, reason, time.perf_counter() - start))
+        process.wait()
+    return results
+
+
+def copy_file(source, destination):
+    with open(source, 'r') as f:
+        lines = f.readlines()
+    with open(destination, 'w') as f:
+        f.writelines(lines)
+
+
+def main():
+    shots = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    capture_time = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    # Back to back first, to see how fast the simulated board and the terminal pipe really are
+    scheduler, timeout = paced_run(shots, capture_time, None)
+    free_rate = scheduler.snapshot()["rate"]
+    captures = list(scheduler.captures)
+    print(f"free running:  {scheduler.summary()}")
+    assert scheduler.shots == shots and timeout < scheduler.max_timeout
+
+    rate = 0.5 * free_rate  # Every shot has to wait for its slot
+    scheduler, _ = paced_run(shots, capture_time, rate)
+    summary = scheduler.snapshot()
+    print(f"half speed:    {scheduler.summary()}")
+    assert summary["missed"] == 0 and summary["pacing"] > 0.3 * summary["elapsed"]
+    assert abs(summary["rate"] / rate - 1) < 0.15, summary["rate"]
+
+    overload = 2 / min(captures)  # No capture is that quick; late shots start at once instead of bursting
+    scheduler, _ = paced_run(shots, capture_time, overload)
+    summary = scheduler.snapshot()
+    print(f"overloaded:    {scheduler.summary()}")
+    assert summary["missed"] == shots and summary["pacing"] == 0 and summary["rate"] < 0.6 * overload
+
+    # The reconnect downloads for longer than the adaptive frame timeout allows a frame
+    download_time = 2.0
+    session, read, timeout = stalled_run(shots, capture_time, download_time)
+    print(f"stalled:       {read} frames, {session.connects} connects, frame timeout {timeout:.2f} s, "
+          f"download {download_time:.1f} s")
+    assert timeout < download_time and read == shots + 1 and session.connects == 2
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = file_capture(directory, 0.2, 3)
+        for k, (lines, reason, seconds) in enumerate(results):
+            frame = parse_capture_text("".join(lines), TRIGGER_PHRASE)
+            assert reason == "done" and frame is not None and len(frame[0]) == 4096, (k, reason)
+            print(f"file frame {k}: {reason} after {seconds:.2f} s")
+
+        # Same frame without its DONE line: ended by the writer exiting, then by the file settling
+        frame_file = os.path.join(directory, "frame.txt")
+        with open(frame_file, 'w') as f:
+            f.writelines(SimulatedDevice(samples=4096).frame_lines(0)[:-1])
+        for settle_only in (False, True):
+            path = os.path.join(directory, f"partial_{settle_only}.txt")
+            start = time.perf_counter()
+            if settle_only:
+                threading.Thread(target=copy_file, args=(frame_file, path)).start()
+                process = None
+            else:
+                with open(path, 'w') as out:
+                    process = subprocess.Popen([sys.executable, "-c", "import sys; print(open(sys.argv[1]).read(), end='')",
+                                                frame_file], stdout=out)  # Writes the frame, then exits
+            lines, reason, _ = read_capture_file(path, TRIGGER_PHRASE, process, timeout=10, settle=0.25)
+            seconds = time.perf_counter() - start
+            assert reason == ("settled" if settle_only else "exited"), reason
+            assert lines[0].startswith(TRIGGER_PHRASE) and len(lines) > 8192
+            print(f"frame without DONE: {reason} after {seconds:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure how long it takes to get a frame out of a replayed nios2-terminal,
+reading its stdout pipe and tailing a redirected file.
+
+Usage:
+    python benchmarks/bench_streaming.py [capture_file] [line_delay]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from new_txt_read import parse_capture_file  # noqa: E402
+from nios_terminal import pipe_lines, tail_lines, read_frame  # noqa: E402
+
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+START_DELAY = 1.0
+
+
+def fake_terminal(capture_file, line_delay, stdout):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "fake_nios2_terminal.py"), capture_file,
+         "--start-delay", str(START_DELAY), "--line-delay", str(line_delay)],
+        text=True, stdout=stdout
+    )
+
+
+def check(frame, expected):
+    for got, want in zip(frame[:2], expected[:2]):
+        assert (got == want).all() and got.shape == want.shape
+    assert frame[2] == expected[2]
+
+
+def main():
+    capture_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "example.txt")
+    line_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    expected = parse_capture_file(capture_file, TRIGGER_PHRASE)
+
+    start = time.perf_counter()
+    process = fake_terminal(capture_file, line_delay, subprocess.PIPE)
+    try:
+        frame = read_frame(pipe_lines(process.stdout, timeout=60), TRIGGER_PHRASE)
+    finally:
+        process.kill()
+        process.wait()
+    check(frame, expected)
+    print(f"pipe: frame after {time.perf_counter() - start:6.2f} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        readings = os.path.join(tmp, "readings.txt")
+        start = time.perf_counter()
+        with open(readings, 'w') as out:
+            process = fake_terminal(capture_file, line_delay, out)
+            try:
+                frame = read_frame(tail_lines(readings, timeout=60), TRIGGER_PHRASE)
+            finally:
+                process.kill()
+                process.wait()
+        check(frame, expected)
+        print(f"tail: frame after {time.perf_counter() - start:6.2f} s")
+    print(f"(replay start delay {START_DELAY} s, line delay {line_delay} s)")
+
+
+if __name__ == "__main__":
+    main()
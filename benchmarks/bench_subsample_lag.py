@@ -0,0 +1,51 @@
+"""
+Accuracy and speed of the sub-sample lag estimators on synthetic echoes
+delayed by a known fractional number of samples.
+
+Usage:
+    python benchmarks/bench_subsample_lag.py [trials]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_tof_and_cross_corr import correlation_peak, subsample_peak, SUBSAMPLE_METHODS  # noqa: E402
+
+SAMPLING_RATE = 50e6
+N = 16384
+
+
+def delayed_pair(delay, noise, rng):
+    """A 500 kHz tone burst and a copy delayed by delay samples (Fourier shift)."""
+    t = np.arange(N)
+    burst = np.exp(-((t - N / 3) / 150.0) ** 2) * np.sin(2 * np.pi * (t - N / 3) / 100)
+    freqs = np.fft.rfftfreq(N)
+    delayed = np.fft.irfft(np.fft.rfft(burst) * np.exp(-2j * np.pi * freqs * delay), N)
+    us = delayed + noise * rng.standard_normal(N)
+    ds = burst + noise * rng.standard_normal(N)
+    return us, ds
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = np.random.default_rng(1)
+    delays = rng.uniform(-20, 20, trials)
+
+    print(f"{'method':>10} {'noise':>6} {'mean |err| ps':>14} {'max |err| ps':>13} {'ms/call':>8}")
+    for noise in (0.0, 0.01, 0.05):
+        pairs = [delayed_pair(d, noise, rng) for d in delays]
+        estimators = [("integer", lambda us, ds: correlation_peak(us, ds, "fft")[0])]
+        estimators += [(m, lambda us, ds, m=m: subsample_peak(us, ds, m)) for m in SUBSAMPLE_METHODS]
+        for name, estimate in estimators:
+            start = time.perf_counter()
+            lags = np.array([estimate(us, ds) for us, ds in pairs])
+            elapsed = (time.perf_counter() - start) / trials
+            errors = np.abs(lags - delays) / SAMPLING_RATE * 1e12
+            print(f"{name:>10} {noise:>6} {errors.mean():>14.1f} {errors.max():>13.1f} {elapsed * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Capture files for the benchmarks.
+
+example.txt only carries the upstream channel, so the benchmarks that need
+both channels use a copy with a downstream channel made from the upstream
+samples delayed by a known number of samples. example.txt has no distinct
+echo either, so echo_capture synthesises one for the echo gate.
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from new_txt_read import parse_capture_file  # noqa: E402
+
+EXAMPLE_FILE = os.path.join(ROOT, "example.txt")
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+
+
+def write_capture(file_path, upstream, downstream, temperature):
+    """Write voltage arrays in the nios2-terminal text format."""
+    with open(file_path, 'w') as f:
+        f.write("nios2-terminal: connected to hardware target using JTAG UART on cable\n\n")
+        f.write(TRIGGER_PHRASE + " \n")
+        f.writelines(f"us {i} {int(v)}\n" for i, v in enumerate(upstream))
+        f.writelines(f"ds {i} {int(v)}\n" for i, v in enumerate(downstream))
+        f.write(f"temperature: {temperature}\nDONE\n")
+
+
+def example_two_channel(lag=11, directory=None):
+    """
+    Path to a two-channel version of example.txt whose downstream channel is
+    the upstream channel delayed by lag samples. Created once per directory.
+    """
+    directory = directory or tempfile.gettempdir()
+    file_path = os.path.join(directory, f"example_two_channel_lag{lag}.txt")
+    if not os.path.exists(file_path):
+        upstream, _, temperature = parse_capture_file(EXAMPLE_FILE, TRIGGER_PHRASE)
+        voltage = upstream[:, 1]
+        write_capture(file_path, voltage, np.roll(voltage, lag), temperature)
+    return file_path
+
+
+def echo_capture(lag=11, directory=None, seed=0):
+    """
+    Path to a synthetic two-channel capture holding a 500 kHz tone burst
+    around sample 8000 in example.txt-like noise; the downstream burst is the
+    upstream one delayed by lag samples. Created once per directory.
+    """
+    directory = directory or tempfile.gettempdir()
+    file_path = os.path.join(directory, f"echo_capture_lag{lag}.txt")
+    if not os.path.exists(file_path):
+        rng = np.random.default_rng(seed)
+        samples = np.arange(16384)
+
+        def burst(centre):
+            return 1500 * np.exp(-0.5 * ((samples - centre) / 150) ** 2) * np.sin(2 * np.pi * (samples - centre) / 100)
+
+        upstream = np.round(17 + burst(8000) + rng.normal(0, 25, len(samples)))
+        downstream = np.round(17 + burst(8000 + lag) + rng.normal(0, 25, len(samples)))
+        write_capture(file_path, upstream, downstream, 98.712502)
+    return file_path
+
+
+def synthetic_capture(samples, lag=11, directory=None, seed=0):
+    """
+    Path to a simulator capture with samples per channel: a tone burst half
+    way through the record whose downstream copy is delayed by lag samples,
+    in simulated noise. Created once per directory.
+    """
+    directory = directory or tempfile.gettempdir()
+    file_path = os.path.join(directory, f"synthetic_{samples}_lag{lag}.txt")
+    if not os.path.exists(file_path):
+        from simulator import synthetic_channels
+        upstream, downstream = synthetic_channels(lag / 50e6, samples=samples, echo_at=samples // 2,
+                                                  rng=np.random.default_rng(seed))
+        write_capture(file_path, upstream, downstream, 98.712502)
+    return file_path
@@ -0,0 +1,50 @@
+"""
+Cross-check of the zero-phase low-pass filter against scipy: _sosfiltfilt
+reuses the cached sosfilt_zi initial conditions but must otherwise match
+scipy.signal.sosfiltfilt with its default padding.
+
+    python -m pytest benchmarks/test_filter.py
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.signal import sosfiltfilt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import _lowpass_design, _sosfiltfilt, butter_lowpass_filter  # noqa: E402
+
+FS = 50e6
+
+
+@pytest.mark.parametrize("cutoff, order", [(1e6, 5), (5e6, 2), (2e5, 8), (1e6, 1)])
+@pytest.mark.parametrize("length", [64, 1728, 16359])
+def test_matches_scipy(cutoff, order, length):
+    sos, zi = _lowpass_design(cutoff, FS, order)
+    data = np.random.default_rng(length).normal(size=length)
+    assert np.array_equal(_sosfiltfilt(sos, zi, data), sosfiltfilt(sos, data))
+
+
+@pytest.mark.parametrize("axis", [0, 1, -1])
+def test_matches_scipy_on_stacks(axis):
+    sos, zi = _lowpass_design(1e6, FS, 5)
+    data = np.random.default_rng(0).normal(size=(4, 1728))
+    if axis == 0:
+        data = data.T
+    assert np.array_equal(_sosfiltfilt(sos, zi, data, axis=axis), sosfiltfilt(sos, data, axis=axis))
+
+
+def test_integer_samples():
+    sos, zi = _lowpass_design(1e6, FS, 5)
+    data = np.random.default_rng(0).integers(-2048, 2048, 1728, dtype=np.int16)
+    assert np.array_equal(_sosfiltfilt(sos, zi, data), sosfiltfilt(sos, data))
+
+
+def test_too_short():
+    sos, zi = _lowpass_design(1e6, FS, 5)
+    with pytest.raises(ValueError, match="padlen"):
+        _sosfiltfilt(sos, zi, np.ones(18))
+    with pytest.raises(ValueError, match="padlen"):
+        sosfiltfilt(sos, np.ones(18))
+    assert np.array_equal(butter_lowpass_filter(np.ones(18), 1e6, FS), np.ones(18))  # Falls back to the input
@@ -0,0 +1,224 @@
+"""
+pytest-benchmark suite for the per-shot hot paths: parsing, filtering,
+correlation, time of flight, speed of sound, flow and plotting, on
+example.txt and on simulator captures of 16k, 256k and 4M samples, plus the
+cold import time of the entry points (see bench_import_time.py).
+
+Every benchmark also checks its result against a reference (the original
+implementation or the injected lag), so an optimisation that changes a lag
+or a flowrate fails here even if it is faster.
+
+Save a baseline, then compare later runs against it and fail on regressions:
+
+    python -m pytest benchmarks/test_hot_paths.py --benchmark-autosave
+    python -m pytest benchmarks/test_hot_paths.py --benchmark-compare --benchmark-compare-fail=mean:15%
+
+FLOVIS_BENCH_SIZES picks the synthetic sizes, e.g. FLOVIS_BENCH_SIZES=16384,262144
+to leave out the 4M-sample capture, which takes a few minutes.
+"""
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.interpolate import interp1d
+from scipy.signal import butter, filtfilt
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_txt_read import (parse_capture_file, process_data_file, calculate_time_lag,  # noqa: E402
+                          calculate_average_time_of_flight, calculate_flowrate, plot_waveforms)
+from new_tof_and_cross_corr import (time_lag_cross_correlation, cross_correlation_data,  # noqa: E402
+                                    plot_cross_correlation, generate_flowrate_plot, speed_of_sound_fahrenheit)
+from physics import compute_flow  # noqa: E402
+from simulator import synthetic_channels  # noqa: E402
+from capture_fixtures import (example_two_channel, synthetic_capture, EXAMPLE_FILE,  # noqa: E402
+                              TRIGGER_PHRASE)
+from bench_import_time import ENTRY_POINTS, import_time, heavy_modules  # noqa: E402
+
+FS = 50e6
+LAG_SAMPLES = 11
+SIZES = [int(size) for size in os.environ.get("FLOVIS_BENCH_SIZES", "16384,262144,4194304").split(",")]
+PNG_MAGIC = b"\x89PNG"
+
+
+def rounds(samples):
+    """Fewer rounds for the big captures so the suite finishes in minutes."""
+    return 20 if samples <= 16384 else 5 if samples <= 262144 else 2
+
+
+def run(benchmark, func, *args, samples=16384, **kwargs):
+    return benchmark.pedantic(func, args, kwargs, rounds=rounds(samples), iterations=1, warmup_rounds=0)
+
+
+def reference_filter(voltage):
+    """The low-pass filter as process_data_file originally applied it."""
+    b, a = butter(5, 1000000 / (0.5 * FS), btype='low', analog=False)
+    return filtfilt(b, a, voltage)
+
+
+def reference_time_of_flight(downstream_df, upstream_df):
+    """calculate_average_time_of_flight as originally written, on the DataFrame adapter."""
+    def time_of_flight(waveform):
+        signal_df = waveform.to_dataframe()
+        filtered = signal_df["Voltage_Filtered"].values
+        significant = np.where(np.abs(filtered) > 0.1 * np.max(np.abs(filtered)))[0]
+        return signal_df["Second"].iloc[significant[-1]] - signal_df["Second"].iloc[significant[0]]
+    return (time_of_flight(downstream_df) + time_of_flight(upstream_df)) / 2
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda size: f"{size}")
+def capture(request, tmp_path_factory):
+    """(samples, path) of a synthetic capture, written once per run."""
+    directory = tmp_path_factory.getbasetemp()
+    return request.param, synthetic_capture(request.param, LAG_SAMPLES, str(directory))
+
+
+@pytest.fixture(scope="module")
+def processed(capture):
+    samples, file_path = capture
+    downstream_df, upstream_df, _, _ = process_data_file(file_path, TRIGGER_PHRASE, render=False)
+    return samples, downstream_df, upstream_df
+
+
+@pytest.fixture(scope="module")
+def example_processed(tmp_path_factory):
+    file_path = example_two_channel(LAG_SAMPLES, str(tmp_path_factory.getbasetemp()))
+    downstream_df, upstream_df, temperature, _ = process_data_file(file_path, TRIGGER_PHRASE, render=False)
+    return downstream_df, upstream_df, temperature
+
+
+# Parsing
+
+def test_parse_example(benchmark):
+    upstream, downstream, temperature = run(benchmark, parse_capture_file, EXAMPLE_FILE, TRIGGER_PHRASE)
+    assert upstream.shape == (16384, 2) and downstream.shape == (0, 2)
+    assert temperature == 98.712502
+    assert upstream[13, 1] == 6143
+
+
+def test_parse_capture_file(benchmark, capture):
+    samples, file_path = capture
+    upstream, downstream, temperature = run(benchmark, parse_capture_file, file_path, TRIGGER_PHRASE,
+                                            samples=samples)
+    expected_us, expected_ds = synthetic_channels(LAG_SAMPLES / FS, samples=samples, echo_at=samples // 2,
+                                                  rng=np.random.default_rng(0))
+    assert np.array_equal(upstream[:, 1], expected_us) and np.array_equal(downstream[:, 1], expected_ds)
+    assert np.array_equal(upstream[:, 0], np.arange(samples))
+    assert temperature == 98.712502
+
+
+# Filtering
+
+def test_process_data_file(benchmark, capture):
+    samples, file_path = capture
+    downstream_df, upstream_df, _, buf = run(benchmark, process_data_file, file_path, TRIGGER_PHRASE, render=False,
+                                             samples=samples)
+    assert buf is None and len(upstream_df) == samples - 25
+    for waveform in (downstream_df, upstream_df):
+        expected = reference_filter(waveform.voltage)
+        error = np.max(np.abs(waveform.filtered - expected)) / np.max(np.abs(expected))
+        assert error < 1e-8
+        assert waveform.regular and np.array_equal(waveform.time, np.arange(25, samples) / FS)
+
+
+# Correlation
+
+def test_time_lag_cross_correlation(benchmark, processed):
+    samples, downstream_df, upstream_df = processed
+    time_lag, _ = run(benchmark, time_lag_cross_correlation, upstream_df, downstream_df, render=False,
+                      samples=samples)
+    assert time_lag == pytest.approx(-LAG_SAMPLES / FS, rel=0, abs=1e-15)
+    if samples <= 16384:
+        direct_lag, _, _ = cross_correlation_data(upstream_df, downstream_df, method="direct")
+        assert time_lag == direct_lag
+
+
+def test_calculate_time_lag(benchmark, processed):
+    samples, downstream_df, upstream_df = processed
+    time_lag = run(benchmark, calculate_time_lag, downstream_df, upstream_df, FS, samples=samples)
+    assert time_lag == pytest.approx(LAG_SAMPLES / FS, rel=0, abs=1e-15)
+
+
+def test_example_lag(benchmark, example_processed):
+    # example.txt is mostly noise with a slow drift, so its peak is not at the
+    # injected shift; the direct correlation is the reference here
+    downstream_df, upstream_df, _ = example_processed
+    time_lag, _ = run(benchmark, time_lag_cross_correlation, upstream_df, downstream_df, render=False)
+    direct_lag, _, _ = cross_correlation_data(upstream_df, downstream_df, method="direct")
+    assert time_lag == direct_lag
+
+
+# Time of flight, speed of sound and flow
+
+def test_average_time_of_flight(benchmark, processed):
+    samples, downstream_df, upstream_df = processed
+    tof = run(benchmark, calculate_average_time_of_flight, downstream_df, upstream_df, samples=samples)
+    assert tof == reference_time_of_flight(downstream_df, upstream_df)
+
+
+def test_speed_of_sound_scalar(benchmark):
+    speed = run(benchmark, speed_of_sound_fahrenheit, 98.712502)
+    reference = interp1d([0, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100],
+                         [1403, 1427, 1447, 1481, 1507, 1526, 1541, 1552, 1555, 1555, 1550, 1543], kind='cubic')
+    assert speed == pytest.approx(float(reference((98.712502 - 32) * 5 / 9)), rel=1e-12)
+
+
+def test_speed_of_sound_array(benchmark):
+    temperatures = np.linspace(33, 211, 100_000)
+    speeds = run(benchmark, speed_of_sound_fahrenheit, temperatures)
+    reference = interp1d([0, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100],
+                         [1403, 1427, 1447, 1481, 1507, 1526, 1541, 1552, 1555, 1555, 1550, 1543], kind='cubic')
+    np.testing.assert_allclose(speeds, reference((temperatures - 32) * 5 / 9), rtol=1e-12)
+
+
+def test_calculate_flowrate(benchmark, example_processed):
+    downstream_df, upstream_df, _ = example_processed
+    time_lag = -LAG_SAMPLES / FS
+    flowrate, speed_sound = run(benchmark, calculate_flowrate, downstream_df, upstream_df, time_lag, 0.0254,
+                                speed_sound_medium=1480)
+    assert speed_sound == 1480
+    assert flowrate == pytest.approx(time_lag * 1480 ** 2 / (2 * math.sqrt(2) * 0.0254), rel=1e-12)
+
+
+def test_compute_flow_batch(benchmark):
+    rng = np.random.default_rng(0)
+    lags = rng.normal(-2e-7, 2e-8, 100_000)
+    tof = rng.uniform(3e-4, 4e-4, 100_000)
+    flowrates, speeds = run(benchmark, compute_flow, lags, 0.0254, tof, 0.03, 2300.0)
+    expected_speed = (tof - 0.00003220801425 - (0.03 - 0.0254) / 2300.0) / math.sqrt(2) * 0.0254
+    np.testing.assert_allclose(speeds, expected_speed, rtol=1e-12)
+    np.testing.assert_allclose(flowrates, lags * expected_speed ** 2 / (2 * math.sqrt(2) * 0.0254), rtol=1e-12)
+
+
+# Plotting
+
+def test_generate_flowrate_plot(benchmark):
+    flowrates = list(np.random.default_rng(0).normal(2.0, 0.2, 1000))
+    buf = run(benchmark, generate_flowrate_plot, flowrates)
+    assert buf.getvalue()[:4] == PNG_MAGIC
+
+
+def test_plot_waveforms(benchmark, example_processed):
+    downstream_df, upstream_df, _ = example_processed
+    buf = run(benchmark, plot_waveforms, downstream_df, upstream_df)
+    assert buf.getvalue()[:4] == PNG_MAGIC
+
+
+def test_plot_cross_correlation(benchmark, example_processed):
+    downstream_df, upstream_df, _ = example_processed
+    time_lag, time_lags, cross_corr = cross_correlation_data(upstream_df, downstream_df)
+    buf = run(benchmark, plot_cross_correlation, time_lags, cross_corr, time_lag)
+    assert buf.getvalue()[:4] == PNG_MAGIC
+
+
+# Cold start
+
+@pytest.mark.parametrize("name, statement, light", ENTRY_POINTS, ids=[entry[0] for entry in ENTRY_POINTS])
+def test_cold_import(benchmark, name, statement, light):
+    _, modules = benchmark.pedantic(import_time, (statement,), rounds=3, iterations=1, warmup_rounds=0)
+    if light:
+        assert heavy_modules(modules) == []
@@ -0,0 +1,120 @@
+"""
+NiosSession against fake_nios2_terminal.py in place of the Nios II shell:
+frames, reconnecting after the terminal exits or stalls, connect_timeout
+versus frame_timeout, and close() from another thread during a read.
+
+    python -m pytest benchmarks/test_nios_session.py
+"""
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from nios_terminal import NiosSession  # noqa: E402
+
+FAKE_TERMINAL = os.path.join(ROOT, "fake_nios2_terminal.py")
+EXAMPLE_FILE = os.path.join(ROOT, "example.txt")
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+
+
+def fake_terminal(start_delay=0.0, repeat=1, line_delay=0.0):
+    """popen for NiosSession that runs fake_nios2_terminal.py; the shell path and stdin commands are ignored."""
+    command = [sys.executable, FAKE_TERMINAL, EXAMPLE_FILE, "--start-delay", repr(start_delay),
+               "--line-delay", repr(line_delay), "--repeat", str(repeat)]
+
+    def popen(args, **kwargs):
+        return subprocess.Popen(command, **kwargs)
+
+    return popen
+
+
+def session(popen, **kwargs):
+    return NiosSession("shell.bat", "firmware.elf", TRIGGER_PHRASE, popen=popen, **kwargs)
+
+
+def test_frames():
+    with session(fake_terminal(repeat=2)) as s:
+        raw = s.read_raw_frame()
+        upstream_data, downstream_data, temperature = s.read_frame()
+    assert raw[0].startswith(TRIGGER_PHRASE) and raw[-1].strip() == "DONE"
+    assert len(upstream_data) == 16384 and temperature == pytest.approx(98.712502)
+    assert s.frames == 2 and s.connects == 1
+
+
+def test_reconnect_after_exit():
+    with session(fake_terminal(repeat=1)) as s:
+        s.read_raw_frame()
+        assert s.read_raw_frame()[-1].strip() == "DONE"  # The terminal exited after one frame
+    assert s.connects == 2
+
+
+def test_connect_timeout_covers_start():
+    # Every frame takes 1 s, longer than frame_timeout; only reads right after connecting get that long
+    with session(fake_terminal(start_delay=1.0, repeat=2), frame_timeout=0.3, connect_timeout=10) as s:
+        s.read_raw_frame()
+        assert s.connects == 1
+        s.read_raw_frame()  # Times out, reconnects, then gets connect_timeout again
+    assert s.connects == 2 and s.frames == 2
+
+
+def test_no_frame_within_connect_timeout():
+    with session(fake_terminal(start_delay=5.0), frame_timeout=10, connect_timeout=0.3, max_reconnects=1) as s:
+        with pytest.raises(RuntimeError, match="No frame"):
+            s.read_raw_frame()
+    assert s.connects == 2
+
+
+class ClosingProcess:
+    """
+    In-process stand-in for the shell whose stdout calls close_func part way
+    through a frame and then keeps producing lines, so the reading thread
+    sees more output after close() has torn the session down. Output starts
+    once the download commands have been flushed, as from the real shell.
+    """
+
+    def __init__(self, close_func, close_after=100):
+        with open(EXAMPLE_FILE, 'r') as f:
+            self.output = iter(f.readlines())
+        self.close_func = close_func
+        self.close_after = close_after
+        self.commands_sent = threading.Event()
+        self.pid = -1
+        self.stdin = self
+        self.stdout = self
+
+    def write(self, text):
+        pass
+
+    def flush(self):
+        self.commands_sent.set()
+
+    def readline(self):
+        self.commands_sent.wait(5)
+        self.close_after -= 1
+        if self.close_after == 0:
+            self.close_func()
+        return next(self.output, '')
+
+    def kill(self):
+        pass
+
+    def wait(self, timeout=None):
+        return 0
+
+
+def test_close_during_read():
+    def close_mid_frame():
+        while not s.lines.empty():  # Let the read catch up, so it is waiting on the queue
+            time.sleep(0.001)
+        s.close()
+
+    s = session(lambda args, **kwargs: ClosingProcess(close_mid_frame))
+    with pytest.raises(RuntimeError, match="closed"):
+        s.read_raw_frame()
+    assert s.connects == 1 and s.lines is None
@@ -0,0 +1,58 @@
+"""
+Crash recovery of ResultsStore: reopening a store whose journal was left
+full (the process died between the last journal write and sealing the
+chunk) or ends in a torn record.
+
+    python -m pytest benchmarks/test_results_store.py
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from results_store import ResultsStore, RECORD_DTYPE  # noqa: E402
+
+CHUNK_SIZE = 4
+
+
+def crashed_store(directory, rows, chunk_size=CHUNK_SIZE):
+    """A store whose journal holds rows rows, as if the process died before it could seal a chunk."""
+    store = ResultsStore(directory, chunk_size=max(chunk_size, rows + 1))
+    for i in range(rows):
+        store.append(float(i), timestamp=float(i))
+    store.close()
+    return os.path.join(directory, "journal_000000.bin")
+
+
+def test_reopen_full_journal(tmp_path):
+    crashed_store(str(tmp_path), CHUNK_SIZE)
+    store = ResultsStore(str(tmp_path), CHUNK_SIZE)
+    assert len(store.chunks) == 1 and store.active_rows == 0
+    store.append(4.0, timestamp=4.0)
+    assert len(store) == CHUNK_SIZE + 1
+    assert np.array_equal(store.query()["flowrate"], np.arange(CHUNK_SIZE + 1.0))
+    store.close()
+
+
+def test_reopen_overfull_journal(tmp_path):
+    crashed_store(str(tmp_path), 2 * CHUNK_SIZE + 1)
+    store = ResultsStore(str(tmp_path), CHUNK_SIZE)
+    assert len(store.chunks) == 2 and store.active_rows == 1
+    store.close()
+    store = ResultsStore(str(tmp_path), CHUNK_SIZE)  # The leftover row survived in the next journal
+    assert np.array_equal(store.query()["flowrate"], np.arange(2 * CHUNK_SIZE + 1.0))
+    assert store.stats.count == 2 * CHUNK_SIZE + 1
+    store.close()
+
+
+def test_reopen_torn_record(tmp_path):
+    journal_path = crashed_store(str(tmp_path), 2)
+    with open(journal_path, 'ab') as f:
+        f.write(b"\0" * (RECORD_DTYPE.itemsize // 2))
+    store = ResultsStore(str(tmp_path), CHUNK_SIZE)
+    assert store.active_rows == 2
+    assert os.path.getsize(journal_path) == 2 * RECORD_DTYPE.itemsize
+    store.append(2.0, timestamp=2.0)
+    assert np.array_equal(store.query()["flowrate"], [0.0, 1.0, 2.0])
+    store.close()
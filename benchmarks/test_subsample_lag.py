@@ -0,0 +1,52 @@
+"""
+Accuracy checks for the sub-sample lag estimators, on the synthetic echoes
+of bench_subsample_lag.py delayed by known fractional numbers of samples.
+
+    python -m pytest benchmarks/test_subsample_lag.py
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from new_tof_and_cross_corr import correlation_peak, subsample_peak, SUBSAMPLE_METHODS  # noqa: E402
+from bench_subsample_lag import delayed_pair, SAMPLING_RATE  # noqa: E402
+
+TRIALS = 20
+
+# Largest error in picoseconds without noise; the benchmark sees about half of these
+NOISELESS_BOUNDS = {"parabolic": 5.0, "gaussian": 10.0, "phat": 1.0}
+
+
+def errors_ps(estimate, noise, seed=1):
+    """Absolute errors in picoseconds of estimate(us, ds) over TRIALS random delays within ±20 samples."""
+    rng = np.random.default_rng(seed)
+    delays = rng.uniform(-20, 20, TRIALS)
+    lags = np.array([estimate(*delayed_pair(delay, noise, rng)) for delay in delays])
+    return np.abs(lags - delays) / SAMPLING_RATE * 1e12
+
+
+def test_bounds_cover_methods():
+    assert set(NOISELESS_BOUNDS) == set(SUBSAMPLE_METHODS)
+
+
+def test_integer_peak_within_half_sample():
+    errors = errors_ps(lambda us, ds: correlation_peak(us, ds, "fft")[0], 0.0)
+    assert errors.max() <= 0.5 / SAMPLING_RATE * 1e12
+
+
+@pytest.mark.parametrize("method", SUBSAMPLE_METHODS)
+def test_noiseless_accuracy(method):
+    errors = errors_ps(lambda us, ds: subsample_peak(us, ds, method), 0.0)
+    assert errors.max() < NOISELESS_BOUNDS[method], errors.max()
+
+
+@pytest.mark.parametrize("method", SUBSAMPLE_METHODS)
+def test_noisy_accuracy(method):
+    integer = errors_ps(lambda us, ds: correlation_peak(us, ds, "fft")[0], 0.01)
+    errors = errors_ps(lambda us, ds: subsample_peak(us, ds, method), 0.01)
+    assert errors.mean() < 1000.0, errors.mean()  # Well under a sample (20 000 ps)
+    assert errors.mean() < 0.3 * integer.mean()
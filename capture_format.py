@@ -0,0 +1,172 @@
+"""
+Binary capture format (.cap).
+
+A fixed 64 byte little-endian header followed by the raw int16 voltages of
+the upstream channel and then the downstream channel. Sample numbers are not
+stored: each channel is a run of consecutive samples from its start index.
+That is about 2 bytes per sample against roughly 12 for the nios2-terminal
+text, and the channels can be opened with np.memmap without parsing.
+new_txt_read.process_data_file analyses a .cap file straight from the map,
+using the header's sample rate and start indices.
+
+Usage:
+    python capture_format.py readings.txt [more.txt ...] [-o output_dir]
+"""
+import argparse
+import os
+
+import numpy as np
+
+MAGIC = b"FLOVISCP"
+VERSION = 1
+SAMPLE_DTYPE = np.dtype("<i2")
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("header_size", "<u4"),
+    ("temperature", "<f8"),  # NaN if the capture had no temperature line
+    ("sample_rate", "<f8"),
+    ("upstream_start", "<i8"),
+    ("upstream_length", "<i8"),
+    ("downstream_start", "<i8"),
+    ("downstream_length", "<i8"),
+])
+
+
+def _channel_samples(data, name):
+    """Start index and int16 voltages of an (N, 2) channel, or ValueError if it cannot be stored exactly."""
+    data = np.asarray(data, dtype=np.float64).reshape(-1, 2)
+    if len(data) == 0:
+        return 0, np.empty(0, dtype=SAMPLE_DTYPE)
+    samples, voltages = data[:, 0], data[:, 1]
+    if np.any(np.diff(samples) != 1) or samples[0] != int(samples[0]):
+        raise ValueError(f"{name} sample numbers are not consecutive integers")
+    info = np.iinfo(SAMPLE_DTYPE)
+    if np.any(voltages != np.round(voltages)) or voltages.min() < info.min or voltages.max() > info.max:
+        raise ValueError(f"{name} voltages do not fit in int16")
+    return int(samples[0]), voltages.astype(SAMPLE_DTYPE)
+
+
+def write_capture_binary(file_path, upstream_data, downstream_data, temperature, sample_rate=50e6):
+    """
+    Write a parsed capture in the binary format.
+
+    Args:
+        file_path (str): Output path, conventionally ending in .cap.
+        upstream_data, downstream_data: (N, 2) arrays of (sample, voltage) rows
+            as returned by parse_capture_file.
+        temperature (float): Temperature, or None.
+        sample_rate (float): ADC sample rate in Hz.
+
+    Raises:
+        ValueError: If the samples are not consecutive or the voltages are not int16.
+    """
+    upstream_start, upstream = _channel_samples(upstream_data, "upstream")
+    downstream_start, downstream = _channel_samples(downstream_data, "downstream")
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["header_size"] = HEADER_DTYPE.itemsize
+    header["temperature"] = np.nan if temperature is None else temperature
+    header["sample_rate"] = sample_rate
+    header["upstream_start"] = upstream_start
+    header["upstream_length"] = len(upstream)
+    header["downstream_start"] = downstream_start
+    header["downstream_length"] = len(downstream)
+
+    with open(file_path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(upstream.tobytes())
+        f.write(downstream.tobytes())
+
+
+def is_binary_capture(file_path):
+    """True if file_path starts with the binary capture magic."""
+    with open(file_path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class BinaryCapture:
+    """
+    A binary capture opened with np.memmap. upstream and downstream are
+    read-only int16 views straight onto the file; nothing is read until they
+    are used.
+    """
+
+    def __init__(self, file_path):
+        header = np.fromfile(file_path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header["magic"][0] != MAGIC:
+            raise ValueError(f"{file_path} is not a binary capture")
+        header = header[0]
+        if header["version"] != VERSION:
+            raise ValueError(f"{file_path} has unsupported version {header['version']}")
+
+        temperature = float(header["temperature"])
+        self.temperature = None if np.isnan(temperature) else temperature
+        self.sample_rate = float(header["sample_rate"])
+        self.upstream_start = int(header["upstream_start"])
+        self.downstream_start = int(header["downstream_start"])
+
+        offset = int(header["header_size"])
+        upstream_length = int(header["upstream_length"])
+        downstream_length = int(header["downstream_length"])
+        self.upstream = self._map(file_path, offset, upstream_length)
+        self.downstream = self._map(file_path, offset + upstream_length * SAMPLE_DTYPE.itemsize, downstream_length)
+
+    @staticmethod
+    def _map(file_path, offset, length):
+        if length == 0:
+            return np.empty(0, dtype=SAMPLE_DTYPE)  # np.memmap cannot map zero bytes
+        return np.memmap(file_path, dtype=SAMPLE_DTYPE, mode='r', offset=offset, shape=(length,))
+
+    @staticmethod
+    def _rows(start, voltages):
+        rows = np.empty((len(voltages), 2), dtype=np.float64)
+        rows[:, 0] = np.arange(start, start + len(voltages))
+        rows[:, 1] = voltages
+        return rows
+
+    def to_frame(self):
+        """
+        (upstream_data, downstream_data, temperature) in the same form as
+        parse_capture_file. The samples are copied into new float64 rows; use
+        new_txt_read.process_binary_capture to analyse the mapped channels
+        without that copy.
+        """
+        return (self._rows(self.upstream_start, self.upstream),
+                self._rows(self.downstream_start, self.downstream),
+                self.temperature)
+
+
+def load_capture_binary(file_path):
+    """Read a binary capture into the same (upstream_data, downstream_data, temperature) as parse_capture_file."""
+    return BinaryCapture(file_path).to_frame()
+
+
+def convert_text_capture(text_path, binary_path, trigger_phrase="== IT'S ALIVE ==", sample_rate=50e6):
+    """Convert a nios2-terminal text capture to the binary format."""
+    from new_txt_read import parse_capture_file  # new_txt_read imports this module
+    upstream_data, downstream_data, temperature = parse_capture_file(text_path, trigger_phrase)
+    write_capture_binary(binary_path, upstream_data, downstream_data, temperature, sample_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert text captures to the binary .cap format.")
+    parser.add_argument("captures", nargs="+", help="text capture files")
+    parser.add_argument("-o", "--output-dir", default=None, help="directory for the .cap files (default: next to each input)")
+    parser.add_argument("--trigger-phrase", default="== IT'S ALIVE ==")
+    args = parser.parse_args()
+
+    for text_path in args.captures:
+        directory = args.output_dir or os.path.dirname(text_path)
+        binary_path = os.path.join(directory, os.path.splitext(os.path.basename(text_path))[0] + ".cap")
+        try:
+            convert_text_capture(text_path, binary_path, args.trigger_phrase)
+            print(f"{text_path} -> {binary_path} ({os.path.getsize(text_path)} -> {os.path.getsize(binary_path)} bytes)")
+        except Exception as e:
+            print(f"Error converting {text_path}: {e}")
+
+
+if __name__ == "__main__":
+    main()
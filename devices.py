@@ -0,0 +1,287 @@
+"""
+Run several flowmeter boards from one host.
+
+Every board is a Device in a DeviceRegistry with its own JTAG cable/instance,
+firmware image, capture file, results store, pipe settings and target shot
+rate. The DeviceManager gives each device its own NiosSession and
+ShotPipeline, so the boards are read and processed concurrently, and keeps the
+results of every device apart.
+
+The registry is usually loaded from a JSON file:
+
+    {"devices": [
+        {"name": "section-a", "elf_path": "flovis.elf", "cable": "DE-SoC [USB-1]",
+         "capture_path": "a/readings.txt", "results_path": "a/results", "pipe_dia_inner": 0.0254},
+        {"name": "section-b", "elf_path": "flovis.elf", "cable": "DE-SoC [USB-2]",
+         "capture_path": "b/readings.txt", "results_path": "b/results", "pipe_dia_inner": 0.0508,
+         "speed_sound_medium": 1480, "target_rate": 2.0}
+    ]}
+
+Usage:
+    python devices.py devices.json [--interval S] [--shots N] [--metrics stages.prom]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from new_txt_read import calculate_flowrate
+from nios_terminal import NiosSession, kill_stale_terminals
+from pipeline import ShotPipeline
+from scheduler import AcquisitionScheduler
+from results_store import ResultsStore
+from rolling_stats import FlowrateStatistics
+import metrics
+
+DEFAULT_SHELL_PATH = "C:\\intelFPGA_lite\\18.0\\nios2eds\\Nios II Command Shell.bat"
+
+Device = namedtuple("Device", [
+    "name", "elf_path", "cable", "instance", "shell_path", "capture_path", "results_path",
+    "pipe_dia_inner", "pipe_dia_outer", "speed_sound_pipe", "speed_sound_medium", "inv", "target_rate",
+], defaults=[None, None, DEFAULT_SHELL_PATH, None, None, 0.0254, 0, 0, 0, 0, None])
+
+
+class DeviceRegistry:
+    """
+    The boards served by this host, by name. add refuses a device that would
+    share a board, capture file or results directory with one already
+    registered, since the two would overwrite each other.
+    """
+
+    def __init__(self, devices=()):
+        self.devices = {}
+        for device in devices:
+            self.add(device)
+
+    @classmethod
+    def from_json(cls, file_path):
+        """Registry from a JSON file of the form shown in the module docstring."""
+        with open(file_path, 'r') as f:
+            config = json.load(f)
+        return cls(Device(**entry) for entry in config["devices"])
+
+    def add(self, device):
+        """
+        Register device.
+
+        Raises:
+            ValueError: If the name, board, capture file or results directory
+            is already taken, or two boards could not be told apart.
+        """
+        if device.name in self.devices:
+            raise ValueError(f"Duplicate device name '{device.name}'")
+        for other in self.devices.values():
+            if device.cable is None and device.instance is None or other.cable is None and other.instance is None:
+                raise ValueError(f"Devices '{other.name}' and '{device.name}' need a cable or instance "
+                                 "to tell their boards apart")
+            if (device.cable, device.instance) == (other.cable, other.instance):
+                raise ValueError(f"Devices '{other.name}' and '{device.name}' use the same board")
+            for field in ("capture_path", "results_path"):
+                mine, theirs = getattr(device, field), getattr(other, field)
+                if mine is not None and theirs is not None and os.path.abspath(mine) == os.path.abspath(theirs):
+                    raise ValueError(f"Devices '{other.name}' and '{device.name}' share {field} {mine}")
+        self.devices[device.name] = device
+
+    def remove(self, name):
+        del self.devices[name]
+
+    def __getitem__(self, name):
+        return self.devices[name]
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __len__(self):
+        return len(self.devices)
+
+
+class DeviceWorker:
+    """
+    One device's session, scheduler, pipeline, statistics and results store.
+    Created and driven by DeviceManager.
+    """
+
+    def __init__(self, device, trigger_phrase, gate=None, popen=subprocess.Popen, on_shot=None, shots=None):
+        self.device = device
+        self.on_shot = on_shot
+        self.shots = shots
+        self.stats = FlowrateStatistics()
+        self.store = ResultsStore(device.results_path) if device.results_path else None
+        self.errors = 0
+        self.last_error = None
+        self.scheduler = AcquisitionScheduler(device.target_rate)
+        self.session = NiosSession(device.shell_path, device.elf_path, trigger_phrase,
+                                   capture_path=device.capture_path, popen=popen,
+                                   cable=device.cable, instance=device.instance)
+        self.pipeline = ShotPipeline(self.read_frame, self.compute_flowrate, self.publish_shot, trigger_phrase,
+                                     inv=device.inv, gate=gate)
+
+    def read_frame(self):
+        """Source of the pipeline: the next raw frame, or None to end the run."""
+        if self.shots is not None and self.session.frames >= self.shots:
+            return None
+        try:
+            return self.scheduler.acquire(self.session.read_raw_frame, self.session)
+        except RuntimeError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print(f"Error reading from device {self.device.name}: {e}")
+            return None
+
+    def compute_flowrate(self, shot):
+        device = self.device
+        flowrate, shot.speed_sound = calculate_flowrate(shot.downstream, shot.upstream, shot.time_lag,
+                                                        device.pipe_dia_inner, device.pipe_dia_outer,
+                                                        device.speed_sound_pipe, device.speed_sound_medium)
+        return flowrate
+
+    def publish_shot(self, shot):
+        self.stats.add(shot.flowrate)
+        if self.store is not None:
+            self.store.append(shot.flowrate, shot.time_lag, shot.temperature, shot.speed_sound,
+                              self.device.capture_path or self.device.name)
+        if self.on_shot:
+            self.on_shot(self.device.name, shot)
+
+    def start(self):
+        kill_stale_terminals(self.device.cable, self.device.instance)
+        self.pipeline.start()
+
+    def stop(self):
+        self.pipeline.stop()
+        self.session.close()
+
+    def close(self):
+        self.stop()
+        if self.store is not None:
+            self.store.close()
+
+    def summary(self):
+        """Flowrate statistics, pipeline stage stats, acquisition pacing and connection counters of this device."""
+        return {
+            "flowrate": self.stats.snapshot(),
+            "pipeline": self.pipeline.summary(),
+            "acquisition": self.scheduler.snapshot(),
+            "frames": self.session.frames,
+            "connects": self.session.connects,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class DeviceManager:
+    """
+    Runs every device in a registry at the same time, each on its own session
+    and pipeline threads, and collects the results per device.
+
+    Args:
+        registry (DeviceRegistry): Devices to run.
+        trigger_phrase (str): Line prefix that marks the start of a frame.
+        gate: Passed to every ShotPipeline, e.g. an echo_gate.EchoGate.
+            Its counters are then shared by all devices.
+        popen: Passed to every NiosSession.
+        on_shot: Called as on_shot(device_name, shot) for every finished shot,
+            from that device's publish thread.
+        shots (int): Stop each device after this many frames; None runs until stop.
+    """
+
+    def __init__(self, registry, trigger_phrase="== IT'S ALIVE ==", gate=None, popen=subprocess.Popen,
+                 on_shot=None, shots=None):
+        self.registry = registry
+        self.trigger_phrase = trigger_phrase
+        self.gate = gate
+        self.popen = popen
+        self.on_shot = on_shot
+        self.shots = shots
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start every registered device."""
+        with self.lock:
+            for device in self.registry:
+                if device.name in self.workers:
+                    continue
+                worker = DeviceWorker(device, self.trigger_phrase, self.gate, self.popen, self.on_shot, self.shots)
+                self.workers[device.name] = worker
+                worker.start()
+
+    def stop(self):
+        """Stop every device. Results stores are closed by close."""
+        with self.lock:
+            for worker in self.workers.values():
+                worker.stop()
+
+    def close(self):
+        with self.lock:
+            for worker in self.workers.values():
+                worker.close()
+            self.workers = {}
+
+    def wait(self, timeout=None):
+        """Wait until every device has finished; returns False if the timeout expired first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in list(self.workers.values()):
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not worker.pipeline.wait(remaining):
+                return False
+        return True
+
+    def summary(self):
+        """summary() of every device, by name."""
+        return {name: worker.summary() for name, worker in self.workers.items()}
+
+
+def format_summary(summary):
+    """One line per device for the console."""
+    lines = []
+    for name, device in summary.items():
+        flow = device["flowrate"]
+        line = (f"{name}: {device['frames']} frames, flowrate {flow['mean']:.4f} ± {flow['std']:.4f} "
+                f"(EMA {flow['ema']:.4f}), {flow['outliers']} outliers, {device['connects']} connects")
+        acquisition = device["acquisition"]
+        line += (f", {acquisition['rate']:.2f} shots/s, {acquisition['missed']} missed deadlines, "
+                 f"waiting {acquisition['waiting']:.0%}")
+        if device["last_error"]:
+            line += f", last error: {device['last_error']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("config", help="JSON file listing the devices")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between summaries")
+    parser.add_argument("--shots", type=int, default=None, help="frames per device; default runs until Ctrl+C")
+    parser.add_argument("--trigger-phrase", default="== IT'S ALIVE ==")
+    parser.add_argument("--metrics", default=None,
+                        help="export stage timings here, as Prometheus text (.prom) or JSON lines")
+    args = parser.parse_args()
+
+    try:
+        registry = DeviceRegistry.from_json(args.config)
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        parser.error(f"invalid device configuration: {e}")
+
+    if args.metrics:
+        metrics.enable(args.metrics, args.interval)
+    manager = DeviceManager(registry, args.trigger_phrase, shots=args.shots)
+    manager.start()
+    try:
+        while not manager.wait(args.interval):
+            print(format_summary(manager.summary()), file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        summary = manager.summary()
+        manager.close()
+        metrics.METRICS.stop_exporter()
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
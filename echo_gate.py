@@ -0,0 +1,94 @@
+"""
+Region-of-interest gating: find the echo in a shot and crop both channels to
+a padded window around it before they are filtered and correlated.
+
+Only a few hundred of the 16k samples in a record hold the echo, so filtering
+and correlating the window instead of the whole record saves most of the
+per-shot DSP. Both channels are cropped to the same window, so their lag and
+the absolute 'Second' times are unchanged. When there is no clear echo the
+full record is used.
+"""
+import numpy as np
+
+
+class EchoGate:
+    """
+    Envelope/threshold echo detector.
+
+    The envelope is the peak |voltage - mean| over blocks of block samples,
+    which is one vectorised pass over the record. The echo is the run from
+    the first to the last block whose envelope reaches threshold times the
+    largest one, taken over both channels and widened by pad samples on each
+    side. If the largest block is less than min_snr times the median block
+    (the noise floor) there is no distinct echo and window returns None.
+
+    Args:
+        threshold (float): Fraction of the peak envelope that counts as echo.
+            Keep it at or below the 10% used by calculate_average_time_of_flight
+            so the time of flight sees the whole echo.
+        min_snr (float): Peak to noise-floor ratio needed to gate at all.
+        pad (int): Samples kept on either side of the echo; covers the filter
+            transients and the largest lag that will be searched.
+        block (int): Samples per envelope block.
+    """
+
+    def __init__(self, threshold=0.1, min_snr=4.0, pad=512, block=64):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.min_snr = min_snr
+        self.pad = pad
+        self.block = block
+        self.gated = 0
+        self.fallbacks = 0
+
+    def envelope(self, *voltages):
+        """
+        Peak |voltage - mean| of every block, over all the given channels of
+        equal length; the last block may be short.
+        """
+        voltages = np.atleast_2d(np.asarray(voltages, dtype=np.float64))
+        deviation = np.abs(voltages - voltages.mean(axis=1, keepdims=True))
+        full = deviation.shape[1] // self.block * self.block
+        envelope = deviation[:, :full].reshape(len(deviation), -1, self.block).max(axis=(0, 2))
+        if full < deviation.shape[1]:
+            envelope = np.append(envelope, deviation[:, full:].max())
+        return envelope
+
+    def window(self, *voltages):
+        """
+        (start, stop) sample indices of the padded echo window common to all
+        the channels, or None to use the full record.
+        """
+        length = min(len(voltage) for voltage in voltages)
+        if length < 2 * self.block:
+            self.fallbacks += 1
+            return None
+        envelope = self.envelope(*(voltage[:length] for voltage in voltages))
+        peak = envelope.max()
+        floor = np.median(envelope)
+        if peak == 0 or peak < self.min_snr * floor:
+            self.fallbacks += 1
+            return None
+        echo = np.flatnonzero(envelope >= self.threshold * peak)
+        start = max(0, int(echo[0]) * self.block - self.pad)
+        stop = min(length, (int(echo[-1]) + 1) * self.block + self.pad)
+        self.gated += 1
+        return start, stop
+
+    def crop(self, upstream_data, downstream_data):
+        """
+        Crop two (sample, voltage) arrays to their echo window. Returns them
+        unchanged when window finds no echo.
+        """
+        window = self.window(np.asarray(upstream_data).reshape(-1, 2)[:, 1],
+                             np.asarray(downstream_data).reshape(-1, 2)[:, 1])
+        if window is None:
+            return upstream_data, downstream_data
+        start, stop = window
+        return upstream_data[start:stop], downstream_data[start:stop]
+
+    def summary(self):
+        """Counters as a short line of text for display."""
+        total = self.gated + self.fallbacks
+        return f"echo gate: {self.gated} of {total} shots gated, {self.fallbacks} on the full record"
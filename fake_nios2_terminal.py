@@ -0,0 +1,48 @@
+"""
+Stand-in for nios2-terminal that replays a recorded capture to stdout.
+
+The banner is printed straight away, then the tool pauses as if the board
+were measuring and streams the readings line by line, the way the JTAG UART
+delivers them.
+
+Usage:
+    python fake_nios2_terminal.py [capture_file] [--start-delay S] [--line-delay S] [--repeat N]
+"""
+import argparse
+import sys
+import time
+
+
+def replay(lines, out, start_delay, line_delay, trigger_phrase="== IT'S ALIVE =="):
+    """Write lines to out, waiting start_delay before the trigger and line_delay per line after it."""
+    started = False
+    for line in lines:
+        if not started and line.strip().startswith(trigger_phrase):
+            time.sleep(start_delay)
+            started = True
+        out.write(line)
+        out.flush()
+        if started and line_delay:
+            time.sleep(line_delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture_file", nargs="?", default="example.txt")
+    parser.add_argument("--start-delay", type=float, default=1.0,
+                        help="seconds before the trigger phrase is printed")
+    parser.add_argument("--line-delay", type=float, default=0.0001,
+                        help="seconds between lines once the readings start")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="number of times to replay the readings")
+    args = parser.parse_args()
+
+    with open(args.capture_file, 'r') as f:
+        lines = f.readlines()
+
+    for _ in range(args.repeat):
+        replay(lines, sys.stdout, args.start_delay, args.line_delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+# Numbers from one shot, posted by the measurement thread for the text output;
+# stats is a FlowrateStatistics.snapshot() taken after the shot
+ShotResult = namedtuple("ShotResult", ["flowrate", "temperature", "time_lag", "stats"])
+
+
+class UpdateQueue:
+    """
+    Hand-off from worker threads to the Tk main loop. Tk may only be used
+    from the thread running mainloop, so workers post() results here and
+    the GUI drains them from a root.after callback (see poll()).
+
+    Updates are keyed by what they refresh (e.g. 'waveforms', 'text'). Only
+    the newest update per key is kept: posting a key that is still waiting
+    replaces it (counted in coalesced), so at most one update per key waits
+    and the queue is bounded by the number of keys. post() never blocks, so
+    a slow UI cannot hold up the measurement loop.
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()  # key -> value, oldest first
+        self.lock = threading.Lock()
+        self.posted = 0
+        self.delivered = 0
+        self.coalesced = 0
+
+    def post(self, key, value):
+        """Queue value for key from any thread, replacing an undelivered value for the same key."""
+        with self.lock:
+            self.posted += 1
+            if key in self.pending:
+                self.coalesced += 1
+                del self.pending[key]  # Re-queue at the back, it is the newest update now
+            self.pending[key] = value
+
+    def drain(self):
+        """Remove and return all waiting updates as a list of (key, value), oldest first."""
+        with self.lock:
+            items = list(self.pending.items())
+            self.pending.clear()
+            self.delivered += len(items)
+        return items
+
+    def poll(self, root, handler, interval_ms=50):
+        """
+        Call handler(key, value) for every waiting update on the Tk thread,
+        then check again every interval_ms for as long as root exists.
+        Must be started from the Tk thread.
+        """
+        for key, value in self.drain():
+            try:
+                handler(key, value)
+            except Exception as e:
+                print(f"Error handling {key} update: {e}")
+        root.after(interval_ms, self.poll, root, handler, interval_ms)
+
+    def stats(self):
+        """Counters as a dict, e.g. for display or logging."""
+        with self.lock:
+            return {
+                "posted": self.posted,
+                "delivered": self.delivered,
+                "coalesced": self.coalesced,
+                "waiting": len(self.pending),
+            }
@@ -0,0 +1,243 @@
+import time
+
+import numpy as np
+
+from metrics import observe
+
+
+def decimate_minmax(x, y, bins=800):
+    """
+    Reduce (x, y) to at most 2 * bins points for drawing. Each bin keeps its
+    minimum and maximum in time order, so peaks stay visible.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= 2 * bins:
+        return x, y
+
+    per_bin = len(y) // bins
+    used = per_bin * bins
+    x_bins = x[:used].reshape(bins, per_bin)
+    y_bins = y[:used].reshape(bins, per_bin)
+    low = y_bins.argmin(axis=1)
+    high = y_bins.argmax(axis=1)
+    first = np.minimum(low, high)
+    second = np.maximum(low, high)
+    rows = np.arange(bins)
+
+    x_out = np.column_stack((x_bins[rows, first], x_bins[rows, second])).ravel()
+    y_out = np.column_stack((y_bins[rows, first], y_bins[rows, second])).ravel()
+    return x_out, y_out
+
+
+def prepare_waveforms(downstream_df, upstream_df, bins=800):
+    """Decimated (time, original, filtered) arrays for both channels, ready for WaveformPanel."""
+    channels = []
+    for waveform in (downstream_df, upstream_df):
+        time_values = waveform.time
+        original = decimate_minmax(time_values, waveform.voltage, bins)
+        filtered = decimate_minmax(time_values, waveform.filtered, bins)
+        channels.append((original, filtered))
+    return channels
+
+
+def prepare_cross_correlation(time_lags, cross_corr, time_lag, bins=800):
+    """Decimated correlation curve and the lag of its peak, ready for CrossCorrelationPanel."""
+    return decimate_minmax(time_lags, cross_corr, bins), time_lag
+
+
+def prepare_flowrates(store, start=None, bins=800):
+    """
+    Flowrate history since start from a ResultsStore, ready for FlowratePanel.
+    Long histories are reduced to at most bins points (bin means); the
+    cumulative average is exact. The store updates the bins as shots are
+    appended, so this does not slow down as the run grows.
+    """
+    history = store.history(start, bins)
+    return history["index"] + 1, history["mean"], history["cumulative_mean"]
+
+
+class BlitPanel:
+    """
+    A matplotlib Figure embedded in Tk that is created once and then updated
+    in place. Artists registered with animate() are redrawn on top of a cached
+    background and blitted; the whole figure is only redrawn when the axes
+    limits have to change.
+
+    render_time holds the duration of the last update in seconds.
+    matplotlib is imported by the first panel created, not by this module, so
+    the prepare_* functions stay cheap to import.
+    """
+
+    def __init__(self, parent, figsize, dpi=100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=parent)
+        self.widget = self.canvas.get_tk_widget()
+        self.animated = []
+        self.background = None
+        self.render_time = 0.0
+        self.full_redraws = 0
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def animate(self, artist):
+        """Mark artist as updated every frame and return it."""
+        artist.set_animated(True)
+        self.animated.append(artist)
+        return artist
+
+    def _on_draw(self, event):
+        # Everything static has been drawn; keep it and put the animated artists on top
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+
+    @staticmethod
+    def fit_axes(ax, x, y, margin=0.1):
+        """
+        Make sure (x, y) is inside ax. The limits are kept while the data still
+        fills at least half of them, so most frames can be blitted.
+
+        Returns:
+            bool: True if the limits changed and a full redraw is needed.
+        """
+        if len(x) == 0:
+            return False
+        x_low, x_high = float(np.min(x)), float(np.max(x))
+        y_low, y_high = float(np.min(y)), float(np.max(y))
+        x_span = (x_high - x_low) or 1.0
+        y_span = (y_high - y_low) or 1.0
+
+        (ax_x_low, ax_x_high), (ax_y_low, ax_y_high) = ax.get_xlim(), ax.get_ylim()
+        inside = (ax_x_low <= x_low and x_high <= ax_x_high and ax_y_low <= y_low and y_high <= ax_y_high)
+        filled = y_span >= 0.5 * (ax_y_high - ax_y_low) and x_span >= 0.5 * (ax_x_high - ax_x_low)
+        if inside and filled:
+            return False
+
+        ax.set_xlim(x_low - margin * x_span, x_high + margin * x_span)
+        ax.set_ylim(y_low - margin * y_span, y_high + margin * y_span)
+        return True
+
+    def redraw(self, full):
+        """Blit the animated artists, or redraw everything if full or nothing is cached yet."""
+        if full or self.background is None:
+            self.full_redraws += 1
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+        self.canvas.blit(self.figure.bbox)
+
+    def timed_update(self, update, *args):
+        """Run update(*args) and record how long it took in render_time."""
+        start = time.perf_counter()
+        update(*args)
+        self.render_time = time.perf_counter() - start
+        observe("render", self.render_time)
+
+
+class WaveformPanel(BlitPanel):
+    """Original and filtered downstream/upstream waveforms."""
+
+    def __init__(self, parent, figsize=(8, 4)):
+        super().__init__(parent, figsize)
+        self.axes = self.figure.subplots(2, 1)
+        self.lines = []
+        for ax, name in zip(self.axes, ("Downstream", "Upstream")):
+            original, = ax.plot([], [], label=f"{name} Original", alpha=0.7)
+            filtered, = ax.plot([], [], label=f"{name} Filtered", linewidth=2)
+            self.lines.append((self.animate(original), self.animate(filtered)))
+            ax.set_xlabel("Time (Seconds)")
+            ax.set_ylabel("Voltage (Volts)")
+            ax.set_title(f"{name} Data")
+            ax.legend(loc="upper right")
+            ax.grid()
+        self.figure.tight_layout()
+
+    def update(self, channels):
+        """Show the output of prepare_waveforms."""
+        self.timed_update(self._update, channels)
+
+    def _update(self, channels):
+        full = False
+        for ax, lines, data in zip(self.axes, self.lines, channels):
+            for line, (x, y) in zip(lines, data):
+                line.set_data(x, y)
+            x = np.concatenate([x for x, _ in data])
+            y = np.concatenate([y for _, y in data])
+            full = self.fit_axes(ax, x, y) or full
+        self.redraw(full)
+
+
+class CrossCorrelationPanel(BlitPanel):
+    """Cross-correlation against time lag with a marker at the peak."""
+
+    def __init__(self, parent, figsize=(8, 4)):
+        super().__init__(parent, figsize)
+        self.ax = self.figure.subplots()
+        self.curve = self.animate(self.ax.plot([], [], label='Cross-Correlation')[0])
+        self.marker = self.animate(self.ax.axvline(0, color='r', linestyle='--', label='Max'))
+        self.ax.set_title('Cross-Correlation vs Time Lag')
+        self.ax.set_xlabel('Time Lag (s)')
+        self.ax.set_ylabel('Cross-Correlation Amplitude')
+        self.ax.legend(loc="upper right")
+        self.ax.grid()
+        self.figure.tight_layout()
+
+    def update(self, prepared):
+        """Show the output of prepare_cross_correlation."""
+        self.timed_update(self._update, prepared)
+
+    def _update(self, prepared):
+        (x, y), time_lag = prepared
+        self.curve.set_data(x, y)
+        self.marker.set_xdata([time_lag, time_lag])
+        self.redraw(self.fit_axes(self.ax, x, y))
+
+
+class FlowratePanel(BlitPanel):
+    """Flowrate history with its cumulative average and the newest average value."""
+
+    def __init__(self, parent, figsize=(8, 4)):
+        super().__init__(parent, figsize)
+        self.ax = self.figure.subplots()
+        self.points = self.animate(self.ax.plot([], [], 'o', label='Flowrate Points')[0])
+        self.average = self.animate(self.ax.plot([], [], 'r-', label='Cumulative Average')[0])
+        self.label = self.animate(self.ax.text(0, 0, '', color='red', fontsize=10, ha='right', va='bottom'))
+        self.ax.set_title('Flowrate vs Index with Cumulative Average')
+        self.ax.set_xlabel('Index')
+        self.ax.set_ylabel('Flowrate')
+        self.ax.legend(loc="upper right")
+        self.ax.grid()
+        self.figure.tight_layout()
+
+    def update(self, prepared):
+        """Show the output of prepare_flowrates."""
+        self.timed_update(self._update, prepared)
+
+    def _update(self, prepared):
+        indices, flowrates, flow_average = prepared
+        self.points.set_data(indices, flowrates)
+        self.average.set_data(indices, flow_average)
+        if len(flow_average) > 0:
+            self.label.set_position((indices[-1], flow_average[-1]))
+            self.label.set_text(f'{flow_average[-1]:.2f}')
+        else:
+            self.label.set_text('')
+
+        # The index axis grows every shot; leave headroom so most frames can be blitted
+        full = False
+        if len(indices) > 0:
+            x_high = self.ax.get_xlim()[1]
+            if indices[-1] >= x_high or x_high > 2 * indices[-1] + 10:
+                self.ax.set_xlim(0, 2 * indices[-1] + 10)
+                full = True
+            values = np.concatenate((flowrates, flow_average))
+            y_low, y_high = self.ax.get_ylim()
+            if len(indices) == 1 or values.min() < y_low or values.max() > y_high:
+                span = (values.max() - values.min()) or abs(values.max()) or 1.0
+                self.ax.set_ylim(values.min() - 0.25 * span, values.max() + 0.25 * span)
+                full = True
+        self.redraw(full)
@@ -1,7 +1,6 @@
-import subprocess
 import psutil
-import new_txt_read
-import time
+import nios_terminal
+import multishot
 
 
 def kill_process_by_name(process_name):
@@ -28,32 +27,18 @@ def kill_process_by_name(process_name):
 kill_process_by_name('nios2-terminal.exe')
 
 bat_file_path = "C:\\intelFPGA_lite\\18.0\\nios2eds\\Nios II Command Shell.bat"
-process = subprocess.Popen([bat_file_path], text=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
 # C:\Users\nwalt\Downloads\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD\Demonstrations\FPGA\DE1_SoC_SDRAM_Nios_Test\software\DE1_SoC_SDRAM_Nios_Test
 
-#downloadCmd = "nios2-download -g C:\\\\Users\\\\nwalt\\\\Downloads\\\\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD" \
-#              "\\\\Demonstrations\\\\FPGA\\\\DE1_SoC_SDRAM_Nios_Test\\\\software\\\\DE1_SoC_SDRAM_Nios_Test" \
-#              "\\\\DE1_SoC_SDRAM_Nios_Test.elf\r\nnios2-terminal > readings.txt "
-
-downloadCmd = "nios2-download -g C:\\\\Users\\\\nwalt\\\\Downloads\\\\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD\\\\Demonstrations\\\\FPGA\\\\DE1_SoC_SDRAM_Nios_Test\\\\software\\\\DE1_SoC_SDRAM_Nios_Test\\\\DE1_SoC_SDRAM_Nios_Test.elf\r\nnios2-terminal > readings.txt"
-
-# Send the input
-try:
-    process.communicate(input=downloadCmd, timeout=10)
-except subprocess.TimeoutExpired:
-    pass
-
-process.kill()
-
-# file_path = 'readings.txt'
-# # Open the file and read its content
-# with open(file_path, 'r') as file:
-#     for line in file:
-#         print(line, end='')
-
-time.sleep(5)
+elf_path = "C:\\\\Users\\\\nwalt\\\\Downloads\\\\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD\\\\Demonstrations\\\\FPGA\\\\DE1_SoC_SDRAM_Nios_Test\\\\software\\\\DE1_SoC_SDRAM_Nios_Test\\\\DE1_SoC_SDRAM_Nios_Test.elf"
 
 trigger_phrase = "== IT'S ALIVE =="  # or another trigger phrase
-downstream_data, upstream_data, temperature, img = new_txt_read.process_data_file("readings.txt", trigger_phrase)
 
+shots = 8  # Frames combined into one multi-shot measurement
+multishot_mode = "coherent"  # or "median", see multishot.py
+
+# Download the firmware once and keep the terminal attached; the raw frame is kept in readings.txt
+with nios_terminal.NiosSession(bat_file_path, elf_path, trigger_phrase, capture_path="readings.txt") as session:
+    frames = multishot.collect_frames(session.read_frame, shots)
+    result = multishot.multishot_lag(frames, multishot_mode)
+    print(f"Time lag over {result.shots} shots ({multishot_mode}): {result.time_lag} s")
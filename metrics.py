@@ -0,0 +1,253 @@
+"""
+Timing instrumentation for the measurement path.
+
+Code is wrapped in named timers, either as a context manager or a decorator:
+
+    from metrics import timer, timed
+
+    with timer("spawn"):
+        ...
+
+    @timed("filter")
+    def process_capture_data(...):
+        ...
+
+Every name keeps a histogram with log-spaced buckets, from which p50/p95 are
+estimated, plus the exact count, sum and max. Metrics are off by default;
+then a timer is a shared do-nothing object and a decorated function costs one
+attribute check. enable() switches them on, export() writes a Prometheus text
+file (.prom, for the node_exporter textfile collector) or appends JSON lines
+(anything else).
+
+Stage names used in this repo: kill, spawn, download, pace, capture, parse,
+filter, correlate, multishot, flow and render.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# Bucket upper bounds in seconds: 10 per decade from 1 us to 100 s
+BUCKET_BOUNDS = [10 ** (exponent / 10) for exponent in range(-60, 21)]
+
+
+class Histogram:
+    """Distribution of durations in seconds with fixed log-spaced buckets."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Estimate of the q-quantile (0..1), interpolated geometrically inside
+        its bucket and clamped to the observed min and max. NaN when empty.
+        """
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = BUCKET_BOUNDS[i - 1] if i > 0 else self.min
+                upper = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                fraction = (rank - seen) / bucket_count
+                estimate = lower * (upper / lower) ** fraction if lower > 0 else upper * fraction
+                return min(max(estimate, self.min), self.max)
+            seen += bucket_count
+        return self.max
+
+    def snapshot(self):
+        """count, sum, mean, p50, p95 and max as a dict."""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else float("nan"),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+        }
+
+
+class _NullTimer:
+    """What timer() returns while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """
+    Named duration histograms. Safe to use from several threads.
+
+    Args:
+        enabled (bool): Record observations; when False every call returns
+            straight away.
+        prefix (str): Metric name prefix for the Prometheus export.
+    """
+
+    def __init__(self, enabled=False, prefix="flovis"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self._exporter = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def observe(self, name, seconds):
+        """Record one duration under name."""
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name):
+        """Context manager that records the time spent in its block under name."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decorator that records the time spent in every call under name, including calls that raise."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        """Histogram.snapshot() of every name."""
+        with self.lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())}
+
+    def to_prometheus(self):
+        """All histograms in the Prometheus text exposition format, labelled by stage."""
+        name = f"{self.prefix}_stage_seconds"
+        lines = [f"# HELP {name} Time spent in each stage of the measurement.", f"# TYPE {name} histogram"]
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            for stage, histogram in histograms:
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKET_BOUNDS + [float("inf")], histogram.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total:.9g}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            for statistic in ("p50", "p95", "max"):
+                lines.append(f"# TYPE {name}_{statistic} gauge")
+                for stage, histogram in histograms:
+                    value = histogram.max if statistic == "max" else histogram.quantile(0.5 if statistic == "p50" else 0.95)
+                    lines.append(f'{name}_{statistic}{{stage="{stage}"}} {value:.9g}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self, timestamp=None):
+        """One JSON object per stage with its snapshot, stamped with timestamp (default now)."""
+        timestamp = time.time() if timestamp is None else timestamp
+        return "".join(json.dumps({"time": timestamp, "stage": stage, **snapshot}) + "\n"
+                       for stage, snapshot in self.snapshot().items())
+
+    def export(self, path):
+        """
+        Write the metrics to path: a .prom file is replaced atomically with the
+        Prometheus text, any other file gets the JSON lines appended.
+        """
+        if path.endswith(".prom"):
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as f:
+                f.write(self.to_prometheus())
+            os.replace(temporary, path)
+        else:
+            with open(path, 'a') as f:
+                f.write(self.to_json_lines())
+
+    def start_exporter(self, path, interval=10.0):
+        """Export to path every interval seconds on a daemon thread until stop_exporter."""
+        self.stop_exporter()
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.export(path)
+                except OSError as e:
+                    print(f"Error exporting metrics to {path}: {e}")
+
+        self._exporter = (stop, path)
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_exporter(self):
+        """Stop the exporter thread, writing one last export."""
+        if self._exporter is None:
+            return
+        stop, path = self._exporter
+        self._exporter = None
+        stop.set()
+        try:
+            self.export(path)
+        except OSError as e:
+            print(f"Error exporting metrics to {path}: {e}")
+
+
+# The metrics the rest of the repo reports to
+METRICS = Metrics()
+timer = METRICS.timer
+timed = METRICS.timed
+observe = METRICS.observe
+
+
+def enable(path=None, interval=10.0):
+    """Turn METRICS on and, if path is given, export them there every interval seconds."""
+    METRICS.enable()
+    if path:
+        METRICS.start_exporter(path, interval)
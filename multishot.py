@@ -0,0 +1,105 @@
+"""
+Multi-shot measurements: K frames of the same flow are stacked into (K, N)
+arrays and combined into one time lag.
+
+Two ways of combining the shots:
+    'coherent' averages the raw waveforms first. Noise that is uncorrelated
+        between shots drops by sqrt(K) and only one pair of channels has to
+        be filtered and correlated.
+    'median' correlates every shot on its own and takes the median of the
+        per-shot lags, which ignores a minority of bad shots. It costs about
+        as much as K separate time_lag_cross_correlation calls.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from new_txt_read import butter_lowpass_filter
+from new_tof_and_cross_corr import correlation_peak
+from metrics import timed
+
+MULTISHOT_MODES = ("coherent", "median")
+
+# time_lag in seconds; shot_lags holds every shot's lag in 'median' mode and is None for 'coherent'
+MultiShotResult = namedtuple("MultiShotResult", ["time_lag", "shot_lags", "temperature", "shots"])
+
+
+def collect_frames(read_frame, shots):
+    """Call read_frame (e.g. NiosSession.read_frame) shots times and return the frames as a list."""
+    return [read_frame() for _ in range(shots)]
+
+
+def stack_frames(frames, skip=25, inv=0, gate=None):
+    """
+    Stack the voltages of K frames into (K, N) arrays.
+
+    Args:
+        frames (list): (upstream_data, downstream_data, temperature) tuples as
+            returned by parse_capture_file or NiosSession.read_frame.
+        skip (int): Initial samples to drop, as in process_capture_data.
+        inv (int): Swap upstream and downstream, as in process_capture_data.
+        gate (EchoGate): Crop every row to one echo window found over all
+            the channels, so the lags between rows stay comparable.
+
+    Returns:
+        tuple: (upstream, downstream, temperatures). Every row is cut to the
+        shortest channel so the stacks are rectangular.
+
+    Raises:
+        ValueError: If there are no frames or a channel is empty.
+    """
+    if not frames:
+        raise ValueError("No frames to stack")
+    upstream = [np.asarray(frame[0])[skip:, 1] for frame in frames]
+    downstream = [np.asarray(frame[1])[skip:, 1] for frame in frames]
+    if inv != 0:
+        upstream, downstream = downstream, upstream
+    length = min(len(channel) for channel in upstream + downstream)
+    if length == 0:
+        raise ValueError("A frame has an empty channel")
+    temperatures = [frame[2] for frame in frames]
+    upstream = np.vstack([channel[:length] for channel in upstream])
+    downstream = np.vstack([channel[:length] for channel in downstream])
+    window = gate.window(*upstream, *downstream) if gate is not None else None
+    if window is not None:
+        upstream, downstream = upstream[:, window[0]:window[1]], downstream[:, window[0]:window[1]]
+    return upstream, downstream, temperatures
+
+
+@timed("multishot")
+def multishot_lag(frames, mode="coherent", cutoff=1000000, fs=50e6, max_lag=None, inv=0, causal=False,
+                  gate=None):
+    """
+    Time lag between upstream and downstream from K frames of the same flow.
+
+    Args:
+        frames (list): Frames as for stack_frames.
+        mode (str): 'coherent' or 'median', see the module docstring.
+        cutoff (float): Low-pass cutoff in Hz, as in process_capture_data.
+        fs (float): Sample rate in Hz.
+        max_lag (int): Only search lags within +/- max_lag samples.
+        inv (int): Swap upstream and downstream.
+        causal (bool): Forward-only filtering, see butter_lowpass_filter.
+        gate (EchoGate): Crop to the echo window first, see stack_frames.
+
+    Returns:
+        MultiShotResult
+    """
+    if mode not in MULTISHOT_MODES:
+        raise ValueError(f"Unknown multi-shot mode '{mode}', expected one of {MULTISHOT_MODES}")
+    upstream, downstream, temperatures = stack_frames(frames, inv=inv, gate=gate)
+    known = [t for t in temperatures if t is not None]
+    temperature = float(np.mean(known)) if known else None
+
+    if mode == "coherent":
+        # The filter is linear, so averaging first and filtering once gives the same result
+        filtered = butter_lowpass_filter(np.vstack((upstream.mean(axis=0), downstream.mean(axis=0))),
+                                         cutoff, fs, axis=1, causal=causal)
+        lag, _, _ = correlation_peak(filtered[0], filtered[1], "fft", max_lag)
+        return MultiShotResult(lag / fs, None, temperature, len(frames))
+
+    filtered = butter_lowpass_filter(np.vstack((upstream, downstream)), cutoff, fs, axis=1, causal=causal)
+    shots = len(upstream)
+    shot_lags = np.array([correlation_peak(us, ds, "fft", max_lag)[0]
+                          for us, ds in zip(filtered[:shots], filtered[shots:])]) / fs
+    return MultiShotResult(float(np.median(shot_lags)), shot_lags, temperature, shots)
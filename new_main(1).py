@@ -1,16 +1,18 @@
-import subprocess
 import psutil
-from new_txt_read import process_data_file, calculate_average_time_of_flight
+from new_txt_read import process_capture_data, calculate_flowrate, plot_waveforms
+from nios_terminal import NiosSession
+from rolling_stats import FlowrateStatistics, RunningStats
 import tkinter as tk
 from tkinter import StringVar
-from PIL import Image, ImageTk
 import io
-from new_tof_and_cross_corr import time_lag_cross_correlation, flow_from_lag, generate_flowrate_plot
-import math
-import numpy as np
-import matplotlib.pyplot as plt
-import os
-import time
+from new_tof_and_cross_corr import cross_correlation_data, plot_cross_correlation, generate_flowrate_plot
+from retry_policy import RetryPolicy
+
+BAT_FILE_PATH = "C:\\intelFPGA_lite\\18.0\\nios2eds\\Nios II Command Shell.bat"
+ELF_PATH = ("C:\\\\Users\\\\nwalt\\\\Downloads\\\\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD\\\\Demonstrations\\\\FPGA"
+            "\\\\DE1_SoC_SDRAM_Nios_Test\\\\software\\\\DE1_SoC_SDRAM_Nios_Test\\\\TOF.elf")
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+FLOW_RANGE = (0, 80)  # Plausible raw flowrates; shots outside are measured again
 
 
 def kill_process_by_name(process_name):
@@ -32,10 +34,15 @@ class CustomGUI:
 
         # Variables
         self.flowrates = []
+        self.flow_averages = []  # Cumulative average of every shot so far, as plotted
+        self.flow_total = RunningStats()
+        self.flow_stats = FlowrateStatistics()  # Averages with outliers left out
         self.pipe_dia_inner = .04  # Inner diameter
         self.pipe_dia_outer = .05  # Outer diameter
         self.speed_sound_pipe = 2400
         self.speed_sound_medium = 1500
+        self.session = None  # NiosSession kept open between presses
+        self.retry_policy = RetryPolicy(max_attempts=5, initial_delay=0.1, max_delay=2.0)
 
         # Left Frame for Inputs
         self.left_frame = tk.Frame(self.root, width=300, bg="lightgray")
@@ -79,8 +86,8 @@ class CustomGUI:
         self.image3_label = tk.Label(self.right_frame, width=450, height=350)
         self.image3_label.pack()
 
-        # Initialize images to a white box
-        self.initialize_images()
+        # PIL takes a moment to import; show the window first, then blank the displays
+        self.root.after(10, self.initialize_images)
 
         # Configure Grid
         self.root.grid_rowconfigure(0, weight=1)
@@ -93,6 +100,7 @@ class CustomGUI:
 
     def initialize_images(self):
         """Initialize images to a blank state."""
+        from PIL import Image, ImageTk
         white_box = Image.new("RGB", (450, 350), color="white")
         img_tk = ImageTk.PhotoImage(white_box)
 
@@ -108,11 +116,15 @@ class CustomGUI:
     def stop_pressed(self):
         """Clear all outputs."""
         self.flowrates = []  # Clear flowrates
+        self.flow_averages = []
+        self.flow_total = RunningStats()
+        self.flow_stats = FlowrateStatistics()
         self.initialize_images()  # Reset displays
         self.update_textout1("Outputs cleared.")
 
     def update_image(self, label, img_buffer):
         """Update a specific image label with a new image."""
+        from PIL import Image, ImageTk
         try:
             img = Image.open(io.BytesIO(img_buffer.getvalue()))
             img = img.resize((450, 350))
@@ -130,8 +142,9 @@ class CustomGUI:
         self.textout1.config(state='disabled')
 
     def run_pressed(self):
-        """Run the process once."""
-        kill_process_by_name('nios2-terminal.exe')  # Kill any existing processes
+        """Measure once, retrying rejected shots as allowed by the retry policy."""
+        if self.session is None:
+            kill_process_by_name('nios2-terminal.exe')  # Kill any existing processes
         #self.stop_pressed()  # Clear previous outputs
 
         # Update input variables
@@ -146,70 +159,86 @@ class CustomGUI:
             print("Invalid input values. Please enter valid numbers.")
             return
 
-        # Run the FPGA process
-        bat_file_path = "C:\\intelFPGA_lite\\18.0\\nios2eds\\Nios II Command Shell.bat"
-        process = subprocess.Popen([bat_file_path], text=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
-
-        download_cmd = (
-            "nios2-download -g C:\\\\Users\\\\nwalt\\\\Downloads\\\\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD\\\\Demonstrations\\\\FPGA"
-            "\\\\DE1_SoC_SDRAM_Nios_Test\\\\software\\\\DE1_SoC_SDRAM_Nios_Test\\\\TOF.elf\r\n"
-            "nios2-terminal > readings.txt"
-        )
-
-        try:
-            process.communicate(input=download_cmd, timeout=10)
-        except subprocess.TimeoutExpired:
-            print("Process timeout expired.")
-        finally:
-            process.kill()  # Ensure the process is terminated
-
-        # Wait for the file to be written
-        time.sleep(5)
-
-        # Process the readings file
-        trigger_phrase = "== IT'S ALIVE =="
+        # Attach to the board once; later presses reuse the open terminal
+        if self.session is None:
+            self.session = NiosSession(BAT_FILE_PATH, ELF_PATH, TRIGGER_PHRASE, capture_path="readings.txt")
+
+        # Measure, retrying implausible shots a bounded number of times
+        self.attempt_shot(1)
+
+    def measure_shot(self):
+        """
+        Read and process the next frame.
+
+        Returns:
+            tuple or None: (downstream_data, upstream_data, temperature,
+            time_lags, cross_corr, time_lag, flowrate), or None if the
+            flowrate is outside FLOW_RANGE.
+        """
+        frame = self.session.read_frame()
+        downstream_data, upstream_data, temperature, _ = process_capture_data(*frame, render=False)
+        time_lag, time_lags, cross_corr = cross_correlation_data(upstream_data, downstream_data)
+        flowrate, _ = calculate_flowrate(downstream_data, upstream_data, time_lag, self.pipe_dia_inner,
+                                         self.pipe_dia_outer, self.speed_sound_pipe, self.speed_sound_medium)
+
+        if flowrate < 0:
+            # Transducers the other way round: swapping the channels only negates the lag
+            downstream_data, upstream_data = upstream_data, downstream_data
+            time_lag, time_lags = -time_lag, -time_lags
+            flowrate = -flowrate
+        if not FLOW_RANGE[0] < flowrate < FLOW_RANGE[1]:
+            print(f"Rejected shot with flowrate {flowrate}")
+            return None
+        return downstream_data, upstream_data, temperature, time_lags, cross_corr, time_lag, flowrate
+
+    def attempt_shot(self, attempt):
+        """Try one measurement; on rejection schedule the next attempt after the policy's backoff."""
         try:
-            downstream_data, upstream_data, temperature, img_buffer = process_data_file("readings.txt", trigger_phrase)
-
-            time_lag, img_cc = time_lag_cross_correlation(upstream_data, downstream_data)
-
-            if self.speed_sound_medium != 0:
-                speed_sound = self.speed_sound_medium
-            else:
-                time_pipe = (self.pipe_dia_outer - self.pipe_dia_inner) / self.speed_sound_pipe
-                time_water = calculate_average_time_of_flight(downstream_data,
-                                                                           upstream_data) - 0.00003220801425 - time_pipe
-                speed_sound = time_water / math.sqrt(2) * self.pipe_dia_inner
-
-            flowrate = flow_from_lag(time_lag, math.sqrt(2) * self.pipe_dia_inner, speed_sound)
-
-            if flowrate < 0:
-                downstream_data, upstream_data, temperature, img_buffer = process_data_file("readings.txt",
-                                                                                            trigger_phrase,1)
-                time_lag, img_cc = time_lag_cross_correlation(upstream_data, downstream_data)
-                flowrate=flowrate*-1
-            if flowrate > 0 and flowrate < 80:
-                flowrate = (2 + 2*(flowrate/80)) * (0.038*0.038)/(self.pipe_dia_inner*self.pipe_dia_inner);
-                self.flowrates.append(flowrate)
-
-                img_flowrates_plot=generate_flowrate_plot(self.flowrates)
-
-                # Update images and text in the GUI
-                if img_buffer:
-                    self.update_image(self.image1_label, img_buffer)
-                self.update_image(self.image2_label, img_cc)
-                self.update_image(self.image4_label,img_flowrates_plot)
-                self.update_textout1(f"flowrate:\n{flowrate}\ntemperature:\n{temperature}°F\n")
-
-            else:
-                self.run_pressed();
-
+            shot = self.measure_shot()
         except Exception as e:
             print(f"Error processing data: {e}")
+            return
+
+        self.retry_policy.record(shot is not None, attempt)
+        if shot is not None:
+            self.show_shot(*shot)
+        elif self.retry_policy.should_retry(attempt):
+            delay_ms = int(self.retry_policy.delay(attempt + 1) * 1000)
+            self.root.after(delay_ms, self.attempt_shot, attempt + 1)
+        else:
+            print(f"No valid shot after {attempt} attempts")
+            self.update_textout1(f"No valid shot after {attempt} attempts\n{self.retry_policy.summary()}\n")
+
+    def show_shot(self, downstream_data, upstream_data, temperature, time_lags, cross_corr, time_lag, flowrate):
+        """Record an accepted shot and draw it."""
+        flowrate = (2 + 2*(flowrate/80)) * (0.038*0.038)/(self.pipe_dia_inner*self.pipe_dia_inner);
+        self.flowrates.append(flowrate)
+        self.flow_stats.add(flowrate)
+        self.flow_total.add(flowrate)
+        self.flow_averages.append(self.flow_total.mean)
+
+        img_buffer = plot_waveforms(downstream_data, upstream_data)
+        img_cc = plot_cross_correlation(time_lags, cross_corr, time_lag)
+        img_flowrates_plot=generate_flowrate_plot(self.flowrates, self.flow_averages)
+
+        # Update images and text in the GUI
+        if img_buffer:
+            self.update_image(self.image1_label, img_buffer)
+        self.update_image(self.image2_label, img_cc)
+        self.update_image(self.image4_label,img_flowrates_plot)
+        stats = self.flow_stats.snapshot()
+        self.update_textout1(f"flowrate:\n{flowrate}\ntemperature:\n{temperature}°F\n"
+                             f"cumulative average (all shots): {self.flow_total.mean:.4f}\n"
+                             f"average (outliers excluded): {stats['mean']:.4f}, "
+                             f"moving average: {stats['ema']:.4f}\n"
+                             f"median: {stats['median']:.4f} (MAD {stats['mad']:.4f})\n"
+                             f"outliers: {stats['outliers']} of {self.flow_total.count}\n"
+                             f"{self.retry_policy.summary()}\n")
 
     def on_close(self):
         """Handle GUI close event."""
+        if self.session is not None:
+            self.session.close()
         self.root.destroy()
 
 
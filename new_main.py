@@ -1,33 +1,30 @@
-import subprocess
-import psutil
-from new_txt_read import process_data_file, calculate_average_time_of_flight
+from new_txt_read import calculate_flowrate, preload
+from nios_terminal import NiosSession, kill_stale_terminals
 import tkinter as tk
 from tkinter import StringVar
-from PIL import Image, ImageTk
-import io
-from new_tof_and_cross_corr import time_lag_cross_correlation, flow_from_lag
-import math
+from plot_worker import PlotWorker
+from gui_queue import UpdateQueue, ShotResult
+from pipeline import ShotPipeline
+from echo_gate import EchoGate
+from scheduler import AcquisitionScheduler
+from results_store import ResultsStore
+from rolling_stats import FlowrateStatistics
+import metrics
+from live_plot import (WaveformPanel, CrossCorrelationPanel, FlowratePanel, prepare_waveforms,
+                       prepare_cross_correlation, prepare_flowrates)
 import threading
-import numpy as np
 import time
-import matplotlib as plt
-import os
 
+BAT_FILE_PATH = "C:\\intelFPGA_lite\\18.0\\nios2eds\\Nios II Command Shell.bat"
+ELF_PATH = "C:\\\\Users\\\\nwalt\\\\Downloads\\\\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD\\\\Demonstrations\\\\FPGA\\\\DE1_SoC_SDRAM_Nios_Test\\\\software\\\\DE1_SoC_SDRAM_Nios_Test\\\\DE1_SoC_SDRAM_Nios_Test.elf"
+CAPTURE_PATH = "C:\\Users\\nwalt\\Desktop\\EECE4792-FloVis-Automation\\readings.txt"
+TRIGGER_PHRASE = "== IT'S ALIVE =="
+RESULTS_PATH = "C:\\Users\\nwalt\\Desktop\\EECE4792-FloVis-Automation\\results"
+JTAG_CABLE = None  # Board to use when several are connected, e.g. "DE-SoC [USB-1]"; see devices.py for many boards
+JTAG_INSTANCE = None
+METRICS_PATH = None  # e.g. "stages.prom" or "stages.jsonl" to export stage timings, see metrics.py
+TARGET_SHOT_RATE = None  # Shots per second to pace acquisition to; None takes shots back to back, see scheduler.py
 
-def kill_process_by_name(process_name):
-    # Iterate over all running processes
-    for proc in psutil.process_iter(['pid', 'name']):
-        # Check if process name matches
-        if proc.info['name'] == process_name:
-            try:
-                psutil.Process(proc.info['pid']).terminate()
-                print(f"Terminated process {process_name} with PID {proc.info['pid']}")
-            except psutil.NoSuchProcess:
-                print(f"No such process: {process_name}")
-            except psutil.AccessDenied:
-                print(f"Access denied when trying to terminate {process_name}")
-            except Exception as e:
-                print(f"Error terminating process {process_name}: {e}")
 
 class CustomGUI:
     def __init__(self):
@@ -36,12 +33,20 @@ class CustomGUI:
         self.root.geometry("1600x800")  # Updated window size
 
         # Variables
-        self.flowrates = []
+        self.store = ResultsStore(RESULTS_PATH)  # Every measurement, kept across runs and restarts
+        self.run_start = None  # Timestamp the current run's history starts at
+        self.run_stats = FlowrateStatistics()  # Flowrate statistics of the current run
         self.pipe_dia_inner = 0  # Inner diameter
         self.pipe_dia_outer = 0  # Outer diameter
         self.speed_sound_pipe = 0
         self.speed_sound_medium = 0  # New input
         self.running = False  # Flag to control loop execution
+        self.session = None  # NiosSession shared by all iterations of a run
+        self.pipeline = None  # ShotPipeline of the current run
+        self.scheduler = None  # Paces the current run and adapts its frame timeout
+        self.gate = EchoGate()  # Crops each shot to its echo before filtering
+        if METRICS_PATH:
+            metrics.enable(METRICS_PATH)
 
         # Left Frame for Inputs
         self.left_frame = tk.Frame(self.root, width=300, bg="lightgray")
@@ -67,24 +72,20 @@ class CustomGUI:
         self.textout1.insert(tk.END, "flowrate:\ntemperature:\nReynold number:\nShear Rate:")
         self.textout1.pack()
 
+        self.render_label = tk.Label(self.left_frame, text="Render time:", bg="lightgray", justify=tk.LEFT)
+        self.render_label.pack(pady=5)
+
         # Middle Frame for Image and Text Output
         self.middle_frame = tk.Frame(self.root, width=450)
         self.middle_frame.grid(row=0, column=1, sticky="nsew")
-        self.image1_label = tk.Label(self.middle_frame, width=800, height=400)  # Increased size
-        self.image1_label.pack()
-        self.image4_label = tk.Label(self.middle_frame, width=800, height=400)  # Increased size
-        self.image4_label.pack()
 
         # Right Frame for Second Display and Text Output
         self.right_frame = tk.Frame(self.root, width=450)
         self.right_frame.grid(row=0, column=2, sticky="nsew")
-        self.image2_label = tk.Label(self.right_frame, width=800, height=400)  # Increased size
-        self.image2_label.pack()
-        self.image3_label = tk.Label(self.right_frame, width=800, height=400)  # Increased size
-        self.image3_label.pack()
+        self.panels = {}  # Filled by load_panels
 
-        # Initialize images to a white box
-        self.initialize_images()
+        # matplotlib and scipy take a second or more to import; show the window first, then load them
+        self.root.after(10, self.load_panels)
 
         # Configure Grid
         self.root.grid_rowconfigure(0, weight=1)
@@ -92,78 +93,49 @@ class CustomGUI:
         self.root.grid_columnconfigure(1, weight=1)
         self.root.grid_columnconfigure(2, weight=1)
 
-        # Protocol to handle window close
-        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
-
-    def initialize_images(self):
-        """Initialize image1 and image2 to white boxes."""
-        white_box = Image.new("RGB", (450, 350), color="white")  # Updated size
-        img_tk = ImageTk.PhotoImage(white_box)
-
-        #img = Image.open("snoopy.jpg")
-        #img = img.resize((450, 350), Image.Resampling.LANCZOS)
-        #img_tk = ImageTk.PhotoImage(img)
+        # Worker threads never touch Tk; they post results here and the main loop drains them
+        self.updates = UpdateQueue()
+        self.updates.poll(self.root, self.handle_update)
 
-        self.image1_label.config(image=img_tk)
-        self.image1_label.image = img_tk  # Keep a reference to avoid garbage collection
+        # Plots are rendered off the measurement thread, and only while the window is shown
+        self.plot_worker = PlotWorker(self.on_plot_rendered)
+        self.root.bind("<Map>", lambda event: self.on_visibility_changed(event, True))
+        self.root.bind("<Unmap>", lambda event: self.on_visibility_changed(event, False))
 
-        self.image2_label.config(image=img_tk)
-        self.image2_label.image = img_tk  # Keep a reference to avoid garbage collection
+        # Protocol to handle window close
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
-        self.image3_label.config(image=img_tk)
-        self.image3_label.image = img_tk
-        self.image4_label.config(image=img_tk)
-        self.image4_label.image=img_tk
+    def load_panels(self):
+        """
+        Create the plot panels, which imports matplotlib, and preload scipy on
+        a background thread. Called once the window is up, or by Run if that
+        is pressed first.
+        """
+        if self.panels:
+            return
+        self.waveform_panel = WaveformPanel(self.middle_frame, figsize=(8, 4))
+        self.waveform_panel.widget.pack()
+        self.flowrate_panel = FlowratePanel(self.middle_frame, figsize=(8, 4))
+        self.flowrate_panel.widget.pack()
+        self.cross_correlation_panel = CrossCorrelationPanel(self.right_frame, figsize=(8, 4))
+        self.cross_correlation_panel.widget.pack()
+        self.panels = {
+            "waveforms": self.waveform_panel,
+            "cross_correlation": self.cross_correlation_panel,
+            "flowrates": self.flowrate_panel,
+        }
+        threading.Thread(target=preload, daemon=True).start()
 
     def stop_execution(self):
-        """Stop the continuous loop."""
+        """Stop the continuous loop and detach from the board."""
         self.running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        if self.session is not None:
+            self.session.close()
         print("Execution stopped.")
 
-    def update_image1(self, img_buffer):
-        """Update image1 with an image from a buffer."""
-        try:
-            img = Image.open(io.BytesIO(img_buffer.getvalue()))
-            img = img.resize((800, 600))  # Updated size
-            img_tk = ImageTk.PhotoImage(img)
-            self.image1_label.config(image=img_tk)
-            self.image1_label.image = img_tk
-        except Exception as e:
-            print(f"Error updating image1: {e}")
-
-    def update_image2(self, img_buffer):
-        """Update image2 with an image from a buffer."""
-        try:
-            img = Image.open(io.BytesIO(img_buffer.getvalue()))
-            img = img.resize((800, 400))  # Updated size
-            img_tk = ImageTk.PhotoImage(img)
-            self.image2_label.config(image=img_tk)
-            self.image2_label.image = img_tk
-        except Exception as e:
-            print(f"Error updating image2: {e}")
-
-    def update_image3(self, img_buffer):
-        """Update image2 with an image from a buffer."""
-        try:
-            img = Image.open(io.BytesIO(img_buffer.getvalue()))
-            img = img.resize((450, 350))  # Updated size
-            img_tk = ImageTk.PhotoImage(img)
-            self.image3_label.config(image=img_tk)
-            self.image3_label.image = img_tk
-        except Exception as e:
-            print(f"Error updating image2: {e}")
-
-    def update_image4(self, img_buffer):
-        """Update image2 with an image from a buffer."""
-        try:
-            img = Image.open(io.BytesIO(img_buffer.getvalue()))
-            img = img.resize((450, 350))  # Updated size
-            img_tk = ImageTk.PhotoImage(img)
-            self.image4_label.config(image=img_tk)
-            self.image4_label.image = img_tk
-        except Exception as e:
-            print(f"Error updating image2: {e}")
-
     def update_textout1(self, text):
         """Update text in textout1."""
         self.textout1.config(state='normal')  # Enable text box
@@ -174,8 +146,10 @@ class CustomGUI:
     def run_pressed(self):
         """Start the continuous loop when Run is pressed."""
         self.stop_execution()  # Stop any running loop
-        self.flowrates = []  # Clear flowrates
-        self.initialize_images()  # Reset displays
+        self.load_panels()
+        self.run_start = time.time()  # The plot only shows this run; the store keeps everything
+        self.run_stats = FlowrateStatistics()
+        self.flowrate_panel.update(prepare_flowrates(self.store, self.run_start))  # Reset flowrate history
         self.update_textout1("\nBeginning Loop\n")
 
         # Update input variables
@@ -192,132 +166,79 @@ class CustomGUI:
             print("Invalid input values. Please enter valid numbers.")
             return
 
-        # Start the continuous loop
-        self.running = True
-        threading.Thread(target=self.continuous_loop, daemon=True).start()
-
-    def continuous_loop(self):
-        """Continuously call single_iteration until stopped."""
-        while self.running:
-            self.single_iteration()
-            time.sleep(2)
-
-    def single_iteration(self):
-        """Perform a single iteration of subprocess logic."""
-        kill_process_by_name('nios2-terminal.exe')
-
-        # Specify the file path
-        file_path = 'readings.txt'
-        # Check if the file exists
-        if os.path.exists(file_path):
-        # Delete the file
-            os.remove(file_path)
-            print(f"{file_path} has been deleted.")
-        else:
-            print(f"{file_path} does not exist.")
-
-        # Start subprocess for Nios II
-        bat_file_path = "C:\\intelFPGA_lite\\18.0\\nios2eds\\Nios II Command Shell.bat"
-        process = subprocess.Popen(
-            [bat_file_path],
-            text=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        # Clear this board's terminals left over from earlier runs, then attach once for the whole loop
+        kill_stale_terminals(JTAG_CABLE, JTAG_INSTANCE)
+        self.session = NiosSession(BAT_FILE_PATH, ELF_PATH, TRIGGER_PHRASE, capture_path=CAPTURE_PATH,
+                                   cable=JTAG_CABLE, instance=JTAG_INSTANCE)
 
-        download_cmd = "nios2-download -g C:\\\\Users\\\\nwalt\\\\Downloads\\\\DE1-SoC_v.5.1.3_HWrevF.revG_SystemCD\\\\Demonstrations\\\\FPGA\\\\DE1_SoC_SDRAM_Nios_Test\\\\software\\\\DE1_SoC_SDRAM_Nios_Test\\\\DE1_SoC_SDRAM_Nios_Test.elf\r\nnios2-terminal > readings.txt"
-
-        try:
-            process.communicate(input=download_cmd, timeout=7)
-        except subprocess.TimeoutExpired:
-            pass
-
-        process.kill()
-
-        time.sleep(8)
-
-        # Process readings file
-        trigger_phrase = "== IT'S ALIVE =="
-
-        try:
-            downstream_data, upstream_data, temperature, img_buffer = process_data_file(
-                "C:\\Users\\nwalt\\Desktop\\EECE4792-FloVis-Automation\\readings.txt", trigger_phrase
-            )
-
-
-            if img_buffer:
-                self.update_image1(img_buffer)
-                self.update_image2(img_buffer)
-
-            time_lag,img_cc = time_lag_cross_correlation(upstream_data, downstream_data)
-            self.update_image2(img_cc)
-            if self.speed_sound_medium != 0:
-                speed_sound=self.speed_sound_medium
-            else:
-                time_pipe=(self.pipe_dia_outer-self.pipe_dia_inner)/self.speed_sound_pipe
-                time_water=calculate_average_time_of_flight(downstream_data,upstream_data)-0.00003220801425-time_pipe
-                speed_sound=time_water/math.sqrt(2) * self.pipe_dia_inner
-            flowrate = flow_from_lag(time_lag, math.sqrt(2) * self.pipe_dia_inner, speed_sound)
-            self.flowrates.append(flowrate)
-
-            def generate_flowrate_plot(flowrates):
-                try:
-                    # Generate indices (1-based)
-                    indices = np.arange(1, len(flowrates) + 1)
-
-                    # Calculate the cumulative average (flow_average)
-                    flow_average = np.cumsum(flowrates) / indices
-
-                    # Create the plot
-                    plt.figure(figsize=(8, 6))
-                    plt.plot(indices, flowrates, 'o', label='Flowrate Points')  # Scatter plot for flowrates
-                    plt.plot(indices, flow_average, 'r-', label='Cumulative Average')  # Cumulative average line
-
-                    # Label the newest cumulative average value
-                    if len(flow_average) > 0:
-                        newest_avg_value = flow_average[-1]
-                        newest_avg_index = indices[-1]
-                        plt.text(
-                            newest_avg_index,
-                            newest_avg_value,
-                            f'{newest_avg_value:.2f}',
-                            color='red',
-                            fontsize=10,
-                            ha='right',
-                            va='bottom'
-                        )
-
-                    plt.title('Flowrate vs Index with Cumulative Average')
-                    plt.xlabel('Index')
-                    plt.ylabel('Flowrate')
-                    plt.legend()
-                    plt.grid()
-
-                    # Save the plot to a buffer
-                    img_buffer = io.BytesIO()
-                    plt.savefig(img_buffer, format='png')
-                    img_buffer.seek(0)  # Move to the start of the buffer
-                    plt.close()  # Close the plot to free memory
-
-                    return img_buffer
-                except Exception as e:
-                    print(f"Error generating flowrate plot: {e}")
-                    return None
-
-                except Exception as e:
-                    print(f"Error generating flowrate plot: {e}")
-                    return None
-            self.update_image4(generate_flowrate_plot(self.flowrates))
-            reynold=0
-            self.update_textout1(f"flowrate:\n{flowrate}\ntemperature:\n{temperature}°F\nReynold Number: placeholder\nShear Rate: placholder\n")
+        # Acquire, process and publish on separate threads so the host work overlaps the next capture
+        self.running = True
+        self.scheduler = AcquisitionScheduler(TARGET_SHOT_RATE)
+        source = self.scheduler.source(self.session.read_raw_frame, self.session)
+        pipeline = ShotPipeline(source, self.compute_flowrate,
+                                lambda shot: self.publish_shot(shot, pipeline), TRIGGER_PHRASE, gate=self.gate)
+        self.pipeline = pipeline
+        pipeline.start()
+
+    def compute_flowrate(self, shot):
+        """Flow stage of the pipeline: flowrate from the shot's time lag and the pipe inputs."""
+        flowrate, shot.speed_sound = calculate_flowrate(shot.downstream, shot.upstream, shot.time_lag,
+                                                        self.pipe_dia_inner, self.pipe_dia_outer,
+                                                        self.speed_sound_pipe, self.speed_sound_medium)
+        return flowrate
+
+    def publish_shot(self, shot, pipeline):
+        """Publish stage of the pipeline: record the flowrate and hand the shot to the plots and text output."""
+        if pipeline is not self.pipeline:
+            return  # Left over from a run that has been stopped
+        self.store.append(shot.flowrate, shot.time_lag, shot.temperature, shot.speed_sound, CAPTURE_PATH)
+        self.run_stats.add(shot.flowrate)
+        self.plot_worker.submit("waveforms", prepare_waveforms, shot.downstream, shot.upstream)
+        self.plot_worker.submit("cross_correlation", prepare_cross_correlation, shot.time_lags, shot.cross_corr,
+                                shot.time_lag)
+        self.plot_worker.submit("flowrates", prepare_flowrates, self.store, self.run_start)
+        self.updates.post("text", ShotResult(shot.flowrate, shot.temperature, shot.time_lag, self.run_stats.snapshot()))
+
+    def on_visibility_changed(self, event, viewed):
+        """Pause plot rendering while the main window is minimised."""
+        if event.widget is self.root:
+            self.plot_worker.set_viewed(viewed)
+
+    def on_plot_rendered(self, key, prepared):
+        """Pass data prepared by the plot worker on to the Tk thread."""
+        self.updates.post(key, prepared)
+
+    def handle_update(self, key, value):
+        """Apply one update from the queue. Runs on the Tk thread."""
+        if key == "text":
+            stats = value.stats
+            shots = stats['count'] + stats['outliers']
+            self.update_textout1(f"flowrate:\n{value.flowrate}\n"
+                                 f"average flowrate (outliers excluded, {stats['outliers']} of {shots} shots):\n"
+                                 f"{stats['mean']:.4f} ± {stats['std']:.4f}\n"
+                                 f"moving average: {stats['ema']:.4f}, last {self.run_stats.windowed.window}: "
+                                 f"{stats['window_mean']:.4f} ± {stats['window_std']:.4f}\n"
+                                 f"median: {stats['median']:.4f} (MAD {stats['mad']:.4f})\n"
+                                 f"temperature:\n{value.temperature}°F\n"
+                                 f"Reynold Number: placeholder\nShear Rate: placholder\n")
+            return
+        self.panels[key].update(value)
 
-        except Exception as e:
-            print(f"Error processing data: {e}")
+        times = "\n".join(f"  {name}: {panel.render_time * 1000:.1f} ms" for name, panel in self.panels.items())
+        stats = self.updates.stats()
+        text = f"Render time:\n{times}\nUpdates coalesced: {stats['coalesced']}"
+        if self.pipeline is not None:
+            stages = "\n".join(f"  {name}: {stage['mean_time'] * 1000:.1f} ms, {stage['throughput']:.2f}/s"
+                               for name, stage in self.pipeline.summary().items())
+            text += f"\nPipeline:\n{stages}\n{self.gate.summary()}\n{self.scheduler.summary()}"
+        self.render_label.config(text=text)
 
     def on_close(self):
         """Handle GUI close event."""
         self.stop_execution()
+        self.plot_worker.stop()
+        self.store.close()
+        metrics.METRICS.stop_exporter()
         self.root.destroy()
 
 
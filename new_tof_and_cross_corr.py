@@ -1,107 +1,341 @@
-import pandas as pd
 import numpy as np
-from scipy.signal import butter, filtfilt, correlate, find_peaks
-from scipy.interpolate import interp1d
-import matplotlib.pyplot as plt
 import io
 
-def time_lag_cross_correlation(us_data, ds_data):
+from physics import speed_of_sound_fahrenheit, flow_from_lag  # noqa: F401
+from metrics import timed
+from waveform import aligned
+
+CORRELATION_METHODS = ("direct", "fft", "windowed")
+
+
+def _lag_value(a, v, lag):
+    """Single cross-correlation value sum(a[n + lag] * v[n]) over the overlapping samples."""
+    a_start, v_start = max(lag, 0), max(-lag, 0)
+    count = min(len(a) - a_start, len(v) - v_start)
+    if count <= 0:
+        return 0.0
+    return np.dot(a[a_start:a_start + count], v[v_start:v_start + count])
+
+
+def _fft_correlate(a, v):
+    """np.correlate(a, v, mode='full') computed with real FFTs."""
+    from scipy import fft as sp_fft
+    size = len(a) + len(v) - 1
+    # Sticking to next_fast_len sizes keeps scipy.fft's cached plans reusable between shots
+    n = sp_fft.next_fast_len(size, real=True)
+    spectrum = sp_fft.rfft(a, n) * sp_fft.rfft(v[::-1], n)
+    return sp_fft.irfft(spectrum, n)[:size]
+
+
+def cross_correlate(a, v, method="fft", max_lag=None):
     """
-    Calculate the time lag using cross-correlation and visualize the result.
+    Cross-correlation of a and v, equivalent to np.correlate(a, v, mode='full').
 
     Parameters:
-        us_data (DataFrame): Upstream data with 'Second' and 'Voltage_Filtered' columns.
-        ds_data (DataFrame): Downstream data with 'Second' and 'Voltage_Filtered' columns.
+        a (array): First signal.
+        v (array): Second signal.
+        method (str): 'direct' uses np.correlate (O(N^2)), 'fft' uses real FFTs
+            (O(N log N)) and 'windowed' only evaluates lags within +/- max_lag.
+        max_lag (int): Largest lag in samples to search. Required for 'windowed';
+            for the other methods the output is trimmed to this window.
 
     Returns:
-        float: The calculated time lag in seconds.
+        tuple: (correlation, lags) where lags[i] is the lag in samples of
+        correlation[i], i.e. correlation[i] = sum(a[n + lags[i]] * v[n]).
+    """
+    a = np.asarray(a, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    if method not in CORRELATION_METHODS:
+        raise ValueError(f"Unknown correlation method '{method}', expected one of {CORRELATION_METHODS}")
+
+    if method == "windowed":
+        if max_lag is None:
+            raise ValueError("The windowed correlation needs max_lag")
+        # Zero-pad a so that a 'valid' correlation yields exactly lags -max_lag..max_lag
+        padded = np.zeros(len(v) + 2 * max_lag)
+        count = min(len(a), len(padded) - max_lag)
+        padded[max_lag:max_lag + count] = a[:count]
+        correlation = np.correlate(padded, v, mode='valid')
+        lags = np.arange(-max_lag, max_lag + 1)
+
+        # Drop lags where the signals do not overlap at all
+        keep = (lags > -len(v)) & (lags < len(a))
+        return correlation[keep], lags[keep]
+
+    if method == "direct":
+        correlation = np.correlate(a, v, mode='full')
+    else:
+        correlation = _fft_correlate(a, v)
+    lags = np.arange(-(len(v) - 1), len(a))
+
+    if max_lag is not None:
+        keep = np.abs(lags) <= max_lag
+        correlation, lags = correlation[keep], lags[keep]
+    return correlation, lags
+
+
+def correlation_peak(a, v, method="fft", max_lag=None):
+    """
+    Lag in samples at which the cross-correlation of a and v peaks.
+
+    Gives the same index as np.argmax(np.correlate(a, v, mode='full')) - (len(v) - 1).
+    The FFT result is only accurate to rounding error, so every lag within
+    that error of the maximum is re-evaluated exactly before picking the peak.
+
+    Returns:
+        tuple: (lag, correlation, lags) with correlation and lags as returned
+        by cross_correlate.
     """
+    correlation, lags = cross_correlate(a, v, method, max_lag)
+    peak = int(np.argmax(correlation))
 
-    # Extract time and signal data
-    us_time = us_data['Second'].values
-    us_signal = us_data['Voltage_Filtered'].values
-    ds_time = ds_data['Second'].values
-    ds_signal = ds_data['Voltage_Filtered'].values
+    if method == "fft":
+        a = np.asarray(a, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        tolerance = 1e-10 * np.linalg.norm(a) * np.linalg.norm(v)
+        candidates = np.flatnonzero(correlation >= correlation[peak] - tolerance)
+        if len(candidates) > 64:
+            # Flat correlation (e.g. silent channels), let numpy decide
+            direct, direct_lags = cross_correlate(a, v, "direct", max_lag)
+            return int(direct_lags[np.argmax(direct)]), correlation, lags
+        if len(candidates) > 1:
+            exact = [_lag_value(a, v, lags[i]) for i in candidates]
+            peak = int(candidates[int(np.argmax(exact))])
 
-    # Interpolate signals to a common time base
-    common_time = np.linspace(
-        max(us_time.min(), ds_time.min()),
-        min(us_time.max(), ds_time.max()),
-        min(len(us_signal), len(ds_signal))
-    )
-    us_signal_interp = np.interp(common_time, us_time, us_signal)
-    ds_signal_interp = np.interp(common_time, ds_time, ds_signal)
+    return int(lags[peak]), correlation, lags
 
-    # Compute cross-correlation
-    cross_corr = np.correlate(us_signal_interp, ds_signal_interp, mode='full')
 
-    # Find lag index and calculate time lag
-    lag_index = np.argmax(cross_corr) - (len(ds_signal_interp) - 1)
-    time_step = common_time[1] - common_time[0]
+@timed("correlate")
+def cross_correlation_data(us_data, ds_data, method="fft", max_lag=None):
+    """
+    Calculate the time lag using cross-correlation, without plotting.
+
+    Parameters:
+        us_data (Waveform): Filtered upstream channel.
+        ds_data (Waveform): Filtered downstream channel.
+        method (str): Correlation backend, see cross_correlate.
+        max_lag (int): Only search lags within +/- max_lag samples.
+
+    Returns:
+        tuple: (time_lag, time_lags, cross_corr) with the lag in seconds and the
+        correlation against lag, as needed by plot_cross_correlation.
+    """
+
+    if aligned(us_data, ds_data):
+        # Same grid already, nothing to interpolate
+        us_signal_interp, ds_signal_interp = us_data.filtered, ds_data.filtered
+        time_step = 1 / us_data.fs
+    else:
+        # Extract time and signal data
+        us_time = us_data.time
+        us_signal = us_data.filtered
+        ds_time = ds_data.time
+        ds_signal = ds_data.filtered
+
+        # Interpolate signals to a common time base
+        common_time = np.linspace(
+            max(us_time.min(), ds_time.min()),
+            min(us_time.max(), ds_time.max()),
+            min(len(us_signal), len(ds_signal))
+        )
+        us_signal_interp = np.interp(common_time, us_time, us_signal)
+        ds_signal_interp = np.interp(common_time, ds_time, ds_signal)
+        time_step = common_time[1] - common_time[0]
+
+    # Compute cross-correlation and find the lag of its peak
+    lag_index, cross_corr, lags = correlation_peak(us_signal_interp, ds_signal_interp, method, max_lag)
     time_lag = lag_index * time_step
 
     # Generate time lags for plotting
-    time_lags = np.arange(-len(ds_signal_interp) + 1, len(us_signal_interp)) * time_step
-
-    # Plot cross-correlation vs time lag
-    plt.figure(figsize=(10, 6))
-    plt.plot(time_lags, cross_corr, label='Cross-Correlation')
-    plt.axvline(time_lag, color='r', linestyle='--', label=f'Max at {time_lag:.8f}s')
-    plt.title('Cross-Correlation vs Time Lag')
-    plt.xlabel('Time Lag (s)')
-    plt.ylabel('Cross-Correlation Amplitude')
-    plt.legend()
-    plt.grid()
+    time_lags = lags * time_step
+
+    return time_lag, time_lags, cross_corr
+
+
+@timed("render")
+def plot_cross_correlation(time_lags, cross_corr, time_lag):
+    """
+    Plot cross-correlation vs time lag. Uses a standalone Figure, so it is
+    safe to call from a render worker thread.
+
+    Returns:
+        io.BytesIO: PNG image of the plot.
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(time_lags, cross_corr, label='Cross-Correlation')
+    ax.axvline(time_lag, color='r', linestyle='--', label=f'Max at {time_lag:.8f}s')
+    ax.set_title('Cross-Correlation vs Time Lag')
+    ax.set_xlabel('Time Lag (s)')
+    ax.set_ylabel('Cross-Correlation Amplitude')
+    ax.legend()
+    ax.grid()
     buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format="png")
-    plt.close()
+    fig.tight_layout()
+    fig.savefig(buf, format="png")
     buf.seek(0)
+    return buf
+
+
+def time_lag_cross_correlation(us_data, ds_data, method="fft", max_lag=None, render=True):
+    """
+    Calculate the time lag using cross-correlation and visualize the result.
+
+    Parameters:
+        us_data (Waveform): Filtered upstream channel.
+        ds_data (Waveform): Filtered downstream channel.
+        method (str): Correlation backend, see cross_correlate.
+        max_lag (int): Only search lags within +/- max_lag samples.
+        render (bool): Set to False to skip the plot and return None for the image.
 
+    Returns:
+        float: The calculated time lag in seconds.
+    """
+    time_lag, time_lags, cross_corr = cross_correlation_data(us_data, ds_data, method, max_lag)
+    buf = plot_cross_correlation(time_lags, cross_corr, time_lag) if render else None
     return time_lag, buf
 
 
-def speed_of_sound_fahrenheit(fahrenheit_temp):
+SUBSAMPLE_METHODS = ("parabolic", "gaussian", "phat")
+
+
+def _refine_peak(correlation, peak, interpolation):
+    """Fractional offset (-0.5..0.5) of the true maximum around integer index peak."""
+    if peak <= 0 or peak >= len(correlation) - 1:
+        return 0.0
+    left, centre, right = correlation[peak - 1], correlation[peak], correlation[peak + 1]
+
+    if interpolation == "gaussian" and min(left, centre, right) > 0:
+        left, centre, right = np.log(left), np.log(centre), np.log(right)
+
+    denominator = left - 2 * centre + right
+    if denominator >= 0:
+        return 0.0  # Not a maximum, nothing to refine
+    return float(np.clip(0.5 * (left - right) / denominator, -0.5, 0.5))
 
-    # Data for temperature in Celsius and corresponding speed of sound
-    temperatures_celsius = np.array([0, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100])
-    speed_of_sound = np.array([1403, 1427, 1447, 1481, 1507, 1526, 1541, 1552, 1555, 1555, 1550, 1543])
 
-    # Interpolation function
-    interpolation_func = interp1d(temperatures_celsius, speed_of_sound, kind='cubic')
+def _gcc_phat(a, v, max_lag=None, band_threshold=0.01):
+    """
+    Lag in fractional samples by GCC-PHAT followed by a phase-slope fit.
+
+    The cross-spectrum is whitened (phase transform) over the bins that carry
+    at least band_threshold of the peak cross-power, which gives a sharp
+    integer peak. The remaining fraction of a sample is the slope of the
+    residual phase against frequency, fitted by weighted least squares.
+    """
+    from scipy import fft as sp_fft
+    size = len(a) + len(v) - 1
+    n = sp_fft.next_fast_len(size, real=True)
+    spectrum = sp_fft.rfft(a, n) * np.conj(sp_fft.rfft(v, n))
+    magnitude = np.abs(spectrum)
+    band = magnitude >= band_threshold * magnitude.max()
+    if not band.any():
+        return 0.0
+    whitened = np.where(band, spectrum / np.where(band, magnitude, 1), 0)
+    circular = sp_fft.irfft(whitened, n)
+
+    # Unwrap the circular result into lags -(len(v) - 1) .. len(a) - 1
+    lags = np.arange(-(len(v) - 1), len(a))
+    if max_lag is not None:
+        lags = lags[np.abs(lags) <= max_lag]
+    lag = int(lags[np.argmax(circular[lags % n])])
+
+    # Phase left over once the integer lag is removed is -2*pi*f*fraction/n
+    freqs = np.arange(len(spectrum))
+    residual = np.angle(spectrum * np.exp(2j * np.pi * freqs * lag / n))
+    weights = magnitude * band
+    slope = np.sum(weights * freqs * residual) / np.sum(weights * freqs ** 2)
+    return lag - slope * n / (2 * np.pi)
 
-    # Convert Fahrenheit to Celsius
-    celsius_temp = (fahrenheit_temp - 32) * 5 / 9
 
-    # Return interpolated speed of sound
-    return interpolation_func(celsius_temp)
+def subsample_peak(a, v, interpolation="parabolic", max_lag=None):
+    """
+    Lag in (fractional) samples at which the cross-correlation of a and v peaks.
+
+    The integer peak is found as in correlation_peak and then refined by
+    fitting a parabola (or a Gaussian, via the log of the three samples
+    around the peak). 'phat' instead finds the peak with GCC-PHAT and
+    refines it from the slope of the cross-spectrum phase.
 
+    Parameters:
+        a (array): First signal.
+        v (array): Second signal, on the same sample grid.
+        interpolation (str): One of 'parabolic', 'gaussian' or 'phat'.
+        max_lag (int): Only search lags within +/- max_lag samples.
 
-def flow_from_lag(time_lag,dist,speed_sound):
+    Returns:
+        float: Lag in samples, same sign convention as correlation_peak.
+    """
+    if interpolation not in SUBSAMPLE_METHODS:
+        raise ValueError(f"Unknown interpolation '{interpolation}', expected one of {SUBSAMPLE_METHODS}")
+    a = np.asarray(a, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
 
-    flow=time_lag*(speed_sound**2)/(2*dist)
+    if interpolation == "phat":
+        return float(_gcc_phat(a, v, max_lag))
 
-    return flow
+    lag, correlation, lags = correlation_peak(a, v, "fft", max_lag)
+    peak = int(np.searchsorted(lags, lag))
+    return lag + _refine_peak(correlation, peak, interpolation)
 
 
-def generate_flowrate_plot(flowrates):
+def time_lag_subsample(us_data, ds_data, sampling_rate=50e6, interpolation="parabolic", max_lag=None):
+    """
+    Calculate the time lag with sub-sample resolution on the native sample grid.
+
+    Unlike time_lag_cross_correlation, the signals are not re-interpolated onto
+    a common time base; both channels are assumed to share the 50 MHz grid.
+
+    Parameters:
+        us_data (Waveform): Filtered upstream channel.
+        ds_data (Waveform): Filtered downstream channel.
+        sampling_rate (float): Sampling rate in Hz.
+        interpolation (str): Peak refinement, see subsample_peak.
+        max_lag (int): Only search lags within +/- max_lag samples.
+
+    Returns:
+        float: The calculated time lag in seconds.
+    """
+    length = min(len(us_data), len(ds_data))
+    us_signal = us_data.filtered[:length]
+    ds_signal = ds_data.filtered[:length]
+    return subsample_peak(us_signal, ds_signal, interpolation, max_lag) / sampling_rate
+
+
+# speed_of_sound_fahrenheit and flow_from_lag live in physics, vectorised, and are re-exported here
+
+
+@timed("render")
+def generate_flowrate_plot(flowrates, flow_average=None):
+    """
+    Plot flowrates against shot index with their cumulative average.
+
+    Args:
+        flowrates (list): Flowrate of every shot.
+        flow_average (list): Cumulative average after every shot, e.g. kept
+            up to date with rolling_stats.RunningStats. Computed here if None.
+    """
     try:
         # Generate indices (1-based)
         indices = np.arange(1, len(flowrates) + 1)
 
-        # Calculate the cumulative average (flow_average)
-        flow_average = np.cumsum(flowrates) / indices
+        # Calculate the cumulative average (flow_average) unless the caller kept it
+        if flow_average is None:
+            flow_average = np.cumsum(flowrates) / indices
 
-        # Create the plot
-        plt.figure(figsize=(8, 6))
-        plt.plot(indices, flowrates, 'o', label='Flowrate Points')  # Scatter plot for flowrates
-        plt.plot(indices, flow_average, 'r-', label='Cumulative Average')  # Cumulative average line
+        # Create the plot on a standalone Figure so a render worker thread can call this
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(8, 6))
+        ax = fig.subplots()
+        ax.plot(indices, flowrates, 'o', label='Flowrate Points')  # Scatter plot for flowrates
+        ax.plot(indices, flow_average, 'r-', label='Cumulative Average')  # Cumulative average line
 
         # Label the newest cumulative average value
         if len(flow_average) > 0:
             newest_avg_value = flow_average[-1]
             newest_avg_index = indices[-1]
-            plt.text(
+            ax.text(
                 newest_avg_index,
                 newest_avg_value,
                 f'{newest_avg_value:.2f}',
@@ -111,25 +345,20 @@ def generate_flowrate_plot(flowrates):
                 va='bottom'
             )
 
-        plt.title('Flowrate vs Index with Cumulative Average')
-        plt.xlabel('Index')
-        plt.ylabel('Flowrate')
-        plt.legend()
-        plt.grid()
+        ax.set_title('Flowrate vs Index with Cumulative Average')
+        ax.set_xlabel('Index')
+        ax.set_ylabel('Flowrate')
+        ax.legend()
+        ax.grid()
 
         # Save the plot to a buffer
         img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png')
+        fig.savefig(img_buffer, format='png')
         img_buffer.seek(0)  # Move to the start of the buffer
-        plt.close()  # Close the plot to free memory
 
         return img_buffer
     except Exception as e:
         print(f"Error generating flowrate plot: {e}")
         return None
 
-    except Exception as e:
-        print(f"Error generating flowrate plot: {e}")
-        return None
-
 #print(flow_from_lag(2.1399938857170138e-07,0.0635, 1481))
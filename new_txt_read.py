@@ -1,99 +1,446 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-from scipy.signal import butter, filtfilt
 import numpy as np
 
 import io
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from scipy.signal import butter, filtfilt
-from new_tof_and_cross_corr import time_lag_cross_correlation, flow_from_lag
+from new_tof_and_cross_corr import correlation_peak
+from capture_format import BinaryCapture, is_binary_capture, load_capture_binary
+from physics import compute_flow
+from metrics import timer, timed
+from waveform import Waveform
 
 
-def process_data_file(file_path, trigger_phrase,inv=0):
-    """
-    Process the data file, parse upstream and downstream data, apply filtering,
-    and create a single plot. The plot is returned as an image buffer.
-    """
-    cutoff_frequency = 1000000
-    sampling_rate = 50e6
+# Butterworth designs and their step-response initial conditions keyed by (cutoff, fs, order), see lowpass_sos
+_LOWPASS_BANK = {}
 
-    downstream_data = []
-    upstream_data = []
-    temperature = None
+# Byte lookup table for the characters str.split() treats as whitespace in ASCII text
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[ord(c) for c in " \t\n\r\x0b\x0c"]] = True
 
-    # Read the file
-    with open(file_path, 'r') as f:
-        lines = f.readlines()
 
-    # Parse the file
-    start_reading = False
-    for line in lines:
+class CaptureStreamParser:
+    """
+    Incremental capture parser. Lines are fed one at a time as the terminal
+    produces them and a completed frame is returned as soon as DONE is seen,
+    after which the parser waits for the next trigger phrase.
+    """
+
+    def __init__(self, trigger_phrase):
+        self.trigger_phrase = trigger_phrase
+        self.reset()
+
+    def reset(self):
+        """Discard any partial frame and wait for the trigger phrase again."""
+        self.started = False
+        self.upstream_data = []
+        self.downstream_data = []
+        self.temperature = None
+
+    def feed(self, line):
+        """
+        Consume one line of terminal output.
+
+        Returns:
+            tuple or None: (upstream_data, downstream_data, temperature) once
+            the frame is complete, otherwise None.
+        """
         line = line.strip()
-        if not start_reading:
-            if line.startswith(trigger_phrase):
-                start_reading = True
-            continue  # Skip lines until the trigger phrase is found
+        if not self.started:
+            if line.startswith(self.trigger_phrase):
+                self.started = True
+            return None  # Skip lines until the trigger phrase is found
 
         if line.startswith("=="):
-            continue
+            return None
         if line.startswith("temperature: "):
-            temperature = float(line.split("temperature: ")[1].strip())
+            self.temperature = float(line.split("temperature: ")[1].strip())
         elif line.startswith("DONE"):
-            break  # Stop reading after "DONE"
+            return self.flush()  # Frame is complete
         elif line.startswith("us") or line.startswith("ds"):
             # Parse upstream or downstream data
             parts = line.split()
             if len(parts) != 3:
-                continue  # Skip invalid lines
+                return None  # Skip invalid lines
             prefix, sample, voltage = parts
             sample = float(sample)
             voltage = float(voltage)
             if prefix == "us":
-                upstream_data.append((sample, voltage))
+                self.upstream_data.append((sample, voltage))
             elif prefix == "ds":
-                downstream_data.append((sample, voltage))
-        else:
-            continue
+                self.downstream_data.append((sample, voltage))
+        return None
+
+    def flush(self):
+        """Return whatever has been collected as a frame and reset."""
+        upstream_data = np.array(self.upstream_data, dtype=np.float64).reshape(-1, 2)
+        downstream_data = np.array(self.downstream_data, dtype=np.float64).reshape(-1, 2)
+        temperature = self.temperature
+        self.reset()
+        return upstream_data, downstream_data, temperature
+
+
+def _parse_capture_lines(lines, trigger_phrase):
+    """
+    Line-by-line reference parser. Used as the fallback whenever the capture
+    contains something the bulk parser does not handle exactly.
+    """
+    parser = CaptureStreamParser(trigger_phrase)
+    for line in lines:
+        frame = parser.feed(line)
+        if frame is not None:
+            return frame
+    return parser.flush()
+
+
+def _find_line_prefix(text, prefix, start):
+    """
+    Offset of the first occurrence of prefix at or after start that begins a
+    line once leading whitespace is stripped, or -1 if there is none. start
+    must be the beginning of a line.
+    """
+    position = text.find(prefix, start)
+    while position >= 0:
+        line_start = text.rfind("\n", 0, position) + 1
+        if not text[line_start:position].strip():
+            return position
+        position = text.find(prefix, position + 1)
+    return -1
+
+
+def _decode_channel(buf, line_of_byte, starts, mask):
+    """
+    Decode every line selected by mask into an (N, 2) array of (sample, voltage).
+    All other bytes and the two-letter prefixes are blanked so numpy parses the
+    whole channel in a single call. Returns None if a token is not a number or
+    the result is not exactly two numbers per selected line.
+    """
+    rows = np.flatnonzero(mask)
+    if len(rows) == 0:
+        return np.empty((0, 2), dtype=np.float64)
+
+    block = np.where(mask[line_of_byte], buf, np.uint8(ord(" ")))
+    block[starts[rows]] = ord(" ")
+    block[starts[rows] + 1] = ord(" ")
+    try:
+        values = np.array(block.tobytes().split(), dtype=np.float64)
+    except ValueError:  # A token that is not a number
+        return None
+    if len(values) != 2 * len(rows):
+        return None
+    return values.reshape(-1, 2)
+
+
+def _parse_capture_bulk(text, trigger_phrase):
+    """
+    Bulk parser for a capture held in memory. Returns None when the text needs
+    the line-by-line parser to reproduce its behaviour exactly.
+    """
+    empty = np.empty((0, 2), dtype=np.float64)
+
+    # Locate the first line starting with the trigger phrase
+    trigger_start = _find_line_prefix(text, trigger_phrase, 0)
+    if trigger_start < 0:
+        return empty, empty.copy(), None
+    body_start = text.find("\n", trigger_start)
+    if body_start < 0:
+        return empty, empty.copy(), None
+    body_start += 1
+
+    # The block ends at the first line starting with DONE
+    done_start = _find_line_prefix(text, "DONE", body_start)
+    body = text[body_start:done_start if done_start >= 0 else len(text)]
+    if not body.endswith("\n"):
+        body += "\n"
+
+    try:
+        raw = body.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    buf = np.frombuffer(raw, dtype=np.uint8)
+
+    # Line boundaries
+    ends = np.flatnonzero(buf == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # Lines with leading whitespace are rare; leave them to the reference parser
+    first = buf[starts]
+    is_space = _WHITESPACE[buf]
+    if np.any(is_space[starts] & (first != ord("\n"))):
+        return None
+
+    # Number of whitespace separated tokens on every line
+    token_start = ~is_space & np.concatenate(([True], is_space[:-1]))
+    token_line = np.searchsorted(ends, np.flatnonzero(token_start))
+    tokens = np.bincount(token_line, minlength=len(starts))
+
+    second = buf[np.minimum(starts + 1, len(buf) - 1)]
+    third_is_space = is_space[np.minimum(starts + 2, len(buf) - 1)]
+    is_us = (first == ord("u")) & (second == ord("s"))
+    is_ds = (first == ord("d")) & (second == ord("s"))
+
+    # A first word like "usb" would need float() to decide the outcome
+    if np.any((is_us | is_ds) & ~third_is_space & (tokens == 3)):
+        return None
+
+    line_of_byte = np.repeat(np.arange(len(starts)), ends - starts + 1)
+    upstream_data = _decode_channel(buf, line_of_byte, starts, is_us & (tokens == 3))
+    downstream_data = _decode_channel(buf, line_of_byte, starts, is_ds & (tokens == 3))
+    if upstream_data is None or downstream_data is None:
+        return None
+
+    # Only a handful of status lines remain; the last temperature wins
+    temperature = None
+    for index in np.flatnonzero(first == ord("t")):
+        line = raw[starts[index]:ends[index]].decode("ascii").strip()
+        if line.startswith("temperature: "):
+            temperature = float(line.split("temperature: ")[1].strip())
+
+    return upstream_data, downstream_data, temperature
+
+
+def parse_capture_file(file_path, trigger_phrase):
+    """
+    Parse a nios2-terminal capture into upstream and downstream sample arrays.
+
+    Everything between the trigger phrase and DONE is decoded in bulk into
+    numpy arrays rather than line by line.
+
+    Args:
+        file_path (str): Path to the capture file.
+        trigger_phrase (str): Line prefix that marks the start of the readings.
+
+    Returns:
+        tuple: (upstream_data, downstream_data, temperature) where each data
+        array has shape (N, 2) holding (sample, voltage) rows.
+    """
+    with open(file_path, 'r') as f:
+        text = f.read()
+    return parse_capture_text(text, trigger_phrase)
+
+
+def load_capture(file_path, trigger_phrase):
+    """
+    Read a capture in either format: binary .cap files are memory-mapped and
+    copied into rows, anything else is parsed as nios2-terminal text.
+
+    Returns:
+        tuple: (upstream_data, downstream_data, temperature) as parse_capture_file.
+    """
+    if is_binary_capture(file_path):
+        return load_capture_binary(file_path)
+    return parse_capture_file(file_path, trigger_phrase)
+
+
+@timed("parse")
+def parse_capture_text(text, trigger_phrase):
+    """
+    Same as parse_capture_file, for capture text that is already in memory,
+    e.g. the joined lines of one frame read from the terminal.
+    """
+    result = _parse_capture_bulk(text, trigger_phrase)
+    if result is None:
+        result = _parse_capture_lines(text.split("\n"), trigger_phrase)
+    return result
+
+
+def preload():
+    """
+    Import the scipy modules that filtering and correlation load on first use,
+    e.g. on a background thread while a GUI is starting, so the first shot
+    does not pay for them.
+    """
+    import scipy.fft  # noqa: F401
+    import scipy.signal  # noqa: F401
+
+
+def _lowpass_design(cutoff, fs, order):
+    key = (float(cutoff), float(fs), int(order))
+    design = _LOWPASS_BANK.get(key)
+    if design is None:
+        from scipy.signal import butter, sosfilt_zi
+        nyquist = 0.5 * fs
+        normal_cutoff = cutoff / nyquist
+        sos = butter(order, normal_cutoff, btype='low', analog=False, output='sos')
+        design = _LOWPASS_BANK[key] = (sos, sosfilt_zi(sos))
+    return design
+
+
+def lowpass_sos(cutoff, fs, order=5):
+    """
+    Butterworth low-pass design as second-order sections. Designs are cached,
+    so each (cutoff, fs, order) is only computed once per process.
+    """
+    return _lowpass_design(cutoff, fs, order)[0]
+
+
+def _sosfiltfilt(sos, zi, data, axis=-1):
+    """
+    scipy.signal.sosfiltfilt with its default odd padding, but with the
+    initial conditions zi = sosfilt_zi(sos) passed in rather than solved for
+    on every call, which dominates the cost for short (gated) records.
+    benchmarks/test_filter.py checks that the output is identical to scipy's.
+    """
+    from scipy.signal import sosfilt
+    data = np.moveaxis(np.asarray(data, dtype=np.float64), axis, -1)
+    ntaps = 2 * len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    edge = 3 * ntaps
+    if data.shape[-1] <= edge:
+        raise ValueError(f"The length of the input vector x must be greater than padlen, which is {edge}.")
+    extended = np.concatenate((2 * data[..., :1] - data[..., edge:0:-1], data,
+                               2 * data[..., -1:] - data[..., -2:-edge - 2:-1]), axis=-1)
+    zi = zi.reshape((len(sos),) + (1,) * (data.ndim - 1) + (2,))
+    forward, _ = sosfilt(sos, extended, zi=zi * extended[..., :1])
+    backward, _ = sosfilt(sos, forward[..., ::-1], zi=zi * forward[..., -1:])
+    return np.moveaxis(backward[..., ::-1][..., edge:-edge], -1, axis)
+
+
+def butter_lowpass_filter(data, cutoff, fs, order=5, axis=-1, causal=False):
+    """
+    Low-pass filter data along axis with a cached Butterworth design.
+
+    The default is zero-phase (forward-backward) filtering. causal=True runs a
+    single forward pass instead, which is cheaper and suits live use; it delays
+    the signal by the filter's group delay, but equally on both channels, so
+    the time lag between them is unaffected.
+    """
+    try:
+        sos, zi = _lowpass_design(cutoff, fs, order)
+        if causal:
+            from scipy.signal import sosfilt
+            return sosfilt(sos, data, axis=axis)
+        return _sosfiltfilt(sos, zi, data, axis=axis)
+    except Exception as e:
+        print(f"Filtering failed with error: {e}. Returning original data.")
+        return data
+
+
+def filter_channels(channels, cutoff, fs, order=5, causal=False):
+    """
+    Low-pass filter a list of 1-D signals. Signals of equal length are stacked
+    into a 2-D array and filtered in a single call.
+    """
+    lengths = {len(channel) for channel in channels}
+    if len(lengths) == 1 and lengths.pop() > 0:
+        return list(butter_lowpass_filter(np.vstack(channels), cutoff, fs, order, axis=1, causal=causal))
+    return [butter_lowpass_filter(channel, cutoff, fs, order, causal=causal) for channel in channels]
+
+
+def process_data_file(file_path, trigger_phrase,inv=0, render=True, gate=None):
+    """
+    Process the data file, parse upstream and downstream data, apply filtering,
+    and create a single plot. The plot is returned as an image buffer.
+
+    With render=False no plot is drawn and None is returned in its place;
+    plot_waveforms can render it later from the returned waveforms.
+
+    file_path may be a nios2-terminal text capture or a binary .cap file
+    (see capture_format); the format is detected from the file contents, and
+    a .cap file goes through process_binary_capture. gate is passed on to
+    process_capture_data.
+    """
+    if is_binary_capture(file_path):
+        return process_binary_capture(BinaryCapture(file_path), inv, render=render, gate=gate)
+
+    # Read and parse the file
+    upstream_data, downstream_data, temperature = parse_capture_file(file_path, trigger_phrase)
+    return process_capture_data(upstream_data, downstream_data, temperature, inv, render=render, gate=gate)
+
+
+def process_capture_data(upstream_data, downstream_data, temperature, inv=0, causal=False, render=True,
+                         gate=None):
+    """
+    Same as process_data_file, but for a frame that has already been parsed,
+    e.g. one returned by CaptureStreamParser. With causal=True the low-pass
+    filter runs forward only (see butter_lowpass_filter). With an
+    echo_gate.EchoGate both channels are cropped to the echo window before
+    filtering; the waveforms then only hold that window.
+
+    Returns:
+        tuple: (downstream, upstream, temperature, buf) with one
+        waveform.Waveform per channel; call to_dataframe() on them for the
+        Voltage/Second/Voltage_Filtered DataFrames of earlier versions.
+    """
+    cutoff_frequency = 1000000
+    sampling_rate = 50e6
 
     upstream_data = upstream_data[25:]  # Skip initial samples
     downstream_data = downstream_data[25:]
     if inv!=0:
         upstream_data,downstream_data=downstream_data,upstream_data
-    # Convert to DataFrame
-    downstream_df = pd.DataFrame(downstream_data, columns=["Sample", "Voltage"])
-    upstream_df = pd.DataFrame(upstream_data, columns=["Sample", "Voltage"])
+    with timer("filter"):
+        if gate is not None:
+            upstream_data, downstream_data = gate.crop(upstream_data, downstream_data)
+        downstream_data = np.asarray(downstream_data, dtype=np.float64).reshape(-1, 2)
+        upstream_data = np.asarray(upstream_data, dtype=np.float64).reshape(-1, 2)
 
-    # Convert to seconds
-    downstream_df["Second"] = downstream_df["Sample"] / sampling_rate
-    upstream_df["Second"] = upstream_df["Sample"] / sampling_rate
+        # Butterworth filter, both channels in one pass when they line up
+        downstream_filtered, upstream_filtered = filter_channels(
+            [downstream_data[:, 1], upstream_data[:, 1]], cutoff_frequency, sampling_rate, causal=causal
+        )
 
-    # Drop sample column
-    downstream_df.drop(columns=["Sample"], inplace=True)
-    upstream_df.drop(columns=["Sample"], inplace=True)
+        # One waveform per channel; times follow from the first sample number and the rate
+        downstream_df = Waveform.from_samples(downstream_data[:, 0], downstream_data[:, 1], downstream_filtered,
+                                              sampling_rate)
+        upstream_df = Waveform.from_samples(upstream_data[:, 0], upstream_data[:, 1], upstream_filtered,
+                                            sampling_rate)
 
-    # Butterworth filter
-    def butter_lowpass_filter(data, cutoff, fs, order=5):
-        nyquist = 0.5 * fs
-        normal_cutoff = cutoff / nyquist
-        try:
-            b, a = butter(order, normal_cutoff, btype='low', analog=False)
-            return filtfilt(b, a, data)
-        except Exception as e:
-            print(f"Filtering failed with error: {e}. Returning original data.")
-            return data
+    buf = plot_waveforms(downstream_df, upstream_df) if render else None
+
+    return downstream_df, upstream_df, temperature, buf
+
+
+def process_binary_capture(capture, inv=0, causal=False, render=True, gate=None):
+    """
+    Same as process_capture_data for a capture_format.BinaryCapture, without
+    turning it into (sample, voltage) rows first. The memory-mapped int16
+    channels are cropped and filtered where they are, the raw voltages of the
+    returned waveforms are views onto the file, and the sample rate and start
+    indices come from the header.
+    """
+    cutoff_frequency = 1000000
+    sampling_rate = capture.sample_rate
+
+    skip = 25  # Skip initial samples
+    upstream, upstream_start = capture.upstream[skip:], capture.upstream_start + skip
+    downstream, downstream_start = capture.downstream[skip:], capture.downstream_start + skip
+    if inv != 0:
+        upstream, upstream_start, downstream, downstream_start = downstream, downstream_start, upstream, upstream_start
+    with timer("filter"):
+        window = gate.window(upstream, downstream) if gate is not None else None
+        if window is not None:
+            start, stop = window
+            upstream, downstream = upstream[start:stop], downstream[start:stop]
+            upstream_start += start
+            downstream_start += start
+
+        downstream_filtered, upstream_filtered = filter_channels(
+            [downstream, upstream], cutoff_frequency, sampling_rate, causal=causal
+        )
+        downstream_df = Waveform(downstream, downstream_filtered, downstream_start, sampling_rate)
+        upstream_df = Waveform(upstream, upstream_filtered, upstream_start, sampling_rate)
+
+    buf = plot_waveforms(downstream_df, upstream_df) if render else None
+
+    return downstream_df, upstream_df, capture.temperature, buf
+
+
+@timed("render")
+def plot_waveforms(downstream_df, upstream_df):
+    """
+    Plot the original and filtered downstream and upstream waveforms.
+    Uses a standalone Figure, so it is safe to call from a render worker thread.
 
-    # Apply filtering
-    downstream_df["Voltage_Filtered"] = butter_lowpass_filter(downstream_df["Voltage"], cutoff_frequency, sampling_rate)
-    upstream_df["Voltage_Filtered"] = butter_lowpass_filter(upstream_df["Voltage"], cutoff_frequency, sampling_rate)
+    Returns:
+        io.BytesIO: PNG image of the plot.
+    """
+    from matplotlib.figure import Figure
 
     # Create two subplots and save to buffer
-    fig, axes = plt.subplots(2, 1, figsize=(12, 8))
+    fig = Figure(figsize=(12, 8))
+    axes = fig.subplots(2, 1)
 
     # Plot downstream data
-    axes[0].plot(downstream_df["Second"], downstream_df["Voltage"], label="Downstream Original", alpha=0.7)
-    axes[0].plot(downstream_df["Second"], downstream_df["Voltage_Filtered"], label="Downstream Filtered", linewidth=2)
+    downstream_time = downstream_df.time
+    axes[0].plot(downstream_time, downstream_df.voltage, label="Downstream Original", alpha=0.7)
+    axes[0].plot(downstream_time, downstream_df.filtered, label="Downstream Filtered", linewidth=2)
     axes[0].set_xlabel("Time (Seconds)")
     axes[0].set_ylabel("Voltage (Volts)")
     axes[0].set_title("Downstream Data")
@@ -101,8 +448,9 @@ def process_data_file(file_path, trigger_phrase,inv=0):
     axes[0].grid()
 
     # Plot upstream data
-    axes[1].plot(upstream_df["Second"], upstream_df["Voltage"], label="Upstream Original", alpha=0.7)
-    axes[1].plot(upstream_df["Second"], upstream_df["Voltage_Filtered"], label="Upstream Filtered", linewidth=2)
+    upstream_time = upstream_df.time
+    axes[1].plot(upstream_time, upstream_df.voltage, label="Upstream Original", alpha=0.7)
+    axes[1].plot(upstream_time, upstream_df.filtered, label="Upstream Filtered", linewidth=2)
     axes[1].set_xlabel("Time (Seconds)")
     axes[1].set_ylabel("Voltage (Volts)")
     axes[1].set_title("Upstream Data")
@@ -111,12 +459,10 @@ def process_data_file(file_path, trigger_phrase,inv=0):
 
     # Save the plot to a buffer
     buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format="png")
-    plt.close(fig)
+    fig.tight_layout()
+    fig.savefig(buf, format="png")
     buf.seek(0)
-
-    return downstream_df, upstream_df, temperature, buf
+    return buf
 
 
 # Example usage
@@ -129,15 +475,15 @@ def process_data_file(file_path, trigger_phrase,inv=0):
 def calculate_average_time_of_flight(downstream_df, upstream_df):
     def calculate_time_of_flight(signal_df):
         # Threshold to detect significant signal changes (adjust as necessary)
-        threshold = 0.1 * np.max(np.abs(signal_df["Voltage_Filtered"].values))
-        significant_indices = np.where(np.abs(signal_df["Voltage_Filtered"].values) > threshold)[0]
+        magnitude = np.abs(signal_df.filtered)
+        threshold = 0.1 * np.max(magnitude)
+        significant_indices = np.flatnonzero(magnitude > threshold)
 
         if len(significant_indices) < 2:
             raise ValueError("Not enough significant signal data to calculate time of flight.")
 
         # Calculate time of flight as the difference between the first and last significant times
-        time_of_flight = signal_df["Second"].iloc[significant_indices[-1]] - signal_df["Second"].iloc[
-            significant_indices[0]]
+        time_of_flight = signal_df.time_at(significant_indices[-1]) - signal_df.time_at(significant_indices[0])
         return time_of_flight
 
     downstream_tof = calculate_time_of_flight(downstream_df)
@@ -146,26 +492,48 @@ def calculate_average_time_of_flight(downstream_df, upstream_df):
     average_tof = (downstream_tof + upstream_tof) / 2
     return average_tof
 
-def calculate_time_lag(downstream_df, upstream_df, sampling_rate):
+
+@timed("flow")
+def calculate_flowrate(downstream_df, upstream_df, time_lag, pipe_dia_inner, pipe_dia_outer=0,
+                       speed_sound_pipe=0, speed_sound_medium=0):
+    """
+    Flowrate of one shot from the pipe dimensions entered in the GUI.
+
+    The speed of sound in the medium is used directly if given, otherwise it is
+    estimated from the average time of flight minus the time spent in the pipe
+    wall.
+
+    Returns:
+        tuple: (flowrate, speed_sound) with the speed of sound that was used.
+    """
+    time_of_flight = np.nan
+    if speed_sound_medium == 0:
+        time_of_flight = calculate_average_time_of_flight(downstream_df, upstream_df)
+    flowrate, speed_sound = compute_flow(time_lag, pipe_dia_inner, time_of_flight, pipe_dia_outer,
+                                         speed_sound_pipe, speed_sound_medium)
+    return float(flowrate), float(speed_sound)
+
+def calculate_time_lag(downstream_df, upstream_df, sampling_rate, method="fft", max_lag=None):
     """
     Calculates the time lag between downstream and upstream data using cross-correlation.
 
     Args:
-        downstream_df (pd.DataFrame): DataFrame containing downstream data with 'Second' and 'Voltage_Filtered' columns.
-        upstream_df (pd.DataFrame): DataFrame containing upstream data with 'Second' and 'Voltage_Filtered' columns.
+        downstream_df (Waveform): Filtered downstream channel.
+        upstream_df (Waveform): Filtered upstream channel.
         sampling_rate (float): Sampling rate in Hz (e.g., 50 MHz).
+        method (str): Correlation backend, see new_tof_and_cross_corr.cross_correlate.
+        max_lag (int): Only search lags within +/- max_lag samples.
 
     Returns:
         float: Time lag in seconds.
     """
     # Ensure both datasets have the same length by trimming to the smaller size
     min_length = min(len(downstream_df), len(upstream_df))
-    ds_voltage = downstream_df["Voltage_Filtered"][:min_length].values
-    us_voltage = upstream_df["Voltage_Filtered"][:min_length].values
+    ds_voltage = downstream_df.filtered[:min_length]
+    us_voltage = upstream_df.filtered[:min_length]
 
     # Perform cross-correlation
-    correlation = np.correlate(ds_voltage, us_voltage, mode="full")
-    lag_index = np.argmax(correlation) - (len(ds_voltage) - 1)
+    lag_index, _, _ = correlation_peak(ds_voltage, us_voltage, method, max_lag)
 
     # Convert lag index to time lag
     time_lag = lag_index / sampling_rate
@@ -0,0 +1,460 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from new_txt_read import CaptureStreamParser
+from metrics import timer, timed, observe
+
+
+def _start_pipe_reader(stream):
+    """Read stream on a daemon thread; returns a queue of lines ending with None at EOF."""
+    lines = queue.Queue()
+
+    def reader():
+        try:
+            for line in iter(stream.readline, ''):
+                lines.put(line)
+        except (OSError, ValueError):
+            pass  # Pipe closed underneath us
+        finally:
+            lines.put(None)  # End of stream
+
+    threading.Thread(target=reader, daemon=True).start()
+    return lines
+
+
+def _next_line(lines, deadline):
+    """Next line from a reader queue, or None at EOF. Raises TimeoutError after deadline."""
+    remaining = None if deadline is None else deadline - time.monotonic()
+    if remaining is not None and remaining <= 0:
+        raise TimeoutError("Timed out waiting for terminal output")
+    try:
+        return lines.get(timeout=remaining)
+    except queue.Empty:
+        raise TimeoutError("Timed out waiting for terminal output")
+
+
+def pipe_lines(stream, timeout=None):
+    """
+    Yield lines from a pipe (e.g. a subprocess stdout) as they arrive.
+
+    The pipe is read on a background thread so that a stalled terminal cannot
+    block the caller past the timeout.
+
+    Args:
+        stream: Text-mode file object to read from.
+        timeout (float): Seconds to wait in total, or None to wait forever.
+
+    Raises:
+        TimeoutError: If the timeout expires before the pipe is closed.
+    """
+    lines = _start_pipe_reader(stream)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        line = _next_line(lines, deadline)
+        if line is None:
+            return
+        yield line
+
+
+def tail_lines(file_path, timeout=None, poll_interval=0.05):
+    """
+    Yield complete lines from a file that is still being written, e.g. the
+    output of 'nios2-terminal > readings.txt'. Waits for the file to appear.
+
+    Args:
+        file_path (str): File to follow.
+        timeout (float): Seconds to wait in total, or None to wait forever.
+        poll_interval (float): Seconds to sleep when no new data is available.
+
+    Raises:
+        TimeoutError: If the timeout expires.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def wait():
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Timed out waiting for {file_path}")
+        time.sleep(poll_interval)
+
+    while not os.path.exists(file_path):
+        wait()
+
+    with open(file_path, 'r') as f:
+        partial = ''
+        while True:
+            chunk = f.readline()
+            if not chunk:
+                wait()
+                continue
+            partial += chunk
+            if partial.endswith('\n'):
+                yield partial
+                partial = ''
+
+
+def read_capture_file(file_path, trigger_phrase, process=None, timeout=None, settle=0.25, poll_interval=0.02,
+                      offset=0):
+    """
+    Wait for the next frame in a file that a terminal is writing, e.g.
+    'nios2-terminal > readings.txt', and return as soon as it is complete
+    instead of after a fixed sleep. The frame is complete when its DONE line
+    has been written, when process (the writer) has exited, or when the file
+    has not grown for settle seconds after the frame started.
+
+    Args:
+        file_path (str): File to follow. It may not exist yet.
+        trigger_phrase (str): Line prefix that marks the start of a frame.
+        process: The writing subprocess, polled for exit; None if unknown.
+        timeout (float): Seconds to wait in total, or None to wait forever.
+        settle (float): Seconds without growth that end a started frame.
+        poll_interval (float): Seconds to sleep when no new data is available.
+        offset (int): Byte offset to start reading at, e.g. the offset
+            returned for the previous frame.
+
+    Returns:
+        tuple: (lines, reason, offset) with the raw lines from the trigger
+        phrase on, 'done', 'exited' or 'settled', and the byte offset just
+        after the frame for the next call.
+
+    Raises:
+        TimeoutError: If no frame was complete before the timeout.
+        EOFError: If process exited without writing a frame.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    raw = []
+    partial = b''
+    consumed = offset  # Offset just after the last complete line
+    last_growth = time.monotonic()
+    f = None
+    try:
+        while True:
+            exited = process is not None and process.poll() is not None  # Before reading, so nothing is missed
+            if f is None and os.path.exists(file_path):
+                f = open(file_path, 'rb')
+                f.seek(offset)
+            chunk = f.read() if f is not None else b''
+            now = time.monotonic()
+
+            if chunk:
+                last_growth = now
+                *complete, partial = (partial + chunk).split(b'\n')
+                for line_bytes in complete:
+                    consumed += len(line_bytes) + 1
+                    line = line_bytes.decode('ascii', errors='replace') + '\n'
+                    stripped = line.strip()
+                    if raw or stripped.startswith(trigger_phrase):
+                        raw.append(line)
+                        if stripped.startswith("DONE"):
+                            return raw, "done", consumed
+
+            if exited:
+                if not raw:
+                    raise EOFError(f"Writer of {file_path} exited without a frame")
+                if partial:
+                    raw.append(partial.decode('ascii', errors='replace'))
+                return raw, "exited", consumed + len(partial)
+            if raw and now - last_growth >= settle:
+                return raw, "settled", consumed
+            if deadline is not None and now >= deadline:
+                raise TimeoutError(f"Timed out waiting for a frame in {file_path}")
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def read_frame(lines, trigger_phrase):
+    """
+    Feed lines into a CaptureStreamParser and return the first complete frame.
+
+    Args:
+        lines: Iterable of terminal output lines, e.g. from pipe_lines or tail_lines.
+        trigger_phrase (str): Line prefix that marks the start of the readings.
+
+    Returns:
+        tuple: (upstream_data, downstream_data, temperature) as returned by
+        CaptureStreamParser.
+
+    Raises:
+        EOFError: If the output ends before DONE is seen.
+    """
+    parser = CaptureStreamParser(trigger_phrase)
+    for line in lines:
+        frame = parser.feed(line)
+        if frame is not None:
+            return frame
+    raise EOFError("Terminal output ended before DONE")
+
+
+def jtag_args(cable=None, instance=None):
+    """Command-line options that select one board for nios2-download and nios2-terminal."""
+    args = ""
+    if cable is not None:
+        args += f' --cable "{cable}"'
+    if instance is not None:
+        args += f" --instance {instance}"
+    return args
+
+
+def _option_value(cmdline, option):
+    """Value following option in a split command line, or None."""
+    for i, arg in enumerate(cmdline[:-1]):
+        if arg == option:
+            return cmdline[i + 1]
+        if arg.startswith(option + "="):
+            return arg.split("=", 1)[1]
+    return None
+
+
+@timed("kill")
+def kill_stale_terminals(cable=None, instance=None, process_name="nios2-terminal.exe"):
+    """
+    Terminate terminals left over from earlier runs on one board only.
+
+    With neither cable nor instance every process called process_name is
+    terminated, as on a single-board host. Otherwise only the terminals whose
+    --cable/--instance options match are, so the terminals of other boards
+    served by the same host keep running.
+
+    Returns:
+        int: Number of processes terminated.
+    """
+    import psutil
+    killed = 0
+    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+        if proc.info['name'] != process_name:
+            continue
+        cmdline = proc.info['cmdline'] or []
+        if cable is not None and (_option_value(cmdline, "--cable") or "").strip('"') != str(cable):
+            continue
+        if instance is not None and _option_value(cmdline, "--instance") != str(instance):
+            continue
+        try:
+            proc.terminate()
+            killed += 1
+            print(f"Terminated process {process_name} with PID {proc.info['pid']}")
+        except psutil.Error as e:
+            print(f"Error terminating process {process_name}: {e}")
+    return killed
+
+
+def kill_process_tree(process):
+    """Kill a subprocess together with everything it started (e.g. the shell's nios2-terminal)."""
+    import psutil
+    try:
+        children = psutil.Process(process.pid).children(recursive=True)
+    except Exception:
+        children = []
+    for child in children:
+        try:
+            child.kill()
+        except psutil.Error:
+            pass
+    try:
+        process.kill()
+        process.wait(timeout=5)
+    except Exception as e:
+        print(f"Error killing process {process.pid}: {e}")
+
+
+class NiosSession:
+    """
+    Long-lived connection to the board. The firmware is downloaded once and
+    nios2-terminal stays attached, so every call to read_frame only waits for
+    the next '== IT'S ALIVE ==' ... 'DONE' block on the JTAG UART.
+
+    If the terminal exits or stops producing frames the session reconnects
+    (re-downloading the firmware) up to max_reconnects times per frame. The
+    first frame after starting or reconnecting gets connect_timeout instead of
+    frame_timeout, since it includes nios2-download.
+
+    Args:
+        shell_path (str): Path to 'Nios II Command Shell.bat'.
+        elf_path (str): Firmware image passed to nios2-download.
+        trigger_phrase (str): Line prefix that marks the start of a frame.
+        frame_timeout (float): Seconds to wait for a frame before reconnecting.
+        connect_timeout (float): Seconds to wait for the first frame after
+            starting or reconnecting, download included.
+        max_reconnects (int): Reconnect attempts per frame before giving up.
+        capture_path (str): If set, the raw lines of every frame are written here.
+        popen: Callable used to start the shell; replace with a mock in tests.
+        cable (str): JTAG cable name (see 'jtagconfig') of the board to use.
+            Needed when more than one board is connected to the host.
+        instance (int): Nios II instance number on the JTAG chain.
+    """
+
+    def __init__(self, shell_path, elf_path, trigger_phrase="== IT'S ALIVE ==", frame_timeout=30,
+                 max_reconnects=3, capture_path=None, popen=subprocess.Popen, cable=None, instance=None,
+                 connect_timeout=30):
+        self.shell_path = shell_path
+        self.elf_path = elf_path
+        self.trigger_phrase = trigger_phrase
+        self.frame_timeout = frame_timeout
+        self.connect_timeout = connect_timeout
+        self.max_reconnects = max_reconnects
+        self.capture_path = capture_path
+        self.popen = popen
+        self.cable = cable
+        self.instance = instance
+
+        self.process = None
+        self.lines = None
+        self.closed = False
+        self.connects = 0
+        self.attached = False
+        self.frames = 0
+        self.download_started = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """Start the shell, download the firmware and attach nios2-terminal."""
+        self.closed = False
+        with timer("spawn"):
+            self.process = self.popen(
+                [self.shell_path],
+                text=True,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT
+            )
+        self.lines = _start_pipe_reader(self.process.stdout)
+        board = jtag_args(self.cable, self.instance)
+        download_cmd = f"nios2-download{board} -g {self.elf_path}\r\nnios2-terminal{board}\r\n"
+        self.process.stdin.write(download_cmd)
+        self.process.stdin.flush()
+        self.connects += 1
+        self.attached = False  # Until the first frame after the download
+        self.download_started = time.perf_counter()
+
+    def _check_connected(self, line):
+        """Record the time from the download command to nios2-terminal attaching as 'download'."""
+        if self.download_started is not None and line.startswith("nios2-terminal: connected"):
+            observe("download", time.perf_counter() - self.download_started)
+            self.download_started = None
+
+    def _disconnect(self):
+        if self.process is not None:
+            kill_process_tree(self.process)
+        self.process = None
+        self.lines = None
+
+    def reconnect(self):
+        """Tear down the shell and terminal and start again."""
+        print("Reconnecting to the Nios II terminal")
+        self._disconnect()
+        self.start()
+
+    def close(self):
+        """Stop the terminal and shell. The session will not reconnect after this."""
+        self.closed = True
+        self._disconnect()
+
+    def _session_lines(self):
+        """
+        The reader queue of the current terminal, held by the caller for the
+        whole read: close() may clear self.lines from another thread.
+        """
+        lines = self.lines
+        if lines is None:
+            raise EOFError("Session is closed")
+        return lines
+
+    def _read_frame_once(self, timeout):
+        lines = self._session_lines()
+        parser = CaptureStreamParser(self.trigger_phrase)
+        raw = []
+        deadline = time.monotonic() + timeout
+        while True:
+            line = _next_line(lines, deadline)
+            if line is None:
+                raise EOFError("nios2-terminal exited")
+            if self.closed:
+                raise EOFError("Session is closed")
+            self._check_connected(line)
+            frame = parser.feed(line)
+            if parser.started or frame is not None:
+                raw.append(line)
+            if frame is not None:
+                break
+
+        if self.capture_path:
+            with open(self.capture_path, 'w') as f:
+                f.writelines(raw)
+        return frame
+
+    def _read_raw_frame_once(self, timeout):
+        lines = self._session_lines()
+        raw = []
+        deadline = time.monotonic() + timeout
+        while True:
+            line = _next_line(lines, deadline)
+            if line is None:
+                raise EOFError("nios2-terminal exited")
+            if self.closed:
+                raise EOFError("Session is closed")
+            self._check_connected(line)
+            stripped = line.strip()
+            if raw or stripped.startswith(self.trigger_phrase):
+                raw.append(line)
+                if stripped.startswith("DONE"):
+                    break
+
+        if self.capture_path:
+            with open(self.capture_path, 'w') as f:
+                f.writelines(raw)
+        return raw
+
+    def _read_with_reconnect(self, read_once):
+        for attempt in range(self.max_reconnects + 1):
+            if self.closed:
+                raise RuntimeError("Session is closed")
+            if self.process is None:
+                self.start()
+            elif attempt > 0:
+                self.reconnect()
+            try:
+                result = read_once(self.frame_timeout if self.attached else self.connect_timeout)
+                self.attached = True
+                self.frames += 1
+                return result
+            except (TimeoutError, EOFError, OSError) as e:
+                if self.closed:  # Closed from another thread while reading
+                    raise RuntimeError("Session is closed") from e
+                print(f"Error reading frame: {e}")
+        raise RuntimeError(f"No frame after {self.max_reconnects} reconnects")
+
+    @timed("capture")
+    def read_frame(self):
+        """
+        Wait for the next complete frame from the board.
+
+        Returns:
+            tuple: (upstream_data, downstream_data, temperature) as returned by
+            CaptureStreamParser.
+
+        Raises:
+            RuntimeError: If the session is closed or no frame arrives after
+            max_reconnects reconnects.
+        """
+        return self._read_with_reconnect(self._read_frame_once)
+
+    @timed("capture")
+    def read_raw_frame(self):
+        """
+        Wait for the next frame but return its lines, from the trigger phrase
+        to DONE, without parsing them. Lets parsing run on another thread
+        (see pipeline.py) while this one waits for the next frame.
+
+        Raises:
+            RuntimeError: As for read_frame.
+        """
+        return self._read_with_reconnect(self._read_raw_frame_once)
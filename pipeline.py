@@ -0,0 +1,274 @@
+"""
+Staged measurement pipeline: acquire -> parse -> filter -> correlate -> flow -> publish.
+
+Every stage runs on its own thread and hands shots to the next one through a
+bounded queue, so the host works on shot N while the board is capturing
+shot N+1. When a later stage falls behind the queues fill up and acquisition
+waits instead of piling up frames in memory.
+"""
+import queue
+import threading
+import time
+
+from new_txt_read import parse_capture_text, process_capture_data
+from new_tof_and_cross_corr import cross_correlation_data
+from retry_policy import RetryPolicy
+
+_END = object()  # Passed down the queues when the source runs out
+
+
+class Shot:
+    """One measurement on its way through the pipeline. Each stage fills in its fields."""
+
+    def __init__(self, index, lines):
+        self.index = index
+        self.lines = lines
+        self.acquired = time.perf_counter()
+        self.upstream_data = None
+        self.downstream_data = None
+        self.temperature = None
+        self.upstream = None  # Waveforms after filtering
+        self.downstream = None
+        self.time_lag = None
+        self.time_lags = None
+        self.cross_corr = None
+        self.speed_sound = None
+        self.flowrate = None
+
+
+class StageStats:
+    """Throughput and latency of one stage. Latency is measured from the moment the shot was acquired."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.max_time = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, duration, latency):
+        self.processed += 1
+        self.busy_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def summary(self):
+        """
+        Returns:
+            dict: processed, errors, throughput (shots/s), utilization (busy
+            fraction), mean_time/max_time (s per shot in this stage) and
+            mean_latency/max_latency (s from acquisition to leaving this stage).
+        """
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        count = max(self.processed, 1)
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "throughput": self.processed / elapsed,
+            "utilization": self.busy_time / elapsed,
+            "mean_time": self.busy_time / count,
+            "max_time": self.max_time,
+            "mean_latency": self.total_latency / count,
+            "max_latency": self.max_latency,
+        }
+
+
+class ReplaySource:
+    """
+    Frame source that replays capture files (example.txt format) in place of
+    the board. Each call returns the lines of the next file after waiting
+    capture_time seconds, as if the board were measuring, and None once all
+    files have been replayed repeat times.
+    """
+
+    def __init__(self, file_paths, capture_time=0.0, repeat=1):
+        self.frames = []
+        for file_path in file_paths:
+            with open(file_path, 'r') as f:
+                self.frames.append(f.readlines())
+        self.capture_time = capture_time
+        self.remaining = repeat * len(self.frames)
+        self.position = 0
+
+    def __call__(self):
+        if self.remaining <= 0:
+            return None
+        if self.capture_time:
+            time.sleep(self.capture_time)
+        lines = self.frames[self.position % len(self.frames)]
+        self.position += 1
+        self.remaining -= 1
+        return lines
+
+
+class ShotPipeline:
+    """
+    Runs shots from source through the processing stages on separate threads.
+
+    Args:
+        source: Called with no arguments for the lines of the next frame, e.g.
+            NiosSession.read_raw_frame or a ReplaySource. Returning None ends
+            the run.
+        flow_func: Called as flow_func(shot) once the time lag is known; its
+            return value is stored in shot.flowrate.
+        sink: Called as sink(shot) with every finished shot, in order.
+        trigger_phrase (str): Line prefix that marks the start of the readings.
+        maxsize (int): Shots allowed to wait between two stages.
+        inv (int): Swap the channels, as in process_capture_data.
+        gate (EchoGate): Crop every shot to its echo window before filtering.
+        source_retry (RetryPolicy): Backoff after source raises. The delay
+            grows with every failure in a row, and the run ends after
+            max_attempts of them.
+    """
+
+    def __init__(self, source, flow_func, sink, trigger_phrase="== IT'S ALIVE ==", maxsize=2, inv=0, gate=None,
+                 source_retry=None):
+        self.source = source
+        self.source_retry = source_retry or RetryPolicy(max_attempts=10, initial_delay=0.1, max_delay=5.0)
+        self.flow_func = flow_func
+        self.sink = sink
+        self.trigger_phrase = trigger_phrase
+        self.inv = inv
+        self.gate = gate
+
+        self.stages = [
+            ("parse", self.parse),
+            ("filter", self.filter),
+            ("correlate", self.correlate),
+            ("flow", self.flow),
+            ("publish", self.publish),
+        ]
+        self.queues = [queue.Queue(maxsize=maxsize) for _ in self.stages]
+        self.stats = {name: StageStats(name) for name in ["acquire"] + [name for name, _ in self.stages]}
+        self.running = False
+        self.stopping = threading.Event()  # Cuts short a backoff when stop is called
+        self.finished = threading.Event()
+        self.threads = []
+
+    # Stages. Each one takes a Shot and fills in its part.
+
+    def parse(self, shot):
+        frame = parse_capture_text("".join(shot.lines), self.trigger_phrase)
+        shot.upstream_data, shot.downstream_data, shot.temperature = frame
+
+    def filter(self, shot):
+        shot.downstream, shot.upstream, shot.temperature, _ = process_capture_data(
+            shot.upstream_data, shot.downstream_data, shot.temperature, inv=self.inv, render=False,
+            gate=self.gate
+        )
+
+    def correlate(self, shot):
+        shot.time_lag, shot.time_lags, shot.cross_corr = cross_correlation_data(shot.upstream, shot.downstream)
+
+    def flow(self, shot):
+        shot.flowrate = self.flow_func(shot)
+
+    def publish(self, shot):
+        self.sink(shot)
+
+    # Threads
+
+    def start(self):
+        """Start all stage threads. Returns immediately."""
+        self.running = True
+        self.stopping.clear()
+        self.finished.clear()
+        for stats in self.stats.values():
+            stats.started = time.perf_counter()
+        self.threads = [threading.Thread(target=self._acquire, daemon=True)]
+        for i, (name, func) in enumerate(self.stages):
+            out_queue = self.queues[i + 1] if i + 1 < len(self.stages) else None
+            self.threads.append(threading.Thread(
+                target=self._run_stage, args=(name, func, self.queues[i], out_queue), daemon=True
+            ))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Ask every stage to stop. Shots still in the queues are discarded."""
+        self.running = False
+        self.stopping.set()
+
+    def wait(self, timeout=None):
+        """Wait until the source has run out and the last shot was published. Returns False on timeout."""
+        return self.finished.wait(timeout)
+
+    def _put(self, q, item):
+        while self.running:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while self.running:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _acquire(self):
+        stats = self.stats["acquire"]
+        index = 0
+        failures = 0  # In a row
+        while self.running:
+            start = time.perf_counter()
+            try:
+                lines = self.source()
+            except Exception as e:
+                stats.errors += 1
+                failures += 1
+                self.source_retry.record(False, failures)
+                print(f"Error acquiring shot: {e}")
+                if not self.source_retry.should_retry(failures):
+                    print(f"Error: giving up after {failures} failed acquisitions in a row")
+                    self._put(self.queues[0], _END)
+                    return
+                self.stopping.wait(self.source_retry.delay(failures + 1))
+                continue
+            failures = 0
+            if lines is None:
+                self._put(self.queues[0], _END)
+                return
+            shot = Shot(index, lines)
+            stats.record(shot.acquired - start, 0.0)
+            index += 1
+            if not self._put(self.queues[0], shot):
+                return
+
+    def _run_stage(self, name, func, in_queue, out_queue):
+        stats = self.stats[name]
+        while True:
+            shot = self._get(in_queue)
+            if shot is _END:
+                if out_queue is None:
+                    self.finished.set()
+                else:
+                    self._put(out_queue, _END)
+                return
+
+            start = time.perf_counter()
+            try:
+                func(shot)
+            except Exception as e:
+                stats.errors += 1
+                print(f"Error in {name} stage for shot {shot.index}: {e}")
+                continue  # Drop the shot, keep the pipeline going
+            end = time.perf_counter()
+            stats.record(end - start, end - shot.acquired)
+            if out_queue is not None and not self._put(out_queue, shot):
+                return
+
+    def summary(self):
+        """Per-stage statistics, see StageStats.summary, plus the number of shots waiting before each stage."""
+        result = {name: stats.summary() for name, stats in self.stats.items()}
+        for (name, _), q in zip(self.stages, self.queues):
+            result[name]["waiting"] = q.qsize()
+        return result
@@ -0,0 +1,68 @@
+import threading
+
+
+class PlotWorker:
+    """
+    Renders plots on a background thread so that matplotlib never sits on the
+    measurement path.
+
+    Each plot has a key (e.g. 'waveforms'). Only the newest job per key is kept:
+    if a new frame is submitted before the previous one was rendered, the old
+    job is dropped and counted in skipped. While nobody is viewing the output
+    (set_viewed(False), e.g. the window is minimised) jobs are held back and
+    only the latest one per key is rendered once viewing resumes.
+
+    Args:
+        on_rendered: Called as on_rendered(key, result) on the worker thread
+            with whatever the render function returned.
+    """
+
+    def __init__(self, on_rendered):
+        self.on_rendered = on_rendered
+        self.pending = {}  # key -> (render_func, args)
+        self.viewed = True
+        self.running = True
+        self.rendered = 0
+        self.skipped = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, render_func, *args):
+        """Queue render_func(*args) for key, replacing any job for key that has not started yet."""
+        with self.condition:
+            if key in self.pending:
+                self.skipped += 1
+            self.pending[key] = (render_func, args)
+            self.condition.notify()
+
+    def set_viewed(self, viewed):
+        """Pause (False) or resume (True) rendering."""
+        with self.condition:
+            self.viewed = viewed
+            self.condition.notify()
+
+    def stop(self):
+        """Stop the worker thread. Pending jobs are discarded."""
+        with self.condition:
+            self.running = False
+            self.pending.clear()
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not (self.viewed and self.pending):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                key = next(iter(self.pending))
+                render_func, args = self.pending.pop(key)
+
+            try:
+                result = render_func(*args)
+            except Exception as e:
+                print(f"Error rendering {key}: {e}")
+                continue
+            self.rendered += 1
+            self.on_rendered(key, result)
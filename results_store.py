@@ -0,0 +1,352 @@
+"""
+Append-only measurement store for flowrate history.
+
+Rows (timestamp, flowrate, time_lag, temperature, speed_sound, file) are
+appended to a small journal file and, every chunk_size rows, moved into a
+columnar chunk: one .npy file per column that is later opened with
+mmap_mode='r'. index.json keeps the time range and summary statistics of
+every chunk, so a time-range query only touches the chunks that overlap it
+and reopening a store does not read the rows. File references are stored as
+ids into files.txt.
+
+Timestamps must not go backwards; within a chunk rows are found with
+np.searchsorted.
+
+For a live plot, history(start) keeps a DownsampledHistory of the rows since
+start up to date as rows are appended, so a frame costs O(bins) however long
+the run is; the stored rows are only read again when start changes.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from rolling_stats import RunningStats
+
+COLUMNS = ["timestamp", "flowrate", "time_lag", "temperature", "speed_sound", "file_id"]
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("flowrate", "<f8"),
+    ("time_lag", "<f8"),
+    ("temperature", "<f8"),
+    ("speed_sound", "<f8"),
+    ("file_id", "<i4"),
+])
+
+
+class DownsampledHistory:
+    """
+    A column reduced to at most bins bins of width rows each (the last one may
+    be partial), with the sum, min and max of every bin. add is O(1)
+    amortised: when the bins are full, neighbouring pairs are merged and the
+    width doubles.
+
+    Args:
+        bins (int): Most bins kept; rounded down to an even number.
+    """
+
+    def __init__(self, bins=800):
+        self.bins = max(2, bins - bins % 2)
+        self.width = 1
+        self.rows = 0
+        self.used = 0
+        self.index = np.zeros(self.bins, dtype=np.int64)
+        self.timestamp = np.zeros(self.bins)
+        self.sums = np.zeros(self.bins)
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.mins = np.zeros(self.bins)
+        self.maxs = np.zeros(self.bins)
+
+    @classmethod
+    def of(cls, timestamps, values, bins=800):
+        """History of existing rows in one vectorised pass."""
+        history = cls(bins)
+        if len(values) == 0:
+            return history
+        while -(-len(values) // history.width) > history.bins:
+            history.width *= 2
+        starts = np.arange(0, len(values), history.width)
+        used = len(starts)
+        history.rows = len(values)
+        history.used = used
+        history.index[:used] = starts
+        history.timestamp[:used] = timestamps[starts]
+        history.sums[:used] = np.add.reduceat(values, starts)
+        history.counts[:used] = np.diff(np.append(starts, len(values)))
+        history.mins[:used] = np.minimum.reduceat(values, starts)
+        history.maxs[:used] = np.maximum.reduceat(values, starts)
+        return history
+
+    def _merge_pairs(self):
+        half = self.bins // 2
+        self.index[:half] = self.index[0::2]
+        self.timestamp[:half] = self.timestamp[0::2]
+        self.sums[:half] = self.sums[0::2] + self.sums[1::2]
+        self.counts[:half] = self.counts[0::2] + self.counts[1::2]
+        self.mins[:half] = np.minimum(self.mins[0::2], self.mins[1::2])
+        self.maxs[:half] = np.maximum(self.maxs[0::2], self.maxs[1::2])
+        self.used = half
+        self.width *= 2
+
+    def add(self, timestamp, value):
+        """Append one row."""
+        last = self.used - 1
+        if self.used and self.counts[last] < self.width:
+            self.sums[last] += value
+            self.counts[last] += 1
+            self.mins[last] = min(self.mins[last], value)
+            self.maxs[last] = max(self.maxs[last], value)
+        else:
+            if self.used == self.bins:
+                self._merge_pairs()
+            k = self.used
+            self.index[k] = self.rows
+            self.timestamp[k] = timestamp
+            self.sums[k] = value
+            self.counts[k] = 1
+            self.mins[k] = value
+            self.maxs[k] = value
+            self.used += 1
+        self.rows += 1
+
+    def snapshot(self):
+        """Copies of the bins in the format of ResultsStore.downsample. O(bins)."""
+        used = self.used
+        sums = self.sums[:used]
+        counts = self.counts[:used]
+        return {
+            "index": self.index[:used].copy(),
+            "timestamp": self.timestamp[:used].copy(),
+            "mean": sums / counts,
+            "min": self.mins[:used].copy(),
+            "max": self.maxs[:used].copy(),
+            "cumulative_mean": np.cumsum(sums) / np.cumsum(counts),
+        }
+
+
+class ResultsStore:
+    """
+    Args:
+        directory (str): Where the store lives; created if missing. Opening an
+            existing directory continues its history.
+        chunk_size (int): Rows per columnar chunk.
+    """
+
+    def __init__(self, directory, chunk_size=65536):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, "index.json")
+        self.files_path = os.path.join(directory, "files.txt")
+
+        self.chunks = []  # dicts: name, rows, start, end, stats
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.chunks = json.load(f)["chunks"]
+
+        self.files = []
+        self.file_ids = {}
+        if os.path.exists(self.files_path):
+            with open(self.files_path, 'r') as f:
+                self.files = f.read().split("\n")[:-1]
+            self.file_ids = {name: i for i, name in enumerate(self.files)}
+
+        # Rows not yet in a chunk: the journal of the next chunk, mirrored in memory
+        for i in range(len(self.chunks)):
+            if os.path.exists(self._journal_path(i)):
+                os.remove(self._journal_path(i))  # Sealed just before a crash
+        pending = self._read_journal(self._journal_path(len(self.chunks)))
+        self.journal = open(self._journal_path(len(self.chunks)), 'ab')
+        self.active = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+        self.active_rows = 0
+        while len(pending) >= chunk_size:  # Full before a crash stopped it being sealed
+            self.active[:] = pending[:chunk_size]
+            self.active_rows = chunk_size
+            pending = pending[chunk_size:]
+            with open(self._journal_path(len(self.chunks) + 1), 'wb') as f:
+                f.write(pending.tobytes())  # The rest goes on in the next journal
+            self._seal_chunk()
+        self.active[:len(pending)] = pending
+        self.active_rows = len(pending)
+
+        self.histories = {}  # (start, bins, column) -> DownsampledHistory of the view in use
+        self.stats = RunningStats()
+        for chunk in self.chunks:
+            self.stats.merge(RunningStats.from_dict(chunk["stats"]))
+        self.stats.merge(RunningStats.of(self.active["flowrate"][:self.active_rows]))
+
+    @staticmethod
+    def _read_journal(journal_path):
+        """Rows of a journal, cut back to whole records if a crash tore the last one."""
+        if not os.path.exists(journal_path):
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        size = os.path.getsize(journal_path)
+        whole = size - size % RECORD_DTYPE.itemsize
+        if whole != size:
+            os.truncate(journal_path, whole)
+        return np.fromfile(journal_path, dtype=RECORD_DTYPE)
+
+    def _journal_path(self, chunk_number):
+        return os.path.join(self.directory, f"journal_{chunk_number:06d}.bin")
+
+    def __len__(self):
+        return sum(chunk["rows"] for chunk in self.chunks) + self.active_rows
+
+    @property
+    def last_timestamp(self):
+        if self.active_rows:
+            return float(self.active["timestamp"][self.active_rows - 1])
+        return self.chunks[-1]["end"] if self.chunks else -math.inf
+
+    def _file_id(self, file_ref):
+        if not file_ref:
+            return -1
+        if file_ref not in self.file_ids:
+            self.file_ids[file_ref] = len(self.files)
+            self.files.append(file_ref)
+            with open(self.files_path, 'a') as f:
+                f.write(file_ref + "\n")
+        return self.file_ids[file_ref]
+
+    def append(self, flowrate, time_lag=math.nan, temperature=math.nan, speed_sound=math.nan, file_ref="",
+               timestamp=None):
+        """
+        Add one measurement. O(1) apart from writing a full chunk every chunk_size rows.
+
+        Args:
+            timestamp (float): Seconds since the epoch. Must not be earlier
+                than the last row. Defaults to now, held back to the last row's
+                time if the clock has been set back.
+
+        Raises:
+            ValueError: If timestamp is earlier than the last row.
+        """
+        with self.lock:
+            if timestamp is None:
+                timestamp = max(time.time(), self.last_timestamp)
+            elif timestamp < self.last_timestamp:
+                raise ValueError("Timestamps must not go backwards")
+            row = self.active[self.active_rows]
+            row["timestamp"] = timestamp
+            row["flowrate"] = flowrate
+            row["time_lag"] = math.nan if time_lag is None else time_lag
+            row["temperature"] = math.nan if temperature is None else temperature
+            row["speed_sound"] = math.nan if speed_sound is None else speed_sound
+            row["file_id"] = self._file_id(file_ref)
+            self.journal.write(self.active[self.active_rows:self.active_rows + 1].tobytes())
+            self.journal.flush()
+            self.active_rows += 1
+            self.stats.add(float(flowrate))
+            for (start, _, column), history in self.histories.items():
+                if start is None or timestamp >= start:
+                    history.add(timestamp, float(row[column]))
+            if self.active_rows >= self.chunk_size:
+                self._seal_chunk()
+
+    def _seal_chunk(self):
+        """Move the journal into a columnar chunk."""
+        rows = self.active[:self.active_rows]
+        name = f"chunk_{len(self.chunks):06d}"
+        chunk_dir = os.path.join(self.directory, name)
+        os.makedirs(chunk_dir, exist_ok=True)
+        for column in COLUMNS:
+            np.save(os.path.join(chunk_dir, column + ".npy"), np.ascontiguousarray(rows[column]))
+        self.chunks.append({
+            "name": name,
+            "rows": int(self.active_rows),
+            "start": float(rows["timestamp"][0]),
+            "end": float(rows["timestamp"][-1]),
+            "stats": RunningStats.of(rows["flowrate"]).to_dict(),
+        })
+
+        # Once the index lists the chunk its journal is stale; reopening deletes it if we crash here
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"chunks": self.chunks}, f)
+        os.replace(tmp_path, self.index_path)
+        self.journal.close()
+        os.remove(self._journal_path(len(self.chunks) - 1))
+        self.journal = open(self._journal_path(len(self.chunks)), 'ab')
+        self.active = np.zeros(self.chunk_size, dtype=RECORD_DTYPE)
+        self.active_rows = 0
+
+    def close(self):
+        """Close the journal. Everything appended so far is already on disk."""
+        self.journal.close()
+
+    def _chunk_column(self, chunk, column):
+        return np.load(os.path.join(self.directory, chunk["name"], column + ".npy"), mmap_mode='r')
+
+    def query(self, start=None, end=None, columns=None):
+        """
+        Rows with start <= timestamp <= end.
+
+        Args:
+            start, end (float): Time range in seconds since the epoch; None is open-ended.
+            columns (list): Columns to return; default all of COLUMNS.
+
+        Returns:
+            dict: column name -> numpy array.
+        """
+        with self.lock:
+            return self._query(start, end, columns)
+
+    def _query(self, start, end, columns):
+        columns = columns or COLUMNS
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        parts = {column: [] for column in columns}
+        for chunk in self.chunks:
+            if chunk["end"] < start or chunk["start"] > end:
+                continue
+            timestamps = self._chunk_column(chunk, "timestamp")
+            low = np.searchsorted(timestamps, start, side='left')
+            high = np.searchsorted(timestamps, end, side='right')
+            for column in columns:
+                parts[column].append(np.asarray(self._chunk_column(chunk, column)[low:high]))
+
+        active = self.active[:self.active_rows]
+        low = np.searchsorted(active["timestamp"], start, side='left')
+        high = np.searchsorted(active["timestamp"], end, side='right')
+        for column in columns:
+            parts[column].append(active[column][low:high].copy())
+
+        return {column: np.concatenate(arrays) for column, arrays in parts.items()}
+
+    def file_names(self, file_ids):
+        """File references for an array of file ids ('' for rows without one)."""
+        return [self.files[i] if i >= 0 else "" for i in file_ids]
+
+    def downsample(self, start=None, end=None, bins=800, column="flowrate"):
+        """
+        Summarise column over [start, end] in at most bins bins of equal
+        width (the last one may be shorter), for drawing long histories.
+
+        Returns:
+            dict: 'index' (row number of each bin's first row within the
+            range), 'timestamp', 'mean', 'min', 'max' and 'cumulative_mean'
+            (mean of all rows up to the end of the bin), one entry per bin.
+        """
+        data = self.query(start, end, ["timestamp", column])
+        return DownsampledHistory.of(data["timestamp"], data[column], bins).snapshot()
+
+    def history(self, start=None, bins=800, column="flowrate"):
+        """
+        downsample(start, None, bins, column) for a live view. The bins are
+        kept up to date by append, so only the first call for a new start
+        reads the stored rows; after that a call is O(bins). Only the view
+        asked for last is kept.
+        """
+        key = (start, bins, column)
+        with self.lock:
+            history = self.histories.get(key)
+            if history is None:
+                data = self._query(start, None, ["timestamp", column])
+                history = DownsampledHistory.of(data["timestamp"], data[column], bins)
+                self.histories = {key: history}
+            return history.snapshot()
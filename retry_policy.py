@@ -0,0 +1,55 @@
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff for shots that come back
+    implausible, plus the counters for the rejected-shot rate. The caller
+    does the waiting: the GUI schedules the next attempt with root.after,
+    and ShotPipeline waits on its stop event after a failed acquisition.
+
+    Attempt 1 runs straight away; attempt n > 1 waits
+    initial_delay * backoff_factor ** (n - 2) seconds, capped at max_delay.
+
+    Args:
+        max_attempts (int): Attempts per measurement, including the first.
+        initial_delay (float): Seconds before the first retry.
+        backoff_factor (float): Growth of the delay per retry.
+        max_delay (float): Longest delay between attempts.
+    """
+
+    def __init__(self, max_attempts=5, initial_delay=0.1, backoff_factor=2.0, max_delay=2.0):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.attempts = 0
+        self.rejected = 0
+        self.gave_up = 0
+
+    def delay(self, attempt):
+        """Seconds to wait before attempt number attempt (1-based)."""
+        if attempt <= 1:
+            return 0.0
+        return min(self.initial_delay * self.backoff_factor ** (attempt - 2), self.max_delay)
+
+    def should_retry(self, attempt):
+        """True if another attempt is allowed after attempt number attempt failed."""
+        return attempt < self.max_attempts
+
+    def record(self, accepted, attempt):
+        """Count one attempt. A rejected final attempt also counts as giving up."""
+        self.attempts += 1
+        if not accepted:
+            self.rejected += 1
+            if not self.should_retry(attempt):
+                self.gave_up += 1
+
+    @property
+    def rejected_rate(self):
+        """Fraction of all attempts whose shot was rejected."""
+        return self.rejected / self.attempts if self.attempts else 0.0
+
+    def summary(self):
+        """Counters as a short line of text for display."""
+        return (f"rejected shots: {self.rejected} of {self.attempts} ({self.rejected_rate:.0%}), "
+                f"gave up {self.gave_up} times")
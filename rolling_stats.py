@@ -0,0 +1,250 @@
+"""
+Streaming statistics for flowrate averaging. Every update is O(1) in the
+length of the history (the windowed median is O(window)), so long runs do
+not slow down the way recomputing np.cumsum over all shots every frame did.
+"""
+import bisect
+import math
+
+import numpy as np
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream, updated in O(1) per value (Welford)."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=math.inf, maximum=-math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+
+    def add(self, value):
+        """Include one value. NaN is ignored."""
+        if value != value:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Include everything other has seen (Chan et al. parallel update)."""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @classmethod
+    def of(cls, values):
+        """Stats of an array in one vectorised pass."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls()
+        mean = float(values.mean())
+        return cls(len(values), mean, float(((values - mean) ** 2).sum()), float(values.min()), float(values.max()))
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["count"], d["mean"], d["m2"], d["min"], d["max"])
+
+
+class ExponentialMovingAverage:
+    """
+    Exponentially weighted mean and variance. Follows a real change in flow
+    within a few samples, unlike the cumulative mean.
+
+    Args:
+        alpha (float): Weight of the newest sample, 0 < alpha <= 1. An alpha of
+            2 / (N + 1) behaves roughly like an N sample moving average.
+    """
+
+    def __init__(self, alpha=0.2):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.count = 0
+        self.mean = math.nan
+        self.variance = 0.0
+
+    def add(self, value):
+        """Include one value. NaN is ignored."""
+        if value != value:
+            return
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            return
+        delta = value - self.mean
+        self.mean += self.alpha * delta
+        self.variance = (1 - self.alpha) * (self.variance + self.alpha * delta * delta)
+
+
+class WindowedStats:
+    """
+    Mean and variance of the last window values, kept in a ring buffer and
+    updated in O(1) by swapping the oldest value for the newest.
+    """
+
+    def __init__(self, window=32):
+        self.window = window
+        self.values = np.zeros(window)
+        self.position = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        """Include one value, dropping the oldest once the window is full. NaN is ignored."""
+        if value != value:
+            return
+        if self.count < self.window:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        else:
+            old = float(self.values[self.position])
+            old_mean = self.mean
+            self.mean += (value - old) / self.window
+            self.m2 += (value - old) * (value - self.mean + old - old_mean)
+            self.m2 = max(self.m2, 0.0)  # Rounding can leave it a hair below zero
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.window
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class WindowedMedian:
+    """
+    Median and median absolute deviation (MAD) of the last window values.
+    The window is kept sorted, so an update costs a binary search and a
+    list insert/delete; MAD is O(window) and computed when asked for.
+    """
+
+    def __init__(self, window=31):
+        self.window = window
+        self.ring = [None] * window
+        self.position = 0
+        self.sorted = []
+
+    def add(self, value):
+        """Include one value, dropping the oldest once the window is full. NaN is ignored."""
+        if value != value:
+            return
+        old = self.ring[self.position]
+        if old is not None:
+            del self.sorted[bisect.bisect_left(self.sorted, old)]
+        bisect.insort(self.sorted, value)
+        self.ring[self.position] = value
+        self.position = (self.position + 1) % self.window
+
+    @property
+    def count(self):
+        return len(self.sorted)
+
+    @property
+    def median(self):
+        n = len(self.sorted)
+        if n == 0:
+            return math.nan
+        middle = n // 2
+        return self.sorted[middle] if n % 2 else (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+    @property
+    def mad(self):
+        if not self.sorted:
+            return math.nan
+        return float(np.median(np.abs(np.asarray(self.sorted) - self.median)))
+
+    def robust_score(self, value):
+        """
+        How far value is from the window median in robust standard deviations
+        (0.6745 * |x - median| / MAD). 0 while the MAD is zero or undefined.
+        """
+        mad = self.mad
+        if not mad > 0:
+            return 0.0
+        return 0.6745 * abs(value - self.median) / mad
+
+
+class FlowrateStatistics:
+    """
+    Everything the GUI and batch mode show about a run of flowrates, updated
+    once per shot.
+
+    A shot whose robust score against the recent median is above
+    outlier_threshold is counted as an outlier and kept out of the cumulative,
+    exponential and windowed averages. It still enters the median window, so
+    a real step change is accepted once it has lasted about half the window.
+
+    Args:
+        window (int): Length of the windowed mean/variance and median/MAD.
+        alpha (float): Exponential moving average weight.
+        outlier_threshold (float): Robust score above which a shot is an outlier.
+            None disables outlier rejection.
+        min_samples (int): Shots needed in the median window before outliers
+            are rejected.
+    """
+
+    def __init__(self, window=32, alpha=0.2, outlier_threshold=3.5, min_samples=8):
+        self.cumulative = RunningStats()
+        self.ema = ExponentialMovingAverage(alpha)
+        self.windowed = WindowedStats(window)
+        self.median = WindowedMedian(window)
+        self.outlier_threshold = outlier_threshold
+        self.min_samples = min_samples
+        self.outliers = 0
+
+    def add(self, value):
+        """
+        Include one flowrate.
+
+        Returns:
+            bool: False if the value was rejected as an outlier.
+        """
+        value = float(value)
+        accepted = not (
+            self.outlier_threshold is not None
+            and self.median.count >= self.min_samples
+            and self.median.robust_score(value) > self.outlier_threshold
+        )
+        self.median.add(value)
+        if not accepted:
+            self.outliers += 1
+            return False
+        self.cumulative.add(value)
+        self.ema.add(value)
+        self.windowed.add(value)
+        return True
+
+    def snapshot(self):
+        """Current values as a dict, e.g. for display or a result row."""
+        return {
+            "count": self.cumulative.count,
+            "outliers": self.outliers,
+            "mean": self.cumulative.mean if self.cumulative.count else math.nan,
+            "std": math.sqrt(self.cumulative.variance),
+            "ema": self.ema.mean,
+            "window_mean": self.windowed.mean if self.windowed.count else math.nan,
+            "window_std": math.sqrt(self.windowed.variance),
+            "median": self.median.median,
+            "mad": self.median.mad,
+        }
@@ -0,0 +1,175 @@
+"""
+Acquisition pacing based on when the board is actually ready.
+
+Reads already end on readiness signals rather than fixed sleeps: a
+NiosSession returns as soon as DONE arrives or the terminal exits, and
+nios_terminal.read_capture_file, for a terminal redirected into a file,
+also when the file stops growing. The AcquisitionScheduler adds the rest:
+
+    - shots are started on a fixed schedule for a target shot rate, and every
+      shot that finishes after its deadline (the start of the next slot) is
+      counted as missed;
+    - the frame timeout follows the captures seen so far, a multiple of the
+      slowest recent one, so a stalled board is noticed in seconds on a fast
+      host without failing slow ones;
+    - wall time is split into pacing (sleeping to hold the rate), capture
+      (waiting for the board) and work (everything else the acquiring thread
+      did, e.g. processing the shot or handing it on).
+
+    scheduler = AcquisitionScheduler(target_rate=2.0)
+    pipeline = ShotPipeline(scheduler.source(session.read_raw_frame, session), ...)
+    ...
+    print(scheduler.summary())
+"""
+import time
+from collections import deque
+
+from metrics import observe
+
+
+class AcquisitionScheduler:
+    """
+    Paces a frame source and adapts its timeout. Used from one acquiring
+    thread; snapshot and summary may be called from any thread.
+
+    Args:
+        target_rate (float): Shots per second to aim for; None or 0 acquires
+            back to back.
+        min_timeout (float): Shortest frame timeout handed out.
+        max_timeout (float): Longest frame timeout, also used until warmup
+            captures have been seen.
+        timeout_factor (float): Frame timeout as a multiple of the slowest
+            recent capture.
+        window (int): Recent captures the timeout is based on.
+        warmup (int): Captures to see before the timeout adapts.
+        clock: Monotonic clock in seconds.
+        sleep: Called to wait for the next slot; replace in tests.
+    """
+
+    def __init__(self, target_rate=None, min_timeout=1.0, max_timeout=30.0, timeout_factor=3.0, window=20,
+                 warmup=3, clock=time.monotonic, sleep=time.sleep):
+        if target_rate is not None and target_rate < 0:
+            raise ValueError("target_rate must not be negative")
+        self.period = 1.0 / target_rate if target_rate else 0.0
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.warmup = warmup
+        self.clock = clock
+        self.sleep = sleep
+        self.captures = deque(maxlen=window)
+        self.started = None
+        self.first_capture = None  # Start of the first capture
+        self.last_capture = None  # Start of the latest capture
+        self.next_slot = None
+        self.deadline = None
+        self.shots = 0
+        self.missed = 0
+        self.max_lateness = 0.0
+        self.pacing_time = 0.0
+        self.capture_time = 0.0
+
+    def frame_timeout(self):
+        """Seconds to allow for the next capture."""
+        if len(self.captures) < self.warmup:
+            return self.max_timeout
+        return min(max(self.timeout_factor * max(self.captures), self.min_timeout), self.max_timeout)
+
+    def wait_for_slot(self):
+        """
+        Sleep until the next shot is due. A shot that is already late starts
+        straight away, and the schedule restarts from it rather than bursting
+        to catch up.
+        """
+        now = self.clock()
+        if self.started is None:
+            self.started = now
+        if not self.period:
+            self.deadline = None
+            return
+        if self.next_slot is None or self.next_slot < now:
+            self.next_slot = now
+        delay = self.next_slot - now
+        if delay > 0:
+            self.sleep(delay)
+            self.pacing_time += delay
+            observe("pace", delay)
+        self.deadline = self.next_slot + self.period
+        self.next_slot = self.deadline
+
+    def record_capture(self, seconds, adapt=True):
+        """
+        Count one capture that took seconds, checking it against the current
+        deadline. adapt=False leaves it out of the frame timeout, e.g. for a
+        capture that included downloading the firmware.
+        """
+        now = self.clock()
+        self.shots += 1
+        self.last_capture = now - seconds
+        if self.first_capture is None:
+            self.first_capture = self.last_capture
+        if adapt:
+            self.captures.append(seconds)
+        self.capture_time += seconds
+        if self.deadline is not None:
+            lateness = now - self.deadline
+            if lateness > 0:
+                self.missed += 1
+                self.max_lateness = max(self.max_lateness, lateness)
+
+    def acquire(self, read, session=None):
+        """
+        One paced shot: wait for its slot, give session (a NiosSession) the
+        adaptive frame timeout and return read(). The session still allows
+        its connect_timeout for the first frame after a (re)connect. A read
+        that fails or returns None is not counted as a capture, and one
+        during which the session (re)connected does not adapt the timeout.
+        """
+        self.wait_for_slot()
+        connects = None
+        if session is not None:
+            session.frame_timeout = self.frame_timeout()
+            connects = session.connects
+        start = self.clock()
+        result = read()
+        if result is not None:
+            self.record_capture(self.clock() - start, session is None or session.connects == connects)
+        return result
+
+    def source(self, read, session=None):
+        """read wrapped by acquire, as the source of a ShotPipeline."""
+        return lambda: self.acquire(read, session)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: shots, elapsed (s), rate (shots/s between the starts of
+            the first and latest capture) and target_rate (shots/s),
+            pacing, capture and work (s of elapsed), waiting (fraction of
+            elapsed spent pacing or capturing), missed deadlines,
+            max_lateness (s) and the current frame_timeout (s).
+        """
+        elapsed = self.clock() - self.started if self.started is not None else 0.0
+        waiting = self.pacing_time + self.capture_time
+        span = self.last_capture - self.first_capture if self.shots > 1 else 0.0
+        return {
+            "shots": self.shots,
+            "elapsed": elapsed,
+            "rate": (self.shots - 1) / span if span > 0 else 0.0,
+            "target_rate": 1.0 / self.period if self.period else None,
+            "pacing": self.pacing_time,
+            "capture": self.capture_time,
+            "work": max(elapsed - waiting, 0.0),
+            "waiting": waiting / elapsed if elapsed > 0 else 0.0,
+            "missed": self.missed,
+            "max_lateness": self.max_lateness,
+            "frame_timeout": self.frame_timeout(),
+        }
+
+    def summary(self):
+        """Rate, deadlines and the wait/work split as a short line of text for display."""
+        s = self.snapshot()
+        target = f" of {s['target_rate']:.2f}" if s["target_rate"] else ""
+        return (f"acquisition: {s['rate']:.2f}{target} shots/s, {s['missed']} missed deadlines, "
+                f"waiting {s['waiting']:.0%} (pacing {s['pacing']:.1f} s, capture {s['capture']:.1f} s), "
+                f"work {s['work']:.1f} s, timeout {s['frame_timeout']:.1f} s")
@@ -0,0 +1,208 @@
+"""
+Simulated flowmeter board that speaks the nios2-terminal text protocol.
+
+Each frame is exactly what the DE1-SoC firmware prints: the trigger phrase,
+'us N V' and 'ds N V' lines, the onewire/temperature lines and DONE, with the
+firmware's line endings. The samples are either synthetic (a tone burst
+after the transmit spike, the downstream copy delayed by a known time, plus
+noise) or replayed from recorded captures such as example.txt.
+
+A SimulatedDevice can be used three ways:
+    - called directly as the frame source of a ShotPipeline, like ReplaySource;
+    - as the popen of a NiosSession, which then runs this module as its
+      terminal, so the whole acquisition path runs without hardware;
+    - from the command line, in place of nios2-terminal.
+
+Usage:
+    python simulator.py [--replay capture.txt ...] [--delay S] [--noise V] [--temperature F]
+                        [--frames N] [--capture-time S]
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BANNER = [
+    "nios2-terminal: connected to hardware target using JTAG UART on cable\r\n",
+    'nios2-terminal: "USB-Blaster [USB-0]", device 1, instance 0\r\n',
+    "nios2-terminal: (Use the IDE stop button or Ctrl-C to terminate)\r\n",
+    "\r\n",
+]
+TEMPERATURE_LINES = [
+    "onewire_reset present=1\r\n",
+    "onewrite_skip\r\n",
+    "wait for temp conversion to complete\r\n",
+    "conversion complete\r\n",
+    "onewire_reset present=1\r\n",
+    "onewrite_skip\r\n",
+]
+DATA_LINE_ENDING = "\r\r\n"  # The firmware's '\r\n' after the JTAG UART's own '\r'
+
+
+def synthetic_channels(delay=2.2e-7, noise=25.0, samples=16384, fs=50e6, echo_at=8000, frequency=500e3,
+                       amplitude=1500.0, width=150, rng=None):
+    """
+    Upstream and downstream voltages of one synthetic shot.
+
+    Both channels hold the transmit spike at sample 13, as in example.txt, and
+    a Gaussian tone burst centred on sample echo_at; the downstream burst is
+    delayed by delay seconds, which need not be a whole number of samples.
+
+    Args:
+        noise (float): Standard deviation of the Gaussian noise, in ADC counts.
+        width (float): Standard deviation of the burst envelope, in samples.
+        rng: np.random.Generator for the noise.
+
+    Returns:
+        tuple: (upstream, downstream) integer arrays.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    t = np.arange(samples) / fs
+
+    def burst(centre):
+        return amplitude * np.exp(-0.5 * ((t - centre) * fs / width) ** 2) * np.sin(2 * np.pi * frequency * (t - centre))
+
+    channels = []
+    for shift in (0.0, delay):
+        voltage = 17 + burst(echo_at / fs + shift) + rng.normal(0, noise, samples)
+        voltage[13] = 6143  # Transmit spike
+        channels.append(np.round(voltage).astype(np.int64))
+    return tuple(channels)
+
+
+def format_frame(upstream, downstream, temperature, trigger_phrase="== IT'S ALIVE =="):
+    """Lines of one frame, from the trigger phrase to DONE, as the firmware prints them."""
+    lines = [f"{trigger_phrase} {DATA_LINE_ENDING}"]
+    lines.extend(f"us {i} {int(v)}{DATA_LINE_ENDING}" for i, v in enumerate(upstream))
+    lines.extend(f"ds {i} {int(v)}{DATA_LINE_ENDING}" for i, v in enumerate(downstream))
+    lines.extend(TEMPERATURE_LINES)
+    lines.append(f"temperature: {temperature:.6f}\r\n")
+    lines.append(f"DONE{DATA_LINE_ENDING}")
+    return lines
+
+
+def recorded_frames(file_path, trigger_phrase="== IT'S ALIVE =="):
+    """The trigger-to-DONE blocks of a recorded capture, as lists of lines."""
+    frames = []
+    frame = None
+    with open(file_path, 'r', newline='') as f:
+        for line in f:
+            stripped = line.strip()
+            if frame is None and stripped.startswith(trigger_phrase):
+                frame = []
+            if frame is not None:
+                frame.append(line)
+                if stripped.startswith("DONE"):
+                    frames.append(frame)
+                    frame = None
+    if not frames:
+        raise ValueError(f"No complete frame in {file_path}")
+    return frames
+
+
+class SimulatedDevice:
+    """
+    A board that produces frames on demand.
+
+    Args:
+        delay (float): Downstream delay of the synthetic echo in seconds.
+        noise (float): Noise standard deviation in ADC counts.
+        temperature (float): Reported temperature in Fahrenheit.
+        samples (int): Samples per channel.
+        capture_time (float): Seconds each frame takes, as on the board.
+        frames (int): Frames before the device stops; None for no limit.
+        replay (list): Recorded capture files to replay, in turn, instead of
+            synthesising frames.
+        seed (int): Frame k always has the same noise for a given seed.
+        trigger_phrase (str): Line prefix that marks the start of a frame.
+    """
+
+    def __init__(self, delay=2.2e-7, noise=25.0, temperature=98.712502, samples=16384, capture_time=0.0,
+                 frames=None, replay=None, seed=0, trigger_phrase="== IT'S ALIVE =="):
+        self.delay = delay
+        self.noise = noise
+        self.temperature = temperature
+        self.samples = samples
+        self.capture_time = capture_time
+        self.frames = frames
+        self.replay = replay or []
+        self.seed = seed
+        self.trigger_phrase = trigger_phrase
+        self.recorded = [frame for file_path in self.replay for frame in recorded_frames(file_path, trigger_phrase)]
+        self.produced = 0
+
+    def frame_lines(self, index):
+        """Lines of frame number index."""
+        if self.recorded:
+            return self.recorded[index % len(self.recorded)]
+        upstream, downstream = synthetic_channels(self.delay, self.noise, self.samples,
+                                                  rng=np.random.default_rng((self.seed, index)))
+        return format_frame(upstream, downstream, self.temperature, self.trigger_phrase)
+
+    def __call__(self):
+        """Frame source for ShotPipeline: the next frame's lines, or None when the device is done."""
+        if self.frames is not None and self.produced >= self.frames:
+            return None
+        if self.capture_time:
+            time.sleep(self.capture_time)
+        lines = self.frame_lines(self.produced)
+        self.produced += 1
+        return lines
+
+    def run(self, out=sys.stdout):
+        """Write the banner and then every frame to out, the way nios2-terminal does."""
+        out.writelines(BANNER)
+        out.flush()
+        while True:
+            lines = self()
+            if lines is None:
+                return
+            out.writelines(lines)
+            out.flush()
+
+    def command(self):
+        """Command line that runs this device as a separate process."""
+        command = [sys.executable, __file__, "--delay", repr(self.delay), "--noise", repr(self.noise),
+                   "--temperature", repr(self.temperature), "--samples", str(self.samples),
+                   "--capture-time", repr(self.capture_time), "--seed", str(self.seed),
+                   "--trigger-phrase", self.trigger_phrase]
+        if self.frames is not None:
+            command += ["--frames", str(self.frames)]
+        for file_path in self.replay:
+            command += ["--replay", file_path]
+        return command
+
+    def popen(self, args, **kwargs):
+        """
+        Drop-in for subprocess.Popen as NiosSession's popen: starts this device
+        as a process whose stdout carries the terminal output. The shell path
+        in args and the nios2-download commands written to stdin are ignored.
+        """
+        return subprocess.Popen(self.command(), **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replay", action="append", default=[], help="recorded capture to replay (repeatable)")
+    parser.add_argument("--delay", type=float, default=2.2e-7, help="downstream delay in seconds")
+    parser.add_argument("--noise", type=float, default=25.0, help="noise standard deviation in ADC counts")
+    parser.add_argument("--temperature", type=float, default=98.712502, help="temperature in Fahrenheit")
+    parser.add_argument("--samples", type=int, default=16384, help="samples per channel")
+    parser.add_argument("--frames", type=int, default=None, help="frames to send; default runs until killed")
+    parser.add_argument("--capture-time", type=float, default=0.0, help="seconds per frame")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trigger-phrase", default="== IT'S ALIVE ==")
+    args = parser.parse_args()
+
+    device = SimulatedDevice(args.delay, args.noise, args.temperature, args.samples, args.capture_time,
+                             args.frames, args.replay, args.seed, args.trigger_phrase)
+    try:
+        device.run()
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+
+
+if __name__ == "__main__":
+    main()
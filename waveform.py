@@ -0,0 +1,97 @@
+"""
+One channel of a processed shot without pandas.
+
+process_capture_data used to return a DataFrame per channel with Voltage,
+Second and Voltage_Filtered columns, which cost several full copies per
+channel and then had to be unpacked again with .values and .iloc. A Waveform
+holds the raw voltages as a contiguous array in their own numeric dtype (a
+read-only int16 view onto a memory-mapped .cap file is kept as it is) and
+the filtered voltages as float64, plus the number of the first sample and
+the sampling rate; the time axis is computed when it is asked for instead
+of being stored.
+
+to_dataframe() still gives the old DataFrame for code that wants one, and
+pandas is only imported then.
+"""
+import numpy as np
+
+
+class Waveform:
+    """
+    Raw and filtered samples of one channel on a uniform sample grid.
+
+    Args:
+        voltage (ndarray): Raw samples. Integer and floating point arrays
+            keep their dtype; anything else becomes float64.
+        filtered (ndarray): Low-pass filtered samples of the same length;
+            voltage itself if None.
+        start (int): Sample number of voltage[0], counted from the trigger.
+        fs (float): Sampling rate in Hz.
+        time (ndarray): Explicit sample times in seconds. Only needed when the
+            sample numbers are not consecutive, see from_samples.
+    """
+
+    __slots__ = ("voltage", "filtered", "start", "fs", "_time")
+
+    def __init__(self, voltage, filtered=None, start=0, fs=50e6, time=None):
+        voltage = np.asarray(voltage)
+        if voltage.dtype.kind not in "iuf":
+            voltage = voltage.astype(np.float64)
+        self.voltage = np.ascontiguousarray(voltage)
+        self.filtered = self.voltage if filtered is None else np.ascontiguousarray(filtered, dtype=np.float64)
+        self.start = start
+        self.fs = fs
+        self._time = time
+
+    @classmethod
+    def from_samples(cls, samples, voltage, filtered=None, fs=50e6):
+        """
+        Waveform from the sample numbers and voltages of a parsed capture.
+        Consecutive sample numbers are reduced to the first one; any gap (a
+        line lost on the terminal) keeps the exact times instead.
+        """
+        samples = np.asarray(samples)
+        start = int(samples[0]) if len(samples) else 0
+        time = None
+        if len(samples) > 1 and (samples[-1] - samples[0] != len(samples) - 1 or np.any(np.diff(samples) != 1)):
+            time = samples / fs
+        return cls(voltage, filtered, start, fs, time)
+
+    @property
+    def t0(self):
+        """Time of the first sample in seconds."""
+        return self.start / self.fs if self._time is None or not len(self._time) else float(self._time[0])
+
+    @property
+    def regular(self):
+        """True when the samples are evenly spaced at 1 / fs."""
+        return self._time is None
+
+    @property
+    def time(self):
+        """Sample times in seconds, computed on every access."""
+        if self._time is not None:
+            return self._time
+        return (self.start + np.arange(len(self.voltage))) / self.fs
+
+    def time_at(self, index):
+        """Time in seconds of sample index (or an array of indices)."""
+        if self._time is not None:
+            return self._time[index]
+        return (self.start + index) / self.fs
+
+    def __len__(self):
+        return len(self.voltage)
+
+    def __repr__(self):
+        return f"Waveform({len(self)} samples from {self.t0:.9g} s at {self.fs:.6g} Hz)"
+
+    def to_dataframe(self):
+        """The channel as the DataFrame process_capture_data used to return."""
+        import pandas as pd
+        return pd.DataFrame({"Voltage": self.voltage, "Second": self.time, "Voltage_Filtered": self.filtered})
+
+
+def aligned(a, b):
+    """True when two waveforms are on the same regular grid, sample for sample."""
+    return a.regular and b.regular and a.fs == b.fs and a.start == b.start and len(a) == len(b)